@@ -0,0 +1,202 @@
+"""
+Traitement image par image des animations GIF, WebP, APNG et des TIFF multipages
+Les images sont décodées à la demande et filtrées par piles de quelques images :
+la mémoire de traitement reste proportionnelle à une pile, pas à l'animation.
+Les durées et les modes de disposition sont conservés.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+from PIL import Image, ImageSequence, TiffImagePlugin
+
+from image_processing import encoder_options, normalize_mode
+from cli import add_chain_arguments
+from filter_registry import with_last_param
+from filter_chain import compile_chain
+from instrumentation import tracer
+
+
+# Nombre d'images filtrées ensemble par défaut
+DEFAULT_BATCH_SIZE = 8
+
+# Formats de sortie acceptant plusieurs images, par extension
+ANIMATED_FORMATS = {'.gif': 'GIF', '.webp': 'WEBP', '.png': 'PNG', '.apng': 'PNG',
+                    '.tif': 'TIFF', '.tiff': 'TIFF'}
+
+
+def frame_count(path):
+    """Nombre d'images d'un fichier (1 pour une image fixe)"""
+    with Image.open(path) as image:
+        return getattr(image, 'n_frames', 1)
+
+
+def is_animated(path):
+    """Indique si le fichier contient plusieurs images"""
+    return frame_count(path) > 1
+
+
+def iter_frames(path):
+    """Itère paresseusement sur les images d'un fichier
+
+    Yields:
+        Tuples (pixels, info) : tableau uint8 en L, RGB ou RGBA et
+        dictionnaire {'duration': ms ou None, 'disposal': int ou None}
+    """
+    with Image.open(path) as image:
+        for index, frame in enumerate(ImageSequence.Iterator(image)):
+            with tracer.span('decode', frame=index) as span:
+                # Copie : l'image suivante réutilise le tampon de décodage
+                pixels = np.array(normalize_mode(frame))
+                span.set(bytes=pixels.nbytes, shape=list(pixels.shape))
+            disposal = getattr(frame, 'disposal_method', None)
+            if disposal is None:
+                disposal = frame.info.get('disposal')
+            yield pixels, {'duration': frame.info.get('duration'), 'disposal': disposal}
+
+
+def iter_batches(frames, batch_size=DEFAULT_BATCH_SIZE):
+    """Regroupe des images consécutives de même forme en piles
+
+    Yields:
+        Tuples (pile (N, H, W[, C]), liste des N dictionnaires info)
+    """
+    stack, infos = [], []
+    for pixels, info in frames:
+        if stack and (len(stack) >= batch_size or pixels.shape != stack[0].shape):
+            yield np.stack(stack), infos
+            stack, infos = [], []
+        stack.append(pixels)
+        infos.append(info)
+    if stack:
+        yield np.stack(stack), infos
+
+
+def process_frames(frames, steps, batch_size=DEFAULT_BATCH_SIZE):
+    """Applique une chaîne de filtres à un flux d'images
+
+    Args:
+        frames: Itérable de tuples (pixels, info), par exemple iter_frames()
+        steps: Chaîne de filtres, liste de tuples (nom, paramètre)
+        batch_size: Images filtrées ensemble (1 pour traiter image par image)
+
+    Yields:
+        Tuples (pixels, info) filtrés, dans l'ordre d'origine
+    """
+    chain = compile_chain(steps)
+    for stack, infos in iter_batches(frames, max(1, batch_size)):
+        with tracer.span('frames.process', frames=len(infos)) as span:
+            result = chain.run_stack(stack)
+            span.set(bytes=result.nbytes)
+        for pixels, info in zip(result, infos):
+            yield pixels, info
+
+
+def _to_images(frames, durations, disposals):
+    """Convertit les images filtrées en images PIL en notant leurs métadonnées"""
+    for pixels, info in frames:
+        image = Image.fromarray(pixels)
+        if info['duration'] is not None:
+            image.info['duration'] = info['duration']
+        durations.append(info['duration'] or 0)
+        disposals.append(info['disposal'] or 0)
+        yield image
+
+
+def save_frames(path, frames, fmt=None, loop=0, disposal=True, **save_options):
+    """Encode un flux d'images en fichier animé ou multipage
+
+    Le TIFF est écrit page par page. Le GIF est encodé au fil de l'eau, mais
+    l'encodeur de PIL conserve les images quantifiées pour fusionner les
+    doublons ; les encodeurs APNG et WebP ont besoin de toutes les images.
+
+    Args:
+        path: Fichier de sortie
+        frames: Itérable de tuples (pixels, info)
+        fmt: Format PIL (déduit de l'extension par défaut)
+        loop: Nombre de boucles (0 = infini) pour GIF, APNG et WebP
+        disposal: Conserve les modes de disposition (GIF et APNG)
+        save_options: Paramètres d'encodage supplémentaires
+
+    Returns:
+        Nombre d'images écrites
+    """
+    fmt = fmt or ANIMATED_FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Format multi-images non géré : {path}")
+    durations, disposals = [], []
+    images = _to_images(frames, durations, disposals)
+
+    if fmt == 'TIFF':
+        with tracer.span('encode', path=path, format=fmt):
+            with open(path, 'w+b') as f, TiffImagePlugin.AppendingTiffWriter(f) as tiff:
+                for image in images:
+                    image.save(tiff, format='TIFF', **save_options)
+                    tiff.newFrame()
+        return len(durations)
+
+    first = next(images, None)
+    if first is None:
+        raise ValueError("Aucune image à écrire")
+    # Pour le GIF, les listes se remplissent au fur et à mesure que
+    # l'encodeur consomme le générateur : l'entrée k existe quand il la lit
+    rest = images if fmt == 'GIF' else list(images)
+    options = dict(save_options, duration=durations)
+    if disposal and fmt != 'WEBP':
+        options['disposal'] = disposals
+    with tracer.span('encode', path=path, format=fmt):
+        first.save(path, format=fmt, save_all=True, append_images=rest, loop=loop, **options)
+    return len(durations)
+
+
+def process_animation(input_path, output_path, steps, batch_size=DEFAULT_BATCH_SIZE,
+                      **save_options):
+    """Applique une chaîne de filtres à toutes les images d'un fichier
+
+    Args:
+        input_path: GIF, WebP ou APNG animé, ou TIFF multipage
+        output_path: Fichier de sortie multi-images (voir ANIMATED_FORMATS)
+        steps: Chaîne de filtres, liste de tuples (nom, paramètre)
+        batch_size: Images filtrées ensemble
+        save_options: Paramètres d'encodage supplémentaires
+
+    Returns:
+        Nombre d'images traitées
+    """
+    with Image.open(input_path) as image:
+        loop = image.info.get('loop', 0)
+        source_format = image.format
+    output_format = ANIMATED_FORMATS.get(os.path.splitext(output_path)[1].lower())
+    # Les codes de disposition GIF et APNG ne sont pas les mêmes
+    disposal = source_format == output_format
+    frames = process_frames(iter_frames(input_path), steps, batch_size)
+    return save_frames(output_path, frames, output_format, loop, disposal, **save_options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Traitement d\'images animées ou multipages')
+    parser.add_argument('input', help='GIF/WebP/APNG animé ou TIFF multipage')
+    parser.add_argument('output', help='Fichier de sortie (.gif, .webp, .png, .tif)')
+    add_chain_arguments(parser, geometry=False)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Images filtrées ensemble (défaut: {DEFAULT_BATCH_SIZE})')
+
+    args = parser.parse_args()
+    try:
+        steps = with_last_param(args.filter, args.param)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not os.path.exists(args.input):
+        print(f"Erreur: Le fichier {args.input} n'existe pas")
+        sys.exit(1)
+
+    save_options = encoder_options(args.output, args.compress_level, args.quality, args.optimize)
+    count = process_animation(args.input, args.output, steps, args.batch_size, **save_options)
+    print(f"{count} images traitées, sauvegardées dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,513 @@
+"""
+Traitement par lots d'images avec un pool de processus
+Applique une chaîne de filtres à des répertoires ou motifs glob entiers
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from PIL import Image
+
+from image_processing import (encoder_options, image_size, is_array_path, load_array,
+                              normalize_mode, output_image, save_output)
+from cli import add_chain_arguments
+from filter_registry import PRECISIONS, with_last_param
+from filter_chain import decode_source, render_source
+from pipeline import Pipeline
+from planner import apply_plan
+from tensor_batch import TensorBatchProcessor
+from result_cache import ResultCache, process_with_cache
+from instrumentation import tracer, image_attrs, TRACE_FORMATS
+
+
+# Extensions reconnues lors du parcours d'un répertoire
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+
+def _glob_root(pattern):
+    """Répertoire fixe d'un motif glob : ses composants précédant le premier joker"""
+    parts = []
+    for part in os.path.dirname(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts)
+
+
+def collect_inputs(sources, output_dir, recursive=False):
+    """Construit la liste des couples (entrée, sortie) à traiter
+
+    Les fichiers trouvés dans un répertoire conservent leur chemin relatif
+    sous le répertoire de sortie, ceux d'un motif glob leur chemin relatif à
+    la partie fixe du motif (``scans/**/*.png`` : relatif à ``scans``) ; un
+    fichier nommé explicitement est écrit directement dans le répertoire de
+    sortie.
+
+    Args:
+        sources: Répertoires, motifs glob ou fichiers d'entrée
+        output_dir: Répertoire de sortie
+        recursive: Parcourt les sous-répertoires si True
+
+    Returns:
+        Liste de tuples (chemin_entree, chemin_sortie) sans doublons
+
+    Raises:
+        ValueError: si deux entrées produiraient le même fichier de sortie
+    """
+    tasks = []
+    seen = set()
+    outputs = {}
+
+    def add(path, relative):
+        path = os.path.abspath(path)
+        if path in seen:
+            return
+        seen.add(path)
+        output_path = os.path.join(output_dir, relative)
+        key = os.path.normcase(os.path.abspath(output_path))
+        if key in outputs:
+            raise ValueError(f"{outputs[key]} et {path} produiraient le même fichier de "
+                             f"sortie {output_path}")
+        outputs[key] = path
+        tasks.append((path, output_path))
+
+    for source in sources:
+        if os.path.isdir(source):
+            for dirpath, dirnames, filenames in os.walk(source):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        path = os.path.join(dirpath, name)
+                        add(path, os.path.relpath(path, source))
+                if not recursive:
+                    break
+        else:
+            root = _glob_root(source)
+            matches = sorted(glob.glob(source, recursive=recursive))
+            for path in matches:
+                if os.path.isfile(path):
+                    add(path, os.path.relpath(path, root or os.curdir))
+    return tasks
+
+
+def _new_outcome(input_path, output_path):
+    return {'input': input_path, 'output': output_path, 'ok': False,
+            'error': None, 'pixels': 0, 'seconds': 0.0, 'cached': None}
+
+
+def process_file(input_path, output_path, steps, precision='float64', cache=None, trace=False,
+                 encoder=None, geometry=None):
+    """Traite un fichier dans un processus de travail
+
+    Toute exception est capturée pour qu'un fichier défectueux n'interrompe
+    pas le lot. Si un cache est fourni, un résultat déjà calculé est recopié
+    sans décoder l'image. Avec trace=True, les événements de trace du
+    processus de travail sont renvoyés avec le résultat. encoder contient les
+    arguments d'encoder_options (compress_level, quality, optimize), geometry
+    ceux d'apply_plan (crop, size, resample).
+
+    Returns:
+        Dictionnaire décrivant le résultat (succès, erreur, pixels, durée)
+    """
+    if trace:
+        tracer.enable()
+    start = time.perf_counter()
+    outcome = _new_outcome(input_path, output_path)
+    try:
+        width, height = image_size(input_path)
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        options = {'precision': precision}
+        if geometry:
+            options['geometry'] = geometry
+        hit = process_with_cache(cache, input_path, output_path, steps,
+                                 lambda: apply_plan(input_path, steps, precision,
+                                                    **(geometry or {})),
+                                 encoder_options(output_path, **(encoder or {})),
+                                 **options)
+        if cache is not None:
+            outcome['cached'] = hit
+        outcome['pixels'] = width * height
+        outcome['ok'] = True
+    except Exception as e:
+        outcome['error'] = f"{type(e).__name__}: {e}"
+    outcome['seconds'] = time.perf_counter() - start
+    if trace:
+        outcome['trace'] = tracer.drain()
+    return outcome
+
+
+class BatchSummary:
+    """Statistiques cumulées d'un traitement par lots"""
+
+    def __init__(self):
+        self.processed = 0
+        self.failures = []
+        self.pixels = 0
+        self.elapsed = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Temps cumulé par étape en mode pipeline (secondes)
+        self.stage_seconds = {}
+
+    def add(self, outcome):
+        """Enregistre le résultat d'un fichier"""
+        if outcome['ok']:
+            self.processed += 1
+            self.pixels += outcome['pixels']
+        else:
+            self.failures.append((outcome['input'], outcome['error']))
+        if outcome['cached'] is True:
+            self.cache_hits += 1
+        elif outcome['cached'] is False:
+            self.cache_misses += 1
+
+    @property
+    def images_per_second(self):
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def megapixels_per_second(self):
+        return self.pixels / 1e6 / self.elapsed if self.elapsed > 0 else 0.0
+
+    def report(self):
+        """Retourne le résumé sous forme de texte"""
+        lines = [
+            f"Images traitées : {self.processed}",
+            f"Échecs          : {len(self.failures)}",
+            f"Durée totale    : {self.elapsed:.2f} s",
+            f"Débit           : {self.images_per_second:.2f} images/s, "
+            f"{self.megapixels_per_second:.2f} MP/s",
+        ]
+        if self.cache_hits or self.cache_misses:
+            rate = self.cache_hits / (self.cache_hits + self.cache_misses)
+            lines.append(f"Cache           : {self.cache_hits} succès, "
+                         f"{self.cache_misses} échecs ({rate:.0%})")
+        if self.stage_seconds:
+            stages = ", ".join(f"{name} {seconds:.2f} s"
+                               for name, seconds in self.stage_seconds.items())
+            lines.append(f"Étapes          : {stages}")
+        for path, error in self.failures:
+            lines.append(f"  ✗ {path} : {error}")
+        return "\n".join(lines)
+
+
+def run_batch(tasks, steps, workers=None, max_in_flight=None, on_result=None,
+              precision='float64', cache=None, trace=False, encoder=None, geometry=None):
+    """Répartit les tâches sur un pool de processus
+
+    Le nombre de tâches soumises simultanément est borné afin que la
+    mémoire reste constante, quelle que soit la taille du lot.
+
+    Args:
+        tasks: Liste de tuples (chemin_entree, chemin_sortie)
+        steps: Chaîne de filtres, liste de tuples (nom, paramètre)
+        workers: Nombre de processus (par défaut le nombre de cœurs)
+        max_in_flight: Tâches en cours au maximum (par défaut 2 par processus)
+        on_result: Fonction appelée avec chaque résultat
+        precision: Précision de calcul d'ImageProcessor
+        cache: ResultCache partagé par les processus (optionnel)
+        trace: Collecte les traces des processus dans le traceur global
+        encoder: Paramètres d'encodage (voir image_processing.encoder_options)
+        geometry: Recadrage et redimensionnement (voir planner.apply_plan)
+
+    Returns:
+        Un objet BatchSummary
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+    summary = BatchSummary()
+    start = time.perf_counter()
+
+    pending = set()
+    task_iter = iter(tasks)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            # Remplit la file jusqu'à la limite
+            for input_path, output_path in task_iter:
+                pending.add(executor.submit(process_file, input_path, output_path,
+                                            steps, precision, cache, trace, encoder,
+                                            geometry))
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome = future.result()
+                tracer.extend(outcome.pop('trace', []))
+                summary.add(outcome)
+                if on_result:
+                    on_result(outcome)
+
+    summary.elapsed = time.perf_counter() - start
+    return summary
+
+
+def run_pipeline_batch(tasks, steps, decode_workers=None, process_workers=None,
+                       encode_workers=None, queue_size=None, on_result=None,
+                       precision='float64', cache=None, encoder=None):
+    """Traite un lot dans un pipeline décodage / traitement / encodage
+
+    Contrairement à run_batch, chaque étape dispose de ses propres threads et
+    les étapes se recouvrent : le débit est limité par l'étape la plus lente
+    et non par la somme des trois. Les erreurs sont capturées par fichier.
+
+    Args:
+        tasks: Liste de tuples (chemin_entree, chemin_sortie)
+        steps: Chaîne de filtres, liste de tuples (nom, paramètre)
+        decode_workers: Threads de décodage (par défaut le nombre de cœurs)
+        process_workers: Threads de traitement (par défaut le nombre de cœurs)
+        encode_workers: Threads d'encodage (par défaut le nombre de cœurs)
+        queue_size: Images en attente entre deux étapes (par défaut 2 par cœur)
+        on_result: Fonction appelée avec chaque résultat
+        precision: Précision de calcul d'ImageProcessor
+        cache: ResultCache (optionnel) ; un succès court-circuite le pipeline
+        encoder: Paramètres d'encodage (voir image_processing.encoder_options)
+
+    Returns:
+        Un objet BatchSummary dont l'attribut stage_seconds donne le temps
+        cumulé de chaque étape
+    """
+    cores = os.cpu_count() or 1
+    encoder = encoder or {}
+
+    def decode(task):
+        input_path, output_path = task
+        job = {'outcome': _new_outcome(input_path, output_path), 'start': time.perf_counter()}
+        outcome = job['outcome']
+        try:
+            save_options = encoder_options(output_path, **encoder)
+            job['save_options'] = save_options
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+            if cache is not None:
+                options = {'precision': precision}
+                if save_options:
+                    options['encoder'] = save_options
+                with tracer.span('cache.fetch') as span:
+                    job['key'] = cache.key(input_path, steps, output_path, **options)
+                    hit = cache.fetch(job['key'], output_path)
+                    span.set(hit=hit)
+                outcome['cached'] = hit
+                if hit:
+                    width, height = image_size(input_path)
+                    outcome['pixels'] = width * height
+                    outcome['ok'] = True
+                    return job
+            source = decode_source(input_path, steps, precision)
+            job['source'] = source
+        except Exception as e:
+            outcome['error'] = f"{type(e).__name__}: {e}"
+        return job
+
+    def process(job):
+        source = job.pop('source', None)
+        if source is not None:
+            try:
+                job['image'] = output_image(render_source(source, steps),
+                                            job['outcome']['output'])
+            except Exception as e:
+                job['outcome']['error'] = f"{type(e).__name__}: {e}"
+        return job
+
+    def encode(job):
+        outcome = job['outcome']
+        image = job.pop('image', None)
+        if image is not None:
+            try:
+                with tracer.span('encode', path=outcome['output'], **image_attrs(image)):
+                    save_output(image, outcome['output'], **job['save_options'])
+                if cache is not None:
+                    with tracer.span('cache.store'):
+                        cache.store(job['key'], outcome['output'])
+                outcome['pixels'] = image.width * image.height
+                outcome['ok'] = True
+            except Exception as e:
+                outcome['error'] = f"{type(e).__name__}: {e}"
+        outcome['seconds'] = time.perf_counter() - job['start']
+        return outcome
+
+    pipeline = Pipeline([
+        ('decode', decode, decode_workers or cores),
+        ('process', process, process_workers or cores),
+        ('encode', encode, encode_workers or cores),
+    ], queue_size or 2 * cores)
+
+    summary = BatchSummary()
+    start = time.perf_counter()
+
+    def collect(outcome):
+        summary.add(outcome)
+        if on_result:
+            on_result(outcome)
+
+    pipeline.run(tasks, collect)
+    summary.elapsed = time.perf_counter() - start
+    summary.stage_seconds = dict(pipeline.busy)
+    return summary
+
+
+def run_tensor_batch(tasks, steps, batch_size, on_result=None, encoder=None):
+    """Traite un lot de petites images par piles vectorisées
+
+    Les images décodées sont regroupées par taille ; chaque pile de
+    batch_size images est filtrée en un seul appel (voir tensor_batch). Les
+    calculs se font en uint8, comme en précision native.
+
+    Args:
+        tasks: Liste de tuples (chemin_entree, chemin_sortie)
+        steps: Chaîne de filtres, liste de tuples (nom, paramètre)
+        batch_size: Nombre maximal d'images par pile
+        on_result: Fonction appelée avec chaque résultat
+        encoder: Paramètres d'encodage (voir image_processing.encoder_options)
+
+    Returns:
+        Un objet BatchSummary
+    """
+    processor = TensorBatchProcessor(steps, batch_size)
+    encoder = encoder or {}
+    summary = BatchSummary()
+    start = time.perf_counter()
+    outcomes = {}
+
+    def report(outcome):
+        outcome['seconds'] = time.perf_counter() - outcome.pop('start')
+        summary.add(outcome)
+        if on_result:
+            on_result(outcome)
+
+    def decoded():
+        for index, (input_path, output_path) in enumerate(tasks):
+            outcome = _new_outcome(input_path, output_path)
+            outcome['start'] = time.perf_counter()
+            try:
+                if is_array_path(input_path):
+                    pixels = load_array(input_path)
+                else:
+                    with Image.open(input_path) as image:
+                        pixels = np.asarray(normalize_mode(image))
+            except Exception as e:
+                outcome['error'] = f"{type(e).__name__}: {e}"
+                report(outcome)
+                continue
+            outcomes[index] = outcome
+            yield index, pixels
+
+    for index, pixels in processor.process_stream(decoded()):
+        outcome = outcomes.pop(index)
+        output_path = outcome['output']
+        try:
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+            image = Image.fromarray(pixels)
+            with tracer.span('encode', path=output_path, **image_attrs(image)):
+                save_output(image, output_path, **encoder_options(output_path, **encoder))
+            outcome['pixels'] = image.width * image.height
+            outcome['ok'] = True
+        except Exception as e:
+            outcome['error'] = f"{type(e).__name__}: {e}"
+        report(outcome)
+
+    summary.elapsed = time.perf_counter() - start
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Traitement d\'images par lots')
+    parser.add_argument('inputs', nargs='+',
+                        help='Répertoires, motifs glob ou fichiers d\'entrée')
+    parser.add_argument('-o', '--output-dir', required=True, help='Répertoire de sortie')
+    add_chain_arguments(parser)
+    parser.add_argument('--precision', choices=PRECISIONS, default='float64',
+                        help='Précision de calcul : float64 (historique) ou native (uint8)')
+    parser.add_argument('--workers', type=int,
+                        help='Nombre de processus, ou de threads de traitement en mode '
+                             '--pipeline (défaut: nombre de cœurs)')
+    parser.add_argument('--max-in-flight', type=int,
+                        help='Nombre maximal de fichiers en cours, ou en attente entre deux '
+                             'étapes en mode --pipeline (défaut: 2 par cœur)')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='Parcourt les sous-répertoires')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Recouvre décodage, traitement et encodage dans des threads '
+                             'distincts plutôt que de traiter chaque image d\'un bloc')
+    parser.add_argument('--decode-workers', type=int,
+                        help='Threads de décodage en mode --pipeline (défaut: nombre de cœurs)')
+    parser.add_argument('--encode-workers', type=int,
+                        help='Threads d\'encodage en mode --pipeline (défaut: nombre de cœurs)')
+    parser.add_argument('--stack', type=int, metavar='N',
+                        help='Filtre les images de même taille par piles de N en un seul '
+                             'appel vectorisé (vignettes, sprites)')
+    parser.add_argument('--cache-dir',
+                        help='Répertoire du cache de résultats (désactivé par défaut)')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='Taille maximale du cache, en Mo (défaut: 1024)')
+    parser.add_argument('--cache-link', action='store_true',
+                        help='Sert les résultats du cache par lien physique plutôt que par copie')
+    parser.add_argument('--trace', metavar='FICHIER',
+                        help='Enregistre la durée de chaque étape dans un fichier de trace')
+    parser.add_argument('--trace-format', choices=TRACE_FORMATS, default='jsonl',
+                        help='Format de la trace : jsonl ou chrome (défaut: jsonl)')
+
+    args = parser.parse_args()
+    try:
+        steps = with_last_param(args.filter, args.param)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Les piles et les chaînes de plusieurs filtres sont compilées, en uint8
+    if args.precision != 'float64' and (args.stack or len(steps) > 1):
+        parser.error("--precision ne s'applique qu'à un filtre seul, sans --stack")
+    if args.stack and (args.pipeline or args.cache_dir):
+        parser.error("--stack ne peut pas être combiné à --pipeline ou --cache-dir")
+    if (args.crop or args.resize) and (args.pipeline or args.stack):
+        parser.error("--crop et --resize ne peuvent pas être combinés à --pipeline ou --stack")
+
+    try:
+        tasks = collect_inputs(args.inputs, args.output_dir, args.recursive)
+    except ValueError as e:
+        print(f"Erreur: {e}")
+        sys.exit(1)
+    if not tasks:
+        print("Erreur: Aucune image trouvée")
+        sys.exit(1)
+
+    def show(outcome):
+        status = "✓" if outcome['ok'] else "✗"
+        print(f"{status} {outcome['input']}")
+
+    cache = None
+    if args.cache_dir:
+        cache = ResultCache(args.cache_dir, args.cache_size * 2**20, args.cache_link)
+
+    encoder = {'compress_level': args.compress_level, 'quality': args.quality,
+               'optimize': args.optimize}
+    geometry = None
+    if args.crop or args.resize:
+        geometry = {'crop': args.crop, 'size': args.resize, 'resample': args.resample}
+        if args.fast_resize:
+            geometry['fast_resize'] = True
+    if args.trace and (args.pipeline or args.stack):
+        tracer.enable()
+    if args.stack:
+        summary = run_tensor_batch(tasks, steps, args.stack, on_result=show, encoder=encoder)
+    elif args.pipeline:
+        summary = run_pipeline_batch(tasks, steps, args.decode_workers, args.workers,
+                                     args.encode_workers, args.max_in_flight, on_result=show,
+                                     precision=args.precision, cache=cache, encoder=encoder)
+    else:
+        summary = run_batch(tasks, steps, args.workers, args.max_in_flight, on_result=show,
+                            precision=args.precision, cache=cache, trace=bool(args.trace),
+                            encoder=encoder, geometry=geometry)
+    print(summary.report())
+    if args.trace:
+        tracer.export(args.trace, args.trace_format)
+    if summary.failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""
+Banc d'essai des filtres d'ImageProcessor et des chaînes compilées
+Mesure le décodage, le traitement et l'encodage sur des images synthétiques
+et compare les résultats à une référence enregistrée.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from image_processing import ImageProcessor, apply_filter
+from filter_registry import FILTER_CHOICES, PRECISIONS
+from filter_chain import compile_chain
+
+
+# Chaînes représentatives (nom, étapes)
+BENCH_CHAINS = {
+    'chain-pointwise': ['negative', ('contrast', 1.5), ('posterization', 4)],
+    'chain-color': ['sepia', ('desaturation', 0.5), 'bw'],
+    'chain-mixed': ['mirror-h', ('contrast', 1.2), 'sepia', ('threshold', 100)],
+}
+
+MODES = ('L', 'RGB', 'RGBA')
+
+# Seuil de régression par défaut (fraction)
+DEFAULT_TOLERANCE = 0.10
+
+
+def synthetic_image(megapixels, mode, seed=0):
+    """Génère une image synthétique (dégradé + bruit) d'environ N mégapixels"""
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = int(round(megapixels * 1e6 / width))
+    rng = np.random.default_rng(seed)
+    channels = len(mode)
+    ramp = np.linspace(0, 200, width, dtype=np.float32)
+    pixels = np.empty((height, width, channels), dtype=np.uint8)
+    for c in range(channels):
+        noise = rng.integers(0, 56, size=(height, width), dtype=np.uint8)
+        pixels[:, :, c] = ramp[np.newaxis, :] * (0.5 + 0.5 * c / channels)
+        pixels[:, :, c] += noise
+    if channels == 1:
+        pixels = pixels[:, :, 0]
+    return Image.fromarray(pixels, mode)
+
+
+def _measure(function, repeat):
+    """Retourne le meilleur temps sur `repeat` exécutions et le dernier résultat"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _peak_memory(function):
+    """Pic d'allocation Python/NumPy (octets) pendant l'appel, via tracemalloc"""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer
+
+
+def bench_case(path, name, steps, precision, megapixels, repeat, fmt):
+    """Mesure un filtre ou une chaîne sur un fichier source
+
+    Returns:
+        Dictionnaire de résultats (temps par étape, MP/s, pic mémoire)
+    """
+    if name in FILTER_CHOICES:
+        def decode():
+            return ImageProcessor(path, precision)
+
+        def process(processor):
+            return apply_filter(processor, name, None)
+    else:
+        chain = compile_chain(steps)
+
+        def decode():
+            with Image.open(path) as image:
+                return np.asarray(image)
+
+        def process(pixels):
+            return Image.fromarray(chain.run(pixels))
+
+    decode_s, decoded = _measure(decode, repeat)
+    process_s, result = _measure(lambda: process(decoded), repeat)
+    encode_s, _ = _measure(lambda: _encode(result, fmt), repeat)
+    del decoded, result
+    peak = _peak_memory(lambda: _encode(process(decode()), fmt))
+    return {
+        'decode_s': decode_s,
+        'process_s': process_s,
+        'encode_s': encode_s,
+        'total_s': decode_s + process_s + encode_s,
+        'mp_per_s': megapixels / process_s if process_s > 0 else None,
+        'peak_bytes': peak,
+    }
+
+
+def run_suite(sizes, modes, precisions, names, repeat=3, fmt='PNG', on_result=None):
+    """Exécute le banc d'essai complet
+
+    Args:
+        sizes: Tailles d'image en mégapixels
+        modes: Modes PIL (L, RGB, RGBA)
+        precisions: Précisions d'ImageProcessor (les chaînes compilées sont en uint8)
+        names: Filtres (noms CLI) et chaînes (clés de BENCH_CHAINS) à mesurer
+        repeat: Nombre de répétitions (le meilleur temps est retenu)
+        fmt: Format du fichier source et de l'encodage
+        on_result: Fonction appelée avec chaque résultat
+
+    Returns:
+        Liste de résultats
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for megapixels in sizes:
+            for mode in modes:
+                path = os.path.join(tmp, f'bench_{megapixels}_{mode}.{fmt.lower()}')
+                synthetic_image(megapixels, mode).save(path, format=fmt)
+                for name in names:
+                    # Les chaînes compilées travaillent toujours en uint8
+                    case_precisions = precisions if name in FILTER_CHOICES else ['native']
+                    for precision in case_precisions:
+                        entry = {'name': name, 'megapixels': megapixels, 'mode': mode,
+                                 'precision': precision}
+                        try:
+                            entry.update(bench_case(path, name, BENCH_CHAINS.get(name),
+                                                    precision, megapixels, repeat, fmt))
+                        except Exception as e:
+                            entry['error'] = f"{type(e).__name__}: {e}"
+                        results.append(entry)
+                        if on_result:
+                            on_result(entry)
+    return results
+
+
+def _case_key(entry):
+    return (entry['name'], entry['megapixels'], entry['mode'], entry['precision'])
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compare des résultats à une référence
+
+    Returns:
+        Liste de régressions (clé, métrique, référence, valeur)
+    """
+    reference = {_case_key(entry): entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        base = reference.get(_case_key(entry))
+        if not base or 'error' in entry or 'error' in base:
+            continue
+        for metric in ('decode_s', 'process_s', 'encode_s', 'peak_bytes'):
+            if entry[metric] > base[metric] * (1 + tolerance):
+                regressions.append((_case_key(entry), metric, base[metric], entry[metric]))
+    return regressions
+
+
+def format_result(entry):
+    label = (f"{entry['name']:<16} {entry['megapixels']:>6g} MP {entry['mode']:<4} "
+             f"{entry['precision']:<7}")
+    if 'error' in entry:
+        return f"{label} erreur : {entry['error']}"
+    return (f"{label} décodage {entry['decode_s'] * 1000:8.1f} ms  "
+            f"traitement {entry['process_s'] * 1000:8.1f} ms  "
+            f"encodage {entry['encode_s'] * 1000:8.1f} ms  "
+            f"{entry['mp_per_s']:8.1f} MP/s  pic {entry['peak_bytes'] / 2**20:8.1f} Mo")
+
+
+def main():
+    all_names = list(FILTER_CHOICES) + list(BENCH_CHAINS)
+    parser = argparse.ArgumentParser(description='Banc d\'essai des filtres')
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 10],
+                        help='Tailles en mégapixels (défaut: 1 10 ; jusqu\'à 100 pour les '
+                             'gros volumes)')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES),
+                        help='Modes d\'image (défaut: L RGB RGBA)')
+    parser.add_argument('--precisions', nargs='+', choices=PRECISIONS, default=list(PRECISIONS),
+                        help='Précisions d\'ImageProcessor (défaut: toutes)')
+    parser.add_argument('--filters', nargs='+', choices=all_names, default=all_names,
+                        help='Filtres et chaînes à mesurer (défaut: tous)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Répétitions par mesure, le meilleur temps est retenu (défaut: 3)')
+    parser.add_argument('--format', default='PNG', choices=['PNG', 'BMP', 'TIFF', 'JPEG'],
+                        help='Format de l\'image source et de l\'encodage (défaut: PNG)')
+    parser.add_argument('--output', help='Fichier JSON où enregistrer les résultats')
+    parser.add_argument('--compare', metavar='REFERENCE',
+                        help='Fichier JSON de référence ; signale les régressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Dégradation tolérée avant de signaler une régression '
+                             '(défaut: 0.10)')
+
+    args = parser.parse_args()
+
+    modes = args.modes
+    if args.format == 'JPEG':
+        modes = [mode for mode in modes if mode != 'RGBA']
+
+    results = run_suite(args.sizes, modes, args.precisions, args.filters,
+                        args.repeat, args.format,
+                        on_result=lambda entry: print(format_result(entry), flush=True))
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pillow': Image.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'format': args.format,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Résultats enregistrés dans {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for key, metric, before, after in regressions:
+            name = ' '.join(map(str, key))
+            print(f"⚠ Régression {name} {metric} : {before:.4g} → {after:.4g}")
+        if regressions:
+            sys.exit(1)
+        print("Aucune régression")
+
+
+if __name__ == '__main__':
+    main()
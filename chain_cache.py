@@ -0,0 +1,130 @@
+"""
+Cache de réévaluation incrémentale d'une chaîne de filtres
+Le résultat de chaque préfixe de la chaîne est mémoïsé : modifier le filtre
+en position k ne recalcule que les filtres k et suivants.
+"""
+
+import time
+from collections import OrderedDict
+
+from filter_chain import compile_chain, normalize_chain
+from instrumentation import tracer
+
+
+# Budget mémoire par défaut du cache (octets)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Nombre d'histogrammes de préfixes conservés
+MAX_HISTOGRAMS = 64
+
+
+class ChainCache:
+    """Mémoïsation LRU des préfixes d'une chaîne appliquée à une image de base
+
+    Les clés sont les préfixes normalisés de la chaîne (filtre et paramètres) ;
+    les entrées les moins récemment utilisées sont évincées au-delà du budget.
+    Les tableaux stockés sont en lecture seule et ne doivent pas être modifiés.
+    """
+
+    def __init__(self, base, max_bytes=DEFAULT_MAX_BYTES):
+        """Initialise le cache
+
+        Args:
+            base: Tableau uint8 de l'image décodée, conservé en mémoire
+            max_bytes: Budget mémoire des résultats intermédiaires
+        """
+        self.base = base
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Histogrammes des préfixes, pour les filtres à statistiques (contraste...) :
+        # déplacer un curseur ne recalcule que la table, pas l'histogramme
+        self._histograms = OrderedDict()
+        # Coût de chaque filtre lors de la dernière évaluation :
+        # liste de (nom, secondes), secondes valant None si le résultat était mémoïsé
+        self.last_timings = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        pixels = self._entries.get(key)
+        if pixels is not None:
+            self._entries.move_to_end(key)
+        return pixels
+
+    def _store(self, key, pixels):
+        if pixels.nbytes > self.max_bytes:
+            return
+        pixels.flags.writeable = False
+        self._entries[key] = pixels
+        self.bytes += pixels.nbytes
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.nbytes
+
+    def _prefix_histograms(self, prefix, pixels, kernel):
+        """Statistiques du résultat d'un préfixe pour un noyau, mémoïsées
+
+        Histogrammes (C, 256) par canal pour une table, de la luminance pour
+        un seuillage : la clé comprend le type du noyau.
+        """
+        key = (prefix, type(kernel).__name__)
+        hist = self._histograms.get(key)
+        if hist is None:
+            hist = kernel.histograms(pixels)
+            self._histograms[key] = hist
+            if len(self._histograms) > MAX_HISTOGRAMS:
+                self._histograms.popitem(last=False)
+        else:
+            self._histograms.move_to_end(key)
+        return hist
+
+    def evaluate(self, steps):
+        """Évalue une chaîne en repartant du plus long préfixe mémoïsé
+
+        Args:
+            steps: Séquence de noms ou de tuples (nom, paramètre)
+
+        Returns:
+            Tableau uint8 résultant (en lecture seule)
+        """
+        steps = tuple(normalize_chain(steps))
+
+        # Plus long préfixe déjà calculé
+        start = len(steps)
+        pixels = None
+        while start > 0:
+            pixels = self._lookup(steps[:start])
+            if pixels is not None:
+                break
+            start -= 1
+        if start > 0:
+            self.hits += 1
+        else:
+            pixels = self.base
+        if start < len(steps):
+            self.misses += 1
+
+        self.last_timings = [(name, None) for name, _ in steps[:start]]
+        for index in range(start, len(steps)):
+            name = steps[index][0]
+            begin = time.perf_counter()
+            with tracer.span(f'step.{name}', position=index) as span:
+                chain = compile_chain([steps[index]])
+                hist = None
+                if chain.kernels and chain.kernels[0].needs_stats:
+                    hist = self._prefix_histograms(steps[:index], pixels, chain.kernels[0])
+                pixels = chain.run(pixels, hist)
+                span.set(bytes=pixels.nbytes)
+            self.last_timings.append((name, time.perf_counter() - begin))
+            self._store(steps[:index + 1], pixels)
+        return pixels
+
+    def clear(self):
+        """Vide le cache (l'image de base est conservée)"""
+        self._entries.clear()
+        self._histograms.clear()
+        self.bytes = 0
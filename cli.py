@@ -0,0 +1,198 @@
+"""
+Ligne de commande de image_processing.py
+Les arguments sont analysés avant tout import lourd : lancé directement
+(python cli.py), l'aide, la liste des filtres et les erreurs d'arguments ne
+chargent ni NumPy ni PIL. Ce module définit aussi les types d'arguments
+partagés par les autres outils.
+"""
+
+import argparse
+import os
+
+from filter_registry import (FILTER_CHOICES, PRECISIONS, describe_filters, parse_filter_spec,
+                             with_last_param)
+from instrumentation import tracer, TRACE_FORMATS
+
+
+# Filtres de rééchantillonnage proposés par --resample (voir planner.RESAMPLE_FILTERS)
+RESAMPLE_CHOICES = ('nearest', 'box', 'bilinear', 'bicubic', 'lanczos')
+
+
+def parse_size(text):
+    """Analyse une taille de la forme ``LxH``, ``Lx`` ou ``xH``
+
+    Un côté omis est déduit en conservant les proportions.
+
+    Returns:
+        Tuple (largeur, hauteur), un côté pouvant valoir None
+    """
+    width, sep, height = text.lower().partition('x')
+    try:
+        size = tuple(int(value) if value else None for value in (width, height))
+    except ValueError:
+        size = None
+    if not sep or size is None or size == (None, None) or any(v is not None and v < 1
+                                                              for v in size):
+        raise argparse.ArgumentTypeError(f"taille invalide : {text} (attendu LxH, Lx ou xH)")
+    return size
+
+
+def parse_box(text):
+    """Analyse une zone de recadrage de la forme ``x,y,largeur,hauteur``
+
+    Returns:
+        Tuple (x, y, largeur, hauteur)
+    """
+    try:
+        box = tuple(int(value) for value in text.split(','))
+    except ValueError:
+        box = ()
+    if len(box) != 4 or box[0] < 0 or box[1] < 0 or box[2] < 1 or box[3] < 1:
+        raise argparse.ArgumentTypeError(
+            f"zone invalide : {text} (attendu x,y,largeur,hauteur)")
+    return box
+
+
+class _ListFilters(argparse.Action):
+    """Option --list-filters : affiche le registre des filtres et quitte"""
+
+    def __init__(self, option_strings, dest, **kwargs):
+        super().__init__(option_strings, dest, nargs=0, default=argparse.SUPPRESS, **kwargs)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        print(describe_filters())
+        parser.exit()
+
+
+def add_chain_arguments(parser, geometry=True, encoder=True):
+    """Ajoute les options de chaîne de filtres partagées par les outils
+
+    Args:
+        parser: ArgumentParser à compléter
+        geometry: Ajoute aussi --crop, --resize, --resample et --fast-resize
+        encoder: Ajoute aussi --compress-level, --quality et --optimize
+    """
+    parser.add_argument('--filter', required=True, action='append', type=parse_filter_spec,
+                        metavar='FILTRE[=PARAM]',
+                        help='Filtre à appliquer, répétable pour chaîner plusieurs filtres '
+                             f'({", ".join(FILTER_CHOICES)})')
+    parser.add_argument('--param', type=float,
+                        help='Paramètre du dernier filtre (si applicable)')
+    if geometry:
+        parser.add_argument('--crop', type=parse_box, metavar='X,Y,L,H',
+                            help='Zone à conserver après les filtres (x, y, largeur, hauteur)')
+        parser.add_argument('--resize', type=parse_size, metavar='LxH',
+                            help='Taille de sortie après les filtres et le recadrage '
+                                 '(LxH, Lx ou xH pour conserver les proportions)')
+        parser.add_argument('--resample', choices=RESAMPLE_CHOICES, default='bicubic',
+                            help='Filtre de redimensionnement (défaut: bicubic)')
+        parser.add_argument('--fast-resize', action='store_true',
+                            help='Décode les JPEG en mode brouillon avant une réduction (bien '
+                                 'plus rapide, résultat approché à quelques unités près)')
+    if encoder:
+        parser.add_argument('--compress-level', type=int, choices=range(10), metavar='0-9',
+                            help='Niveau de compression PNG (défaut PIL: 6 ; 1 est bien plus '
+                                 'rapide)')
+        parser.add_argument('--quality', type=int, choices=range(1, 96), metavar='1-95',
+                            help='Qualité JPEG/WebP (défaut PIL: 75)')
+        parser.add_argument('--optimize', action='store_true',
+                            help='Optimise l\'encodage PNG/JPEG (plus lent, fichier plus petit)')
+
+
+def build_parser():
+    """Analyseur des arguments de image_processing.py"""
+    parser = argparse.ArgumentParser(description='Application de traitement d\'images')
+    parser.add_argument('--list-filters', action=_ListFilters,
+                       help='Affiche les filtres, leurs paramètres, nature et coût, puis quitte')
+    parser.add_argument('input', help='Chemin de l\'image d\'entrée (ou tableau .npy/.raw)')
+    parser.add_argument('output', help='Chemin de l\'image de sortie ; .npy ou .raw enregistre '
+                                       'les pixels sans encodage, pour une étape suivante')
+    add_chain_arguments(parser)
+    parser.add_argument('--precision', choices=PRECISIONS, default='float64',
+                       help='Précision de calcul : float64 (historique) ou native (uint8, '
+                            'moins de mémoire, sorties "L"/"1" pour les niveaux de gris)')
+    parser.add_argument('--threads', type=int, default=1,
+                       help='Nombre de threads ; l\'image est traitée par bandes horizontales '
+                            'en parallèle (défaut: 1)')
+    parser.add_argument('--cache-dir',
+                       help='Répertoire du cache de résultats (désactivé par défaut)')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                       help='Taille maximale du cache, en Mo (défaut: 1024)')
+    parser.add_argument('--cache-link', action='store_true',
+                       help='Sert les résultats du cache par lien physique plutôt que par copie')
+    parser.add_argument('--trace', metavar='FICHIER',
+                       help='Enregistre la durée de chaque étape dans un fichier de trace')
+    parser.add_argument('--trace-format', choices=TRACE_FORMATS, default='jsonl',
+                       help='Format de la trace : jsonl ou chrome (défaut: jsonl)')
+    return parser
+
+
+def main():
+    """Point d'entrée de image_processing.py"""
+    parser = build_parser()
+    args = parser.parse_args()
+    try:
+        steps = with_last_param(args.filter, args.param)
+    except ValueError as e:
+        parser.error(str(e))
+    # Une chaîne de plusieurs filtres est compilée, sans précision ni bandes
+    if len(steps) > 1 and (args.precision != 'float64' or args.threads != 1):
+        parser.error("--precision et --threads ne s'appliquent qu'à un filtre seul")
+
+    if not os.path.exists(args.input):
+        print(f"Erreur: Le fichier {args.input} n'existe pas")
+        return
+
+    if args.trace:
+        tracer.enable()
+
+    # Imports lourds (NumPy, PIL) : seulement une fois le traitement lancé
+    from image_processing import encoder_options, is_array_path
+    from planner import apply_plan
+    from result_cache import ResultCache, process_with_cache
+    from animation import ANIMATED_FORMATS, is_animated, process_animation
+
+    # Application de la chaîne de filtres
+    save_options = encoder_options(args.output, args.compress_level, args.quality, args.optimize)
+    if (os.path.splitext(args.output)[1].lower() in ANIMATED_FORMATS
+            and not is_array_path(args.input) and is_animated(args.input)):
+        # Animation ou TIFF multipage : toutes les images sont traitées
+        if args.crop or args.resize:
+            print("Erreur: --crop et --resize ne s'appliquent pas aux animations")
+            return
+        # Les piles d'images passent par la chaîne compilée, sans précision
+        # ni bandes ni cache propres
+        if args.precision != 'float64' or args.threads != 1 or args.cache_dir:
+            print("Erreur: --precision, --threads et --cache-dir ne s'appliquent pas "
+                  "aux animations")
+            return
+        count = process_animation(args.input, args.output, steps, **save_options)
+        print(f"{count} images traitées")
+        hit = False
+    else:
+        cache = None
+        if args.cache_dir:
+            cache = ResultCache(args.cache_dir, args.cache_size * 2**20, args.cache_link)
+        geometry = {'crop': args.crop, 'size': args.resize, 'resample': args.resample}
+        if args.fast_resize:
+            geometry['fast_resize'] = True
+        options = {'precision': args.precision}
+        if args.crop or args.resize:
+            options['geometry'] = geometry
+        try:
+            hit = process_with_cache(cache, args.input, args.output, steps,
+                                     lambda: apply_plan(args.input, steps, args.precision,
+                                                        args.threads, **geometry),
+                                     save_options, **options)
+        except ValueError as e:
+            print(f"Erreur: {e}")
+            return
+    if hit:
+        print("Résultat servi depuis le cache")
+    if args.trace:
+        tracer.export(args.trace, args.trace_format)
+    print(f"Image traitée sauvegardée dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
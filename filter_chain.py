@@ -0,0 +1,480 @@
+"""
+Compilation de chaînes de filtres en noyaux fusionnés
+Les filtres ponctuels consécutifs sont regroupés en une table de correspondance
+(LUT) de 256 entrées par canal, les filtres colorimétriques consécutifs en une
+seule matrice 3x3 : une chaîne de N filtres coûte environ un passage sur les pixels.
+"""
+
+import numpy as np
+from PIL import Image
+
+from image_processing import (ImageProcessor, GRAY_WEIGHTS, SEPIA_MATRIX, apply_filter,
+                              channel_histograms, histogram_otsu, histogram_percentile,
+                              is_array_path, load_array, normalize_mode)
+from filter_registry import COLOR_MATRIX, GEOMETRIC, GLOBAL_STAT, FILTERS, normalize_chain
+from instrumentation import tracer
+
+
+def _desaturation_matrix(factor):
+    return factor * np.eye(3) + (1 - factor) * np.tile(GRAY_WEIGHTS, (3, 1))
+
+
+def _may_overflow(matrix):
+    """Indique si une matrice peut sortir de l'intervalle [0, 255]"""
+    return bool((matrix < 0).any() or (matrix.sum(axis=1) > 1 + 1e-9).any())
+
+
+class _LutKernel:
+    """Suite de filtres ponctuels fusionnés en une LUT par canal"""
+
+    def __init__(self):
+        self.ops = []
+
+    def accepts(self, name, param):
+        """Une table composée est exacte : tout filtre ponctuel est fusionné"""
+        return True
+
+    def add(self, name, param):
+        if name == 'negative':
+            self.ops.append(lambda v: 255 - v)
+        elif name == 'clipping':
+            self.ops.append(lambda v: np.clip(v, 50, 200))
+        elif name == 'posterization':
+            step = 256 // param
+            self.ops.append(lambda v: (v // step) * step)
+        elif FILTERS[name].kind == GLOBAL_STAT:
+            # Ces filtres dépendent des statistiques de l'entrée : résolus à l'exécution
+            self.ops.append((name, param))
+
+    @property
+    def needs_stats(self):
+        return any(isinstance(op, tuple) for op in self.ops)
+
+    def histograms(self, pixels):
+        """Statistiques dont dépend la table : histogrammes (C, 256) de l'entrée"""
+        return channel_histograms(pixels)
+
+    def resolve(self, pixels):
+        """Construit la LUT (C, 256) pour l'entrée donnée"""
+        channels = pixels.shape[2] if pixels.ndim == 3 else 1
+        hist = self.histograms(pixels) if self.needs_stats else None
+        return self.resolve_histograms(hist, channels)
+
+    def resolve_histograms(self, hist, channels):
+        """Construit la LUT (C, 256) à partir des histogrammes de l'entrée
+
+        Args:
+            hist: Histogrammes (C, 256) de l'entrée, ou None si needs_stats est faux
+            channels: Nombre de canaux de l'entrée
+        """
+        return self.resolve_stack(None if hist is None else hist[np.newaxis], channels)[0]
+
+    def resolve_stack(self, hist, channels, count=1):
+        """Construit les LUT (N, C, 256) d'une pile d'images en une fois
+
+        Args:
+            hist: Histogrammes (N, C, 256) des images, ou None si needs_stats est faux
+            channels: Nombre de canaux des images
+            count: Nombre d'images (si hist vaut None)
+        """
+        if hist is not None:
+            count = len(hist)
+        lut = np.tile(np.arange(256, dtype=np.uint8), (count, channels, 1))
+        for op in self.ops:
+            values = lut.astype(np.float64)
+            if not isinstance(op, tuple):
+                result = op(values)
+            elif op[0] == 'contrast':
+                factor = op[1]
+                # Moyenne propre à chaque image, tous canaux confondus
+                mean = ((hist * values).sum(axis=(1, 2), keepdims=True)
+                        / hist.sum(axis=(1, 2), keepdims=True))
+                result = np.clip(mean + factor * (values - mean), 0, 255)
+            else:
+                # Histogramme des valeurs courantes (après les opérations précédentes)
+                offsets = np.arange(count)[:, np.newaxis, np.newaxis] * 256
+                current = np.bincount((lut + offsets).ravel(), weights=hist.ravel(),
+                                      minlength=count * 256).reshape(count, 256)
+                low = histogram_percentile(current, op[1])[:, np.newaxis, np.newaxis]
+                high = histogram_percentile(current, 100 - op[1])[:, np.newaxis, np.newaxis]
+                span = np.maximum(high - low, 1)
+                result = np.where(high > low, np.clip((values - low) * (255 / span), 0, 255),
+                                  values)
+            lut = result.astype(np.uint8)
+        return lut
+
+    def run(self, pixels, lut=None):
+        if lut is None:
+            lut = self.resolve(pixels)
+        if (lut == lut[0]).all():
+            # Même table pour tous les canaux : une seule indexation
+            return lut[0][pixels]
+        out = np.empty_like(pixels)
+        for c in range(pixels.shape[2]):
+            out[..., c] = lut[c][pixels[..., c]]
+        return out
+
+    def run_stack(self, stack):
+        """Applique le noyau à une pile (N, H, W[, C]) avec une LUT par image
+
+        Les histogrammes et les tables de toutes les images sont calculés en
+        une seule indexation : l'indice de chaque pixel est décalé de 256 par
+        image. Les opérations étant les mêmes pour tous les canaux et les
+        sommes de l'histogramme exactes, une table par image suffit.
+        """
+        count = len(stack)
+        index = stack.reshape(count, -1) + np.arange(0, count * 256, 256, dtype=np.intp)[:, None]
+        hist = np.bincount(index.ravel(), minlength=count * 256)
+        luts = self.resolve_stack(hist.reshape(count, 1, 256), 1)
+        return luts.reshape(-1)[index].reshape(stack.shape)
+
+
+class _ThresholdKernel:
+    """Seuillage de la luminance, fixe ou au seuil d'Otsu
+
+    La luminance est calculée en float64 comme par ImageProcessor et comparée
+    au seuil sans être arrondie : le résultat est identique à celui du filtre
+    appliqué seul. Une image couleur donne trois canaux égaux (alpha retiré).
+    """
+
+    def __init__(self):
+        self.level = None
+        self.needs_stats = False
+
+    def accepts(self, name, param):
+        """Un seuillage occupe seul son noyau"""
+        return False
+
+    def add(self, name, param):
+        if name == 'auto-threshold':
+            # Seuil d'Otsu de l'entrée : résolu à l'exécution
+            self.needs_stats = True
+        else:
+            self.level = param
+
+    def _luminance(self, pixels):
+        """Luminance float64 (..., H, W) d'une image couleur, comme ImageProcessor"""
+        wr, wg, wb = GRAY_WEIGHTS
+        gray = np.multiply(pixels[..., 0], wr)
+        gray += np.multiply(pixels[..., 1], wg)
+        gray += np.multiply(pixels[..., 2], wb)
+        return gray
+
+    def _gray(self, pixels, stack=False):
+        """Plan comparé au seuil : l'image elle-même si elle est en niveaux de gris"""
+        if pixels.ndim == (3 if stack else 2):
+            return pixels
+        return self._luminance(pixels)
+
+    def histograms(self, pixels):
+        """Histogramme (1, 256) de la luminance tronquée, comme gray_stats"""
+        gray = self._gray(pixels)
+        if gray.dtype != np.uint8:
+            gray = np.clip(gray, 0, 255).astype(np.uint8)
+        return channel_histograms(gray)
+
+    def resolve(self, pixels):
+        """Seuil à appliquer à l'entrée donnée"""
+        if not self.needs_stats:
+            return self.level
+        return self.resolve_histograms(self.histograms(pixels), 1)
+
+    def resolve_histograms(self, hist, channels):
+        """Seuil d'Otsu de l'histogramme de luminance (1, 256) de l'entrée"""
+        return int(histogram_otsu(hist)[0])
+
+    def _binarize(self, pixels, gray, level):
+        mask = np.greater(gray, level)
+        if pixels.ndim == gray.ndim:
+            return np.multiply(mask, np.uint8(255))
+        return np.repeat(np.multiply(mask, np.uint8(255))[..., np.newaxis], 3, axis=-1)
+
+    def run(self, pixels, level=None):
+        if level is None:
+            level = self.resolve(pixels)
+        return self._binarize(pixels, self._gray(pixels), level)
+
+    def run_stack(self, stack):
+        """Applique le seuillage à une pile (N, H, W[, C]), un seuil par image"""
+        gray = self._gray(stack, stack=True)
+        levels = [self.resolve_histograms(self.histograms(pixels), 1) for pixels in stack]
+        return self._binarize(stack, gray, np.array(levels)[:, np.newaxis, np.newaxis])
+
+
+# Borne, en unités, de l'écart cumulé avant troncature entre une matrice
+# fusionnée et l'application séquentielle des filtres qui la composent
+MAX_FUSION_ERROR = 1.0
+
+
+def _color_matrix(name, param):
+    """Matrice 3x3 d'un filtre colorimétrique"""
+    if name == 'bw':
+        return np.tile(GRAY_WEIGHTS, (3, 1))
+    if name == 'sepia':
+        return SEPIA_MATRIX
+    return _desaturation_matrix(param)
+
+
+class _MatrixKernel:
+    """Suite de transformations colorimétriques fusionnées en une matrice 3x3
+
+    Appliqués un par un, les filtres tronquent chaque résultat intermédiaire
+    (perte d'au plus une unité) ; la matrice suivante propage cette perte,
+    multipliée par sa norme. error borne l'écart cumulé avant la troncature
+    finale, et un groupe n'accepte plus de matrice dès que cette borne
+    dépasserait MAX_FUSION_ERROR. Après troncature, le résultat diffère donc
+    de l'application séquentielle d'au plus deux unités, d'une seule le plus
+    souvent. Deux matrices de norme 1 (noir & blanc, désaturation) sont
+    fusionnées ; le sépia (norme 1,35) ne l'est pas après une autre matrice.
+    """
+
+    # Transformation purement locale : aucune statistique globale
+    needs_stats = False
+
+    def __init__(self):
+        self.matrix = np.eye(3)
+        self.count = 0
+        self.error = 0.0
+        self.expands_gray = False
+        self.closed = False
+
+    def _error_with(self, matrix):
+        """Borne de l'écart si matrix est ajoutée au groupe"""
+        if not self.count:
+            return 0.0
+        return np.abs(matrix).sum(axis=1).max() * (self.error + 1)
+
+    def accepts(self, name, param):
+        """Indique si le filtre peut être fusionné sans dépasser MAX_FUSION_ERROR"""
+        return self._error_with(_color_matrix(name, param)) <= MAX_FUSION_ERROR
+
+    def add(self, name, param):
+        matrix = _color_matrix(name, param)
+        if name == 'sepia':
+            # Le sépia s'applique aussi aux images en niveaux de gris
+            self.expands_gray = True
+        self.error = self._error_with(matrix)
+        self.matrix = matrix @ self.matrix
+        self.count += 1
+        # Un écrêtage est nécessaire : la matrice doit terminer le groupe
+        self.closed = _may_overflow(matrix)
+
+    def run(self, pixels):
+        if pixels.ndim == 2:
+            if not self.expands_gray:
+                # bw et désaturation laissent les niveaux de gris inchangés
+                return pixels
+            pixels = np.stack([pixels, pixels, pixels], axis=2)
+        height, width, channels = pixels.shape
+        rgb = pixels[..., :3].reshape(-1, 3).astype(np.float32)
+        result = rgb @ self.matrix.T.astype(np.float32)
+        np.clip(result, 0, 255, out=result)
+        out = np.empty_like(pixels)
+        out[..., :3] = result.reshape(height, width, 3)
+        if channels > 3:
+            # Le canal alpha est conservé
+            out[..., 3:] = pixels[..., 3:]
+        return out
+
+
+class CompiledChain:
+    """Chaîne de filtres compilée en noyaux fusionnés
+
+    Les miroirs ne coûtent rien : ils sont cumulés puis appliqués comme des
+    vues à la fin de la chaîne.
+    """
+
+    def __init__(self, steps):
+        self.steps = normalize_chain(steps)
+        self.kernels = []
+        self.flip_v = False
+        self.flip_h = False
+        for name, param in self.steps:
+            spec = FILTERS[name]
+            if spec.kind == GEOMETRIC:
+                if name == 'mirror-v':
+                    self.flip_v = not self.flip_v
+                else:
+                    self.flip_h = not self.flip_h
+            elif spec.kind == COLOR_MATRIX:
+                self._kernel(_MatrixKernel, name, param).add(name, param)
+            elif spec.gray:
+                self._kernel(_ThresholdKernel, name, param).add(name, param)
+            else:
+                self._kernel(_LutKernel, name, param).add(name, param)
+
+    def _kernel(self, kernel_class, name, param):
+        """Retourne le noyau courant s'il peut recevoir le filtre, sinon en crée un"""
+        last = self.kernels[-1] if self.kernels else None
+        if (not isinstance(last, kernel_class) or getattr(last, 'closed', False)
+                or not last.accepts(name, param)):
+            last = kernel_class()
+            self.kernels.append(last)
+        return last
+
+    def __len__(self):
+        """Nombre de passages sur les pixels"""
+        return len(self.kernels)
+
+    @property
+    def needs_stats(self):
+        return any(kernel.needs_stats for kernel in self.kernels)
+
+    def resolve_luts(self, reference):
+        """Résout les tables des noyaux à statistiques sur une image de référence
+
+        Les tables obtenues, passées à run(), appliquent à toute autre image
+        (une tuile, une version réduite...) les statistiques de la référence.
+
+        Args:
+            reference: Tableau (H, W) ou (H, W, C), par exemple une version
+                réduite de l'image entière
+
+        Returns:
+            Liste avec, pour chaque noyau, sa table (C, 256) ou None
+        """
+        pixels = reference if reference.dtype == np.uint8 else reference.astype(np.uint8)
+        luts = []
+        for kernel in self.kernels:
+            lut = kernel.resolve(pixels) if kernel.needs_stats else None
+            pixels = kernel.run(pixels) if lut is None else kernel.run(pixels, lut)
+            luts.append(lut)
+        return luts
+
+    def run(self, pixels, histograms=None, luts=None):
+        """Applique la chaîne à un tableau de pixels
+
+        Args:
+            pixels: Tableau (H, W) ou (H, W, C) ; converti en uint8 si besoin
+            histograms: Statistiques déjà connues de pixels, calculées par la
+                méthode histograms() du premier noyau s'il dépend de statistiques
+                (évite un passage)
+            luts: Tables déjà résolues par resolve_luts() ; les statistiques
+                de pixels ne sont alors pas calculées
+
+        Returns:
+            Tableau uint8 résultant
+        """
+        if pixels.dtype != np.uint8:
+            pixels = pixels.astype(np.uint8)
+        for index, kernel in enumerate(self.kernels):
+            with tracer.span(f'kernel.{type(kernel).__name__.strip("_")}') as span:
+                if luts is not None and luts[index] is not None:
+                    pixels = kernel.run(pixels, luts[index])
+                elif index == 0 and histograms is not None and kernel.needs_stats:
+                    channels = pixels.shape[2] if pixels.ndim == 3 else 1
+                    pixels = kernel.run(pixels, kernel.resolve_histograms(histograms, channels))
+                else:
+                    pixels = kernel.run(pixels)
+                span.set(bytes=pixels.nbytes, shape=list(pixels.shape))
+        if self.flip_v:
+            pixels = np.flipud(pixels)
+        if self.flip_h:
+            pixels = np.fliplr(pixels)
+        return pixels
+
+    def run_stack(self, stack):
+        """Applique la chaîne à une pile d'images de même forme
+
+        La pile est traitée comme une seule image haute de N x H lignes : un
+        passage par noyau pour toute la pile. Les noyaux dépendant de
+        statistiques (contraste) utilisent les histogrammes de chaque image,
+        le résultat est donc identique à run() appliqué image par image.
+
+        Args:
+            stack: Tableau (N, H, W) ou (N, H, W, C)
+
+        Returns:
+            Pile uint8 résultante
+        """
+        if stack.dtype != np.uint8:
+            stack = stack.astype(np.uint8)
+        count, height = stack.shape[:2]
+        tall = stack.reshape(count * height, *stack.shape[2:])
+        for kernel in self.kernels:
+            with tracer.span(f'kernel.{type(kernel).__name__.strip("_")}', images=count) as span:
+                if kernel.needs_stats:
+                    tall = kernel.run_stack(tall.reshape(count, height, *tall.shape[1:]))
+                    tall = tall.reshape(count * height, *tall.shape[2:])
+                else:
+                    tall = kernel.run(tall)
+                span.set(bytes=tall.nbytes, shape=list(tall.shape))
+        if self.flip_h:
+            tall = np.fliplr(tall)
+        result = tall.reshape(count, height, *tall.shape[1:])
+        if self.flip_v:
+            result = result[:, ::-1]
+        return result
+
+    def apply(self, image):
+        """Applique la chaîne à une image PIL et retourne une image PIL"""
+        return Image.fromarray(self.run(np.asarray(normalize_mode(image))))
+
+
+def compile_chain(steps):
+    """Compile une chaîne de filtres
+
+    Args:
+        steps: Séquence de noms ou de tuples (nom, paramètre)
+
+    Returns:
+        Un objet CompiledChain
+    """
+    return CompiledChain(steps)
+
+
+def decode_source(image_path, steps, precision='float64', workers=1):
+    """Ouvre et décode une image pour une chaîne de filtres
+
+    Args:
+        image_path: Chemin vers l'image à traiter
+        steps: Liste de tuples (nom, paramètre)
+        precision: Précision d'ImageProcessor pour un filtre seul
+        workers: Nombre de threads d'ImageProcessor pour un filtre seul
+
+    Returns:
+        Un ImageProcessor pour un filtre seul, sinon le tableau uint8 des pixels
+        (projeté en mémoire pour un fichier .npy ou .raw)
+    """
+    if len(steps) == 1:
+        return ImageProcessor(image_path, precision, workers)
+    if is_array_path(image_path):
+        return load_array(image_path)
+    with tracer.span('open', path=image_path):
+        image = Image.open(image_path)
+    with image:
+        with tracer.span('decode') as span:
+            pixels = np.asarray(normalize_mode(image))
+            span.set(width=image.width, height=image.height, mode=image.mode,
+                     bytes=pixels.nbytes)
+    return pixels
+
+
+def render_source(source, steps):
+    """Applique une chaîne de filtres à une image décodée par decode_source
+
+    Returns:
+        L'image PIL résultante
+    """
+    if isinstance(source, ImageProcessor):
+        name, param = steps[0]
+        return apply_filter(source, name, param)
+    return Image.fromarray(compile_chain(steps).run(source))
+
+
+def apply_chain(image_path, steps, precision='float64', workers=1):
+    """Applique une chaîne de filtres à un fichier image
+
+    Un filtre seul passe par ImageProcessor pour conserver exactement son
+    comportement ; une chaîne plus longue est compilée.
+
+    Args:
+        image_path: Chemin vers l'image à traiter
+        steps: Liste de tuples (nom, paramètre)
+        precision: Précision d'ImageProcessor pour un filtre seul
+        workers: Nombre de threads d'ImageProcessor pour un filtre seul
+
+    Returns:
+        L'image PIL résultante
+    """
+    return render_source(decode_source(image_path, steps, precision, workers), steps)
@@ -0,0 +1,264 @@
+"""
+Registre déclaratif des filtres
+Chaque filtre y déclare son nom, la méthode d'ImageProcessor qui l'applique,
+son paramètre (valeur par défaut, bornes), sa nature et sa classe de coût. La
+ligne de commande, la GUI, la compilation des chaînes et le planificateur
+lisent ce registre. Le module n'importe ni NumPy ni PIL : analyser des
+arguments ou afficher l'aide ne charge aucune bibliothèque de calcul.
+"""
+
+import argparse
+
+
+# Natures de filtres
+POINTWISE = 'pointwise'        # Fonction de chaque valeur : table de 256 entrées
+COLOR_MATRIX = 'color-matrix'  # Combinaison des canaux : matrice 3x3
+GLOBAL_STAT = 'global-stat'    # Table dépendant des histogrammes de l'image entière
+GEOMETRIC = 'geometric'        # Déplacement des pixels, sans calcul
+
+KINDS = (POINTWISE, COLOR_MATRIX, GLOBAL_STAT, GEOMETRIC)
+
+# Classes de coût par pixel, de la moins à la plus coûteuse : vue ou copie,
+# lecture d'une table par valeur, produits flottants par pixel
+COST_CLASSES = ('view', 'lut', 'matrix')
+
+# Modes de précision d'ImageProcessor : 'float64' (historique) ou 'native'
+# (uint8, float32 si nécessaire)
+PRECISIONS = ('float64', 'native')
+
+
+class FilterParam:
+    """Paramètre numérique d'un filtre"""
+
+    def __init__(self, default, minimum, maximum, integer=False, unit=''):
+        """Initialise le paramètre
+
+        Args:
+            default: Valeur par défaut
+            minimum: Borne inférieure (curseur de la GUI, ligne de commande)
+            maximum: Borne supérieure (curseur de la GUI, ligne de commande)
+            integer: Valeur entière (seuil, nombre de niveaux)
+            unit: Unité affichée après la valeur
+        """
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.integer = integer
+        self.unit = unit
+
+    def convert(self, value):
+        """Convertit une valeur dans le type du paramètre"""
+        return int(value) if self.integer else float(value)
+
+    def resolve(self, value):
+        """Valeur effective : comme historiquement, None ou 0 prennent la valeur par défaut"""
+        return self.convert(value if value else self.default)
+
+    def check(self, value):
+        """Vérifie qu'une valeur est dans les bornes (0 désigne la valeur par défaut)
+
+        Raises:
+            ValueError: si la valeur sort des bornes
+        """
+        if value and not self.minimum <= value <= self.maximum:
+            raise ValueError(f"{value:g} hors des bornes ({self.minimum}-{self.maximum})")
+
+
+class FilterSpec:
+    """Description d'un filtre"""
+
+    def __init__(self, name, method, label, kind, cost, description, param=None, gray=False):
+        """Initialise la description
+
+        Args:
+            name: Nom en ligne de commande (``mirror-v``)
+            method: Nom de la méthode d'ImageProcessor
+            label: Libellé de la GUI
+            kind: Nature du filtre (voir KINDS)
+            cost: Classe de coût (voir COST_CLASSES)
+            description: Description courte
+            param: FilterParam, ou None pour un filtre sans paramètre
+            gray: Le filtre compare la luminance à un seuil (noyau de seuillage)
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Nature de filtre inconnue : {kind}")
+        if cost not in COST_CLASSES:
+            raise ValueError(f"Classe de coût inconnue : {cost}")
+        self.name = name
+        self.method = method
+        self.label = label
+        self.kind = kind
+        self.cost = cost
+        self.description = description
+        self.param = param
+        self.gray = gray
+
+    @property
+    def gui_name(self):
+        """Nom utilisé par la GUI (``mirror_v``)"""
+        return self.name.replace('-', '_')
+
+    @property
+    def local(self):
+        """Indique si chaque pixel du résultat ne dépend que du pixel source
+
+        Un filtre local commute avec un recadrage et avec un redimensionnement
+        au plus proche voisin.
+        """
+        return self.kind in (POINTWISE, COLOR_MATRIX)
+
+    def __repr__(self):
+        return f"FilterSpec({self.name!r}, kind={self.kind!r}, cost={self.cost!r})"
+
+
+# Filtres, dans l'ordre de la ligne de commande et de la GUI
+FILTERS = {spec.name: spec for spec in [
+    FilterSpec('negative', 'negative', "🔄 Négatif", POINTWISE, 'lut',
+               "Inverse toutes les couleurs"),
+    FilterSpec('bw', 'black_and_white', "⚫ Noir & Blanc", COLOR_MATRIX, 'matrix',
+               "Conversion en niveaux de gris"),
+    FilterSpec('sepia', 'sepia', "🟤 Sépia", COLOR_MATRIX, 'matrix',
+               "Applique une teinte sépia"),
+    FilterSpec('mirror-v', 'mirror_vertical', "⬆️ Miroir Vertical", GEOMETRIC, 'view',
+               "Retourne l'image de haut en bas"),
+    FilterSpec('mirror-h', 'mirror_horizontal', "↔️ Miroir Horizontal", GEOMETRIC, 'view',
+               "Retourne l'image de gauche à droite"),
+    FilterSpec('clipping', 'selective_clipping', "✂️ Clipping Sélectif", POINTWISE, 'lut',
+               "Limite les valeurs entre 50 et 200"),
+    FilterSpec('contrast', 'contrast', "🔆 Contraste", GLOBAL_STAT, 'lut',
+               "Facteur de contraste (>1 augmente, <1 diminue)",
+               FilterParam(1.5, 0.1, 3.0, unit='x')),
+    FilterSpec('threshold', 'threshold', "🎯 Seuillage", POINTWISE, 'matrix',
+               "Valeur de seuil (0-255)",
+               FilterParam(128, 0, 255, integer=True), gray=True),
+    FilterSpec('desaturation', 'desaturation', "🎨 Désaturation", COLOR_MATRIX, 'matrix',
+               "Facteur (0=N&B, 1=couleurs originales)",
+               FilterParam(0.5, 0.0, 1.0)),
+    FilterSpec('posterization', 'posterization', "🖼️ Postérisation", POINTWISE, 'lut',
+               "Nombre de niveaux par canal",
+               FilterParam(4, 2, 16, integer=True, unit=' niveaux')),
+    FilterSpec('auto-threshold', 'auto_threshold', "🌓 Seuillage Auto (Otsu)", GLOBAL_STAT,
+               'matrix', "Seuillage au seuil d'Otsu de la luminance", gray=True),
+    FilterSpec('auto-level', 'auto_level', "📊 Niveaux Auto", GLOBAL_STAT, 'lut',
+               "Étire les niveaux ; pourcentage de valeurs saturées à chaque extrémité",
+               FilterParam(1.0, 0.0, 10.0, unit=' %')),
+]}
+
+# Noms des filtres exposés en ligne de commande
+FILTER_CHOICES = list(FILTERS)
+
+# Valeurs par défaut des filtres paramétrables
+FILTER_DEFAULTS = {name: spec.param.default for name, spec in FILTERS.items() if spec.param}
+
+
+def get_filter(name):
+    """Description d'un filtre, par son nom CLI ou GUI
+
+    Raises:
+        ValueError: si le filtre est inconnu
+    """
+    spec = FILTERS.get(name.replace('_', '-'))
+    if spec is None:
+        raise ValueError(f"Filtre inconnu : {name}")
+    return spec
+
+
+def filters_of_kind(*kinds):
+    """Noms des filtres d'une ou plusieurs natures, dans l'ordre du registre"""
+    return tuple(name for name, spec in FILTERS.items() if spec.kind in kinds)
+
+
+def check_param(name, value):
+    """Vérifie la valeur du paramètre d'un filtre
+
+    Raises:
+        ValueError: si le filtre n'a pas de paramètre ou si la valeur sort
+            de ses bornes
+    """
+    spec = FILTERS[name]
+    if spec.param is None:
+        raise ValueError(f"le filtre '{name}' n'a pas de paramètre")
+    try:
+        spec.param.check(value)
+    except ValueError as e:
+        raise ValueError(f"paramètre invalide pour '{name}' : {e}")
+
+
+def parse_filter_spec(text):
+    """Analyse une spécification de filtre de la forme ``nom`` ou ``nom=valeur``
+
+    Returns:
+        Tuple (nom, paramètre) où le paramètre vaut None s'il est absent
+
+    Raises:
+        argparse.ArgumentTypeError: si le filtre est inconnu ou le paramètre invalide
+    """
+    name, sep, value = text.partition('=')
+    if name not in FILTERS:
+        raise argparse.ArgumentTypeError(
+            f"filtre inconnu '{name}' (choix possibles : {', '.join(FILTER_CHOICES)})")
+    if not sep:
+        return name, None
+    try:
+        param = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"paramètre invalide pour '{name}' : {value}")
+    try:
+        check_param(name, param)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return name, param
+
+
+def with_last_param(steps, param):
+    """Affecte --param au dernier filtre de la chaîne s'il n'a pas de valeur propre
+
+    Raises:
+        ValueError: si --param sort des bornes du paramètre de ce filtre
+    """
+    steps = list(steps)
+    if param is not None and steps and steps[-1][1] is None:
+        name = steps[-1][0]
+        if FILTERS[name].param is not None:
+            check_param(name, param)
+        steps[-1] = (name, param)
+    return steps
+
+
+def normalize_chain(steps):
+    """Normalise une chaîne de filtres
+
+    Les noms de la GUI (``mirror_v``) sont convertis en noms CLI (``mirror-v``)
+    et les paramètres absents ou nuls remplacés par leur valeur par défaut,
+    comme pour un filtre appliqué seul par apply_filter.
+
+    Args:
+        steps: Séquence de noms ou de tuples (nom, paramètre)
+
+    Returns:
+        Liste de tuples (nom, paramètre)
+    """
+    normalized = []
+    for step in steps:
+        name, param = (step, None) if isinstance(step, str) else step
+        spec = get_filter(name)
+        if spec.param is not None:
+            param = spec.param.resolve(param)
+        else:
+            param = None
+        normalized.append((spec.name, param))
+    return normalized
+
+
+def describe_filters():
+    """Tableau texte des filtres : paramètre, nature et classe de coût"""
+    lines = [f"{'Filtre':<16}{'Paramètre':<24}{'Nature':<14}{'Coût':<8}Description"]
+    for name, spec in FILTERS.items():
+        if spec.param is None:
+            param = '-'
+        else:
+            unit = spec.param.unit.strip()
+            param = (f"{spec.param.default} "
+                     f"({spec.param.minimum}-{spec.param.maximum}{' ' + unit if unit else ''})")
+        lines.append(f"{name:<16}{param:<24}{spec.kind:<14}{spec.cost:<8}{spec.description}")
+    return '\n'.join(lines)
@@ -8,10 +8,31 @@ import tkinter as tk
 from tkinter import ttk, filedialog
 from PIL import Image, ImageTk
 import numpy as np
-from image_processing import ImageProcessor
+from image_processing import normalize_mode, save_output
+from filter_registry import FILTERS, FILTER_DEFAULTS, get_filter
+from filter_chain import apply_chain
+from chain_cache import ChainCache
+from animation import ANIMATED_FORMATS, is_animated, process_animation
+from viewport import ImagePyramid, TileCache, Viewport
+from concurrent.futures import ThreadPoolExecutor
+import queue
 import os
 
 
+# Taille d'affichage des aperçus (et du proxy sur lequel ils sont calculés)
+DISPLAY_SIZE = (450, 450)
+
+# Budget mémoire des résultats intermédiaires mémoïsés de l'aperçu
+PREVIEW_CACHE_BYTES = 64 * 1024 * 1024
+
+# Budget mémoire des tuiles de la vue zoomée
+TILE_CACHE_BYTES = 256 * 1024 * 1024
+
+# Facteur de zoom par cran de molette et zoom maximal (pixels affichés par pixel)
+ZOOM_STEP = 1.25
+MAX_ZOOM = 16
+
+
 class ModernImageProcessingGUI:
     def __init__(self, root):
         self.root = root
@@ -25,7 +46,13 @@ class ModernImageProcessingGUI:
         self.original_image = None
         self.processed_image = None
         self.current_image_path = None
-        self.processor = None
+        
+        # Proxy à la taille de l'écran sur lequel l'aperçu est calculé
+        self.proxy_image = None
+        self.preview_steps = []
+        
+        # Pixels du proxy et résultats mémoïsés de chaque préfixe de la chaîne
+        self.chain_cache = None
         
         # Variables pour les filtres
         self.filter_vars = {}
@@ -34,7 +61,30 @@ class ModernImageProcessingGUI:
         # Timer pour l'aperçu dynamique
         self.update_timer = None
         
+        # Calcul de l'aperçu en arrière-plan : un seul thread, les tâches
+        # périmées sont annulées et les résultats repassent par une file
+        self.preview_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preview')
+        self.preview_future = None
+        self.preview_generation = 0
+        self.preview_results = queue.Queue()
+        
+        # Vue zoomée : pyramide de tuiles construite en arrière-plan au
+        # chargement ; view_scale vaut None lorsque l'image est ajustée
+        self.viewport = None
+        self.view_scale = None
+        self.view_center = (0, 0)
+        self.drag_start = None
+        self.view_results = queue.Queue()
+        # Décodage pleine résolution sur son propre thread : les aperçus sur le
+        # proxy ne l'attendent pas ; un décodage périmé est annulé s'il n'a pas
+        # commencé, et son résultat ignoré sinon
+        self.viewport_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='viewport')
+        self.viewport_future = None
+        # Préchargement des tuiles voisines, interrompu dès que la vue change
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+        
         self.create_widgets()
+        self.poll_preview_results()
         
     def setup_modern_style(self):
         """Configure un style moderne pour l'interface"""
@@ -111,15 +161,9 @@ class ModernImageProcessingGUI:
         canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        # Filtres simples
-        simple_filters = [
-            ("🔄 Négatif", "negative"),
-            ("⚫ Noir & Blanc", "bw"),
-            ("🟤 Sépia", "sepia"),
-            ("⬆️ Miroir Vertical", "mirror_v"),
-            ("↔️ Miroir Horizontal", "mirror_h"),
-            ("✂️ Clipping Sélectif", "clipping")
-        ]
+        # Filtres simples (sans paramètre), dans l'ordre du registre
+        simple_filters = [(spec.label, spec.gui_name) for spec in FILTERS.values()
+                          if spec.param is None]
         
         title_simple = tk.Label(scrollable_frame, text="Filtres Simples", 
                                font=('Segoe UI', 11, 'bold'), bg='#2d2d2d', fg='#007acc')
@@ -141,10 +185,11 @@ class ModernImageProcessingGUI:
                                     font=('Segoe UI', 11, 'bold'), bg='#2d2d2d', fg='#007acc')
         title_adjustable.pack(anchor=tk.W, pady=(0, 10))
         
-        self.create_filter_with_slider(scrollable_frame, "🔆 Contraste", "contrast", 0.1, 3.0, 1.5, "x")
-        self.create_filter_with_slider(scrollable_frame, "🎯 Seuillage", "threshold", 0, 255, 128, "")
-        self.create_filter_with_slider(scrollable_frame, "🎨 Désaturation", "desaturation", 0.0, 1.0, 0.5, "")
-        self.create_filter_with_slider(scrollable_frame, "🖼️ Postérisation", "posterization", 2, 16, 4, " niveaux")
+        for spec in FILTERS.values():
+            if spec.param is not None:
+                self.create_filter_with_slider(scrollable_frame, spec.label, spec.gui_name,
+                                               spec.param.minimum, spec.param.maximum,
+                                               spec.param.default, spec.param.unit)
         
         # === IMAGE ORIGINALE (Centre) ===
         original_frame = self.create_image_panel(main_frame, "📷 Image Originale", 1, 1)
@@ -158,6 +203,17 @@ class ModernImageProcessingGUI:
                                        bg='#2d2d2d', fg='#888888', font=('Segoe UI', 12))
         self.processed_label.pack(expand=True, fill=tk.BOTH)
         
+        # Zoom à la molette autour du curseur, déplacement au glisser,
+        # double-clic pour ajuster l'image au panneau
+        for label in (self.original_label, self.processed_label):
+            label.bind('<MouseWheel>',
+                       lambda e: self.zoom(ZOOM_STEP if e.delta > 0 else 1 / ZOOM_STEP, e))
+            label.bind('<Button-4>', lambda e: self.zoom(ZOOM_STEP, e))
+            label.bind('<Button-5>', lambda e: self.zoom(1 / ZOOM_STEP, e))
+            label.bind('<ButtonPress-1>', self.start_pan)
+            label.bind('<B1-Motion>', self.pan)
+            label.bind('<Double-Button-1>', lambda e: self.fit_view())
+        
         # === BARRE DE STATUT ===
         self.status_bar = tk.Label(main_frame, text="Prêt  ✓", bg='#007acc', fg='white',
                                   font=('Segoe UI', 9), anchor=tk.W, padx=15, height=2)
@@ -213,7 +269,7 @@ class ModernImageProcessingGUI:
     def on_slider_change(self, filter_name, val, unit, label):
         """Met à jour la valeur affichée et déclenche l'aperçu"""
         val_num = float(val)
-        if filter_name in ["threshold", "posterization"]:
+        if get_filter(filter_name).param.integer:
             val_num = int(val_num)
         label.config(text=f"{val_num}{unit}")
         self.schedule_update()
@@ -229,7 +285,7 @@ class ModernImageProcessingGUI:
         """Programme une mise à jour de l'aperçu (évite les calculs trop fréquents)"""
         if self.update_timer:
             self.root.after_cancel(self.update_timer)
-        self.update_timer = self.root.after(300, self.apply_filters_preview)
+        self.update_timer = self.root.after(100, self.apply_filters_preview)
     
     def load_image(self):
         """Charge une image"""
@@ -242,82 +298,247 @@ class ModernImageProcessingGUI:
             try:
                 self.current_image_path = file_path
                 self.original_image = Image.open(file_path)
-                self.processor = ImageProcessor(file_path)
-                self.display_image(self.original_image, self.original_label)
+                self.proxy_image = self.create_proxy(file_path)
+                self.chain_cache = ChainCache(np.asarray(self.proxy_image), PREVIEW_CACHE_BYTES)
+                self.viewport = None
+                self.view_scale = None
+                if self.viewport_future:
+                    self.viewport_future.cancel()
+                self.viewport_future = self.viewport_executor.submit(self.build_viewport,
+                                                                     file_path)
+                self.display_image(self.proxy_image, self.original_label)
                 self.processed_label.config(text="Appliquez des filtres", image='')
                 self.update_status(f"Image  chargée : {os.path.basename(file_path)}", "success")
             except Exception as e:
                 self.update_status(f"❌ Erreur : {str(e)}", "error")
     
+    def create_proxy(self, file_path):
+        """Décode une version réduite de l'image, à la taille de l'affichage"""
+        with Image.open(file_path) as image:
+            # Décodage JPEG à échelle réduite lorsque c'est possible
+            image.draft('RGB', DISPLAY_SIZE)
+            proxy = normalize_mode(image)
+            proxy.thumbnail(DISPLAY_SIZE, Image.Resampling.LANCZOS)
+            proxy.load()
+        return proxy
+    
+    def build_viewport(self, file_path):
+        """Décode l'image en pleine résolution pour la vue zoomée (arrière-plan)"""
+        try:
+            pyramid = ImagePyramid.open(file_path, cache=TileCache(TILE_CACHE_BYTES))
+            self.view_results.put(('viewport', file_path, Viewport(pyramid), None))
+        except Exception as e:
+            self.view_results.put(('viewport', file_path, None, e))
+    
+    def view_size(self):
+        """Taille du panneau d'aperçu, en pixels"""
+        width = self.processed_label.winfo_width()
+        height = self.processed_label.winfo_height()
+        return (width, height) if width > 1 and height > 1 else DISPLAY_SIZE
+    
+    def fit_scale(self):
+        """Échelle à laquelle l'image entière tient dans le panneau"""
+        pyramid = self.viewport.pyramid
+        width, height = self.view_size()
+        return min(width / pyramid.width, height / pyramid.height)
+    
+    def view_box(self):
+        """Zone de l'image affichée par la vue zoomée (x, y, largeur, hauteur)"""
+        pyramid = self.viewport.pyramid
+        width, height = self.view_size()
+        box_width = min(pyramid.width, width / self.view_scale)
+        box_height = min(pyramid.height, height / self.view_scale)
+        # Le centre est ramené pour que la zone reste dans l'image
+        x = min(max(self.view_center[0] - box_width / 2, 0), pyramid.width - box_width)
+        y = min(max(self.view_center[1] - box_height / 2, 0), pyramid.height - box_height)
+        self.view_center = (x + box_width / 2, y + box_height / 2)
+        return x, y, box_width, box_height
+    
+    def zoom(self, factor, event):
+        """Zoome en gardant fixe le point de l'image situé sous le curseur"""
+        if self.viewport is None:
+            if self.original_image:
+                self.update_status("⏳ Décodage en pleine résolution...", "info")
+            return
+        fit = self.fit_scale()
+        scale = self.view_scale or fit
+        if self.view_scale is None:
+            pyramid = self.viewport.pyramid
+            self.view_center = (pyramid.width / 2, pyramid.height / 2)
+        new_scale = min(scale * factor, MAX_ZOOM)
+        if new_scale <= fit:
+            self.fit_view()
+            return
+        width, height = self.view_size()
+        dx, dy = event.x - width / 2, event.y - height / 2
+        point = (self.view_center[0] + dx / scale, self.view_center[1] + dy / scale)
+        self.view_center = (point[0] - dx / new_scale, point[1] - dy / new_scale)
+        self.view_scale = new_scale
+        self.schedule_update()
+    
+    def start_pan(self, event):
+        self.drag_start = (event.x, event.y, self.view_center)
+    
+    def pan(self, event):
+        """Déplace la vue zoomée en suivant la souris"""
+        if self.view_scale is None or self.drag_start is None:
+            return
+        x, y, (cx, cy) = self.drag_start
+        self.view_center = (cx - (event.x - x) / self.view_scale,
+                            cy - (event.y - y) / self.view_scale)
+        self.schedule_update()
+    
+    def fit_view(self):
+        """Revient à l'image entière, calculée sur le proxy"""
+        if self.view_scale is None:
+            return
+        self.view_scale = None
+        if self.proxy_image:
+            self.display_image(self.proxy_image, self.original_label)
+        self.schedule_update()
+    
+    def get_active_steps(self):
+        """Retourne la chaîne des filtres actifs, dans l'ordre de l'interface"""
+        steps = []
+        for filter_name, var in self.filter_vars.items():
+            if var.get():
+                param = None
+                if filter_name in self.param_vars:
+                    param = self.param_vars[filter_name].get()
+                steps.append((filter_name, param))
+        return steps
+    
     def apply_filters_preview(self):
-        """Applique les filtres sélectionnés en temps réel (preview dynamique)"""
-        if not self.processor or not self.original_image:
+        """Lance le calcul de l'aperçu en arrière-plan (preview dynamique)"""
+        if not self.proxy_image:
             return
         
-        # Réinitialiser avec l'image originale
-        self.processor = ImageProcessor(self.current_image_path)
-        result = self.original_image.copy()
+        steps = self.get_active_steps()
+        self.preview_steps = steps
+        self.preview_generation += 1
+        
+        # Une tâche pas encore démarrée est devenue inutile
+        if self.preview_future:
+            self.preview_future.cancel()
         
-        applied_count = 0
+        generation = self.preview_generation
+        if self.view_scale is not None:
+            # Vue zoomée : seules les tuiles visibles sont filtrées
+            self.preview_future = self.preview_executor.submit(
+                self.render_view, generation, self.view_box(), self.view_size(), steps)
+            return
+        
+        if not steps:
+            self.processed_image = None
+            self.processed_label.config(text="Sélectionnez des filtres", image='')
+            self.update_status("Aucun filtre actif", "info")
+            return
         
+        self.preview_future = self.preview_executor.submit(
+            self.render_preview, generation, self.chain_cache, steps)
+    
+    def render_preview(self, generation, cache, steps):
+        """Calcule l'aperçu sur le proxy (thread d'arrière-plan, sans appel à Tk)"""
         try:
-            # Appliquer les filtres dans l'ordre
-            for filter_name, var in self.filter_vars.items():
-                if var.get():
-                    if filter_name == "negative":
-                        result = self.processor.negative()
-                    elif filter_name == "bw":
-                        result = self.processor.black_and_white()
-                    elif filter_name == "sepia":
-                        result = self.processor.sepia()
-                    elif filter_name == "mirror_v":
-                        result = self.processor.mirror_vertical()
-                    elif filter_name == "mirror_h":
-                        result = self.processor.mirror_horizontal()
-                    elif filter_name == "clipping":
-                        result = self.processor.selective_clipping()
-                    elif filter_name == "contrast":
-                        param = self.param_vars[filter_name].get()
-                        result = self.processor.contrast(param)
-                    elif filter_name == "threshold":
-                        param = int(self.param_vars[filter_name].get())
-                        result = self.processor.threshold(param)
-                    elif filter_name == "desaturation":
-                        param = self.param_vars[filter_name].get()
-                        result = self.processor.desaturation(param)
-                    elif filter_name == "posterization":
-                        param = int(self.param_vars[filter_name].get())
-                        result = self.processor.posterization(param)
-                    
-                    # Mettre à jour le processeur
-                    self.processor.pixels = np.array(result, dtype=np.float64)
-                    applied_count += 1
-            
-            if applied_count > 0:
-                self.processed_image = result
-                self.display_image(result, self.processed_label)
-                self.update_status(f"✓ {applied_count} filtre(s) appliqué(s)", "success")
-            else:
-                self.processed_label.config(text="Sélectionnez des filtres", image='')
-                self.update_status("Aucun filtre actif", "info")
-                
+            # Seuls les filtres situés après le dernier préfixe mémoïsé sont recalculés
+            result = Image.fromarray(cache.evaluate(steps))
+            self.preview_results.put((generation, list(cache.last_timings), result, None))
         except Exception as e:
-            self.update_status(f"❌ Erreur : {str(e)}", "error")
+            self.preview_results.put((generation, [], None, e))
+    
+    def render_view(self, generation, box, size, steps):
+        """Calcule la vue zoomée de l'original et du résultat (arrière-plan)"""
+        try:
+            viewport = self.viewport
+            viewport.set_chain(steps)
+            original = viewport.render(box, size, raw=True)
+            result = viewport.render(box, size)
+            self.view_results.put(('view', generation, (original, result), None))
+            self.prefetch_executor.submit(viewport.prefetch, box, size,
+                                          cancelled=lambda: generation != self.preview_generation)
+        except Exception as e:
+            self.view_results.put(('view', generation, None, e))
+    
+    def poll_view_results(self):
+        """Récupère la pyramide construite et les vues zoomées (thread Tk)"""
+        try:
+            while True:
+                kind, tag, value, error = self.view_results.get_nowait()
+                if kind == 'viewport':
+                    if tag == self.current_image_path and error is None:
+                        self.viewport = value
+                    continue
+                if tag != self.preview_generation or self.view_scale is None:
+                    continue
+                if error is not None:
+                    self.update_status(f"❌ Erreur : {str(error)}", "error")
+                    continue
+                original, result = value
+                self.processed_image = result if self.preview_steps else None
+                self.show_view(original, self.original_label)
+                self.show_view(result, self.processed_label)
+                self.update_status(f"🔍 Zoom {self.view_scale * 100:.0f} %  —  "
+                                   f"{len(self.preview_steps)} filtre(s) sur les tuiles visibles",
+                                   "success")
+        except queue.Empty:
+            pass
+    
+    def show_view(self, image, label):
+        """Affiche une vue zoomée telle quelle (déjà à la taille du panneau)"""
+        photo = ImageTk.PhotoImage(image)
+        label.config(image=photo, text='', bg='#2d2d2d')
+        label.image = photo
+    
+    def poll_preview_results(self):
+        """Récupère les aperçus calculés et les affiche (thread Tk)"""
+        try:
+            while True:
+                generation, timings, result, error = self.preview_results.get_nowait()
+                # Un résultat périmé est ignoré : un aperçu plus récent est attendu
+                if generation != self.preview_generation or self.view_scale is not None:
+                    continue
+                if error is not None:
+                    self.update_status(f"❌ Erreur : {str(error)}", "error")
+                else:
+                    self.processed_image = result
+                    self.display_image(result, self.processed_label)
+                    self.update_status(f"✓ {len(timings)} filtre(s) appliqué(s)  —  "
+                                       f"{self.format_timings(timings)}", "success")
+        except queue.Empty:
+            pass
+        self.poll_view_results()
+        self.root.after(30, self.poll_preview_results)
+    
+    def format_timings(self, timings):
+        """Résume le coût de chaque filtre du dernier aperçu"""
+        parts = []
+        for name, seconds in timings:
+            cost = "cache" if seconds is None else f"{seconds * 1000:.1f} ms"
+            parts.append(f"{name} {cost}")
+        return " · ".join(parts)
     
     def save_image(self):
-        """Sauvegarde l'image traitée"""
+        """Sauvegarde l'image traitée, recalculée en pleine résolution"""
         if not self.processed_image:
             self.update_status("⚠ Aucune image à sauvegarder", "warning")
             return
         
         file_path = filedialog.asksaveasfilename(
             defaultextension=".png",
-            filetypes=[("PNG", "*.png"), ("JPEG", "*.jpg"), ("Tous", "*.*")]
+            filetypes=[("PNG", "*.png"), ("JPEG", "*.jpg"), ("GIF", "*.gif"), ("Tous", "*.*")]
         )
         
         if file_path:
             try:
-                self.processed_image.save(file_path)
+                self.update_status("⏳ Rendu en pleine résolution...", "info")
+                self.root.update_idletasks()
+                extension = os.path.splitext(file_path)[1].lower()
+                if extension in ANIMATED_FORMATS and is_animated(self.current_image_path):
+                    # Toutes les images de l'animation sont filtrées
+                    process_animation(self.current_image_path, file_path, self.preview_steps)
+                else:
+                    result = apply_chain(self.current_image_path, self.preview_steps)
+                    save_output(result, file_path)
                 self.update_status(f"✓ Sauvegardé : {os.path.basename(file_path)}", "success")
             except Exception as e:
                 self.update_status(f"❌ Erreur : {str(e)}", "error")
@@ -327,19 +548,17 @@ class ModernImageProcessingGUI:
         if self.original_image:
             self.processed_label.config(text="Appliquez des filtres", image='')
             self.processed_image = None
+            self.preview_steps = []
+            # Ignore un éventuel aperçu encore en cours de calcul
+            self.preview_generation += 1
             
             # Décocher tous les filtres
             for var in self.filter_vars.values():
                 var.set(False)
             
             # Réinitialiser les valeurs par défaut
-            defaults = {
-                'contrast': 1.5,
-                'threshold': 128,
-                'desaturation': 0.5,
-                'posterization': 4
-            }
-            for name, val in defaults.items():
+            for name, val in FILTER_DEFAULTS.items():
+                name = get_filter(name).gui_name
                 if name in self.param_vars:
                     self.param_vars[name].set(val)
             
@@ -352,9 +571,8 @@ class ModernImageProcessingGUI:
     
     def display_image(self, image, label):
         """Affiche une image avec redimensionnement intelligent"""
-        display_size = (450, 450)
         img_copy = image.copy()
-        img_copy.thumbnail(display_size, Image.Resampling.LANCZOS)
+        img_copy.thumbnail(DISPLAY_SIZE, Image.Resampling.LANCZOS)
         
         photo = ImageTk.PhotoImage(img_copy)
         label.config(image=photo, text='', bg='#2d2d2d')
@@ -4,162 +4,1003 @@ Auteur: Image Processing App
 Date: 2025
 """
 
+import functools
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+if __name__ == '__main__':
+    # Lancé comme script : les arguments sont analysés (et l'aide affichée)
+    # avant de charger NumPy et PIL, que cli.main n'importe qu'au traitement
+    from cli import main
+    sys.exit(main())
+
 import numpy as np
 from PIL import Image
-import argparse
-import os
+
+# Noms du registre et point d'entrée réexportés : ils faisaient partie de ce module
+from filter_registry import (FILTER_CHOICES, FILTER_DEFAULTS, PRECISIONS, get_filter,
+                             parse_filter_spec, with_last_param)
+from cli import main
+from instrumentation import tracer, image_attrs
+
+
+# Coefficients de luminance (RGB vers niveaux de gris)
+GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+# Mêmes coefficients en virgule fixe (somme = 256) pour le calcul entier
+GRAY_WEIGHTS_FIXED = (77, 150, 29)
+
+SEPIA_MATRIX = np.array([
+    [0.393, 0.769, 0.189],  # Red
+    [0.349, 0.686, 0.168],  # Green
+    [0.272, 0.534, 0.131],  # Blue
+])
+
+def normalize_mode(image):
+    """Convertit une image PIL vers L, RGB ou RGBA si nécessaire"""
+    if image.mode in ('L', 'RGB', 'RGBA'):
+        return image
+    if image.mode == '1':
+        return image.convert('L')
+    has_alpha = 'A' in image.mode or 'transparency' in image.info
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def is_eight_bit_mode(mode):
+    """Indique si les valeurs d'un mode PIL sont des entiers de 0 à 255
+
+    Les modes I;16 ont un type de base 'L' mais des valeurs sur 16 bits.
+    """
+    return Image.getmodetype(mode) == 'L' and not mode.startswith('I;')
+
+
+# Nombre minimal de lignes par bande en exécution parallèle
+MIN_BAND_ROWS = 64
+
+# Pools de threads partagés, indexés par nombre de threads
+_band_executors = {}
+
+
+def _band_executor(workers):
+    """Retourne le pool de threads partagé pour un nombre de threads donné"""
+    if workers not in _band_executors:
+        _band_executors[workers] = ThreadPoolExecutor(max_workers=workers,
+                                                      thread_name_prefix='bands')
+    return _band_executors[workers]
+
+
+# Taille visée d'un tampon de travail : les noyaux traitent les bandes par
+# paquets de lignes dont les temporaires tiennent dans le cache du processeur
+SCRATCH_BYTES = 1 << 20
+
+
+class Workspace:
+    """Tampons de travail réutilisés d'un appel de filtre à l'autre
+    
+    Chaque tampon est identifié par une clé (bande, rang) ; il est agrandi au
+    besoin et jamais libéré, si bien qu'après le premier appel les filtres
+    n'allouent plus de temporaires. Un espace de travail ne doit pas servir à
+    deux appels simultanés.
+    """
+    
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0
+    
+    def get(self, key, shape, dtype):
+        """Tampon non initialisé de forme et de type donnés
+        
+        Args:
+            key: Identifiant du tampon ; deux clés distinctes ne partagent rien
+            shape: Forme demandée
+            dtype: Type NumPy des éléments
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        # Tampons d'octets : une même clé sert tour à tour à plusieurs types
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.size < nbytes:
+            buffer = np.empty(nbytes, dtype=np.uint8)
+            self._buffers[key] = buffer
+            self.allocations += 1
+        return buffer[:nbytes].view(dtype).reshape(shape)
+    
+    @property
+    def nbytes(self):
+        """Mémoire occupée par les tampons"""
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+    
+    def clear(self):
+        """Libère les tampons"""
+        self._buffers.clear()
+
+
+# Espace de travail par défaut, propre à chaque thread appelant
+_workspaces = threading.local()
+
+
+def default_workspace():
+    """Espace de travail partagé par les processeurs du thread courant"""
+    workspace = getattr(_workspaces, 'workspace', None)
+    if workspace is None:
+        workspace = _workspaces.workspace = Workspace()
+    return workspace
+
+
+def _traced(method):
+    """Mesure un filtre d'ImageProcessor avec le traceur global"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not tracer.enabled:
+            return method(self, *args, **kwargs)
+        with tracer.span(f'filter.{method.__name__}', precision=self.precision,
+                         workers=self.workers) as span:
+            result = method(self, *args, **kwargs)
+            span.set(**image_attrs(result))
+        return result
+    return wrapper
+
+
+def channel_histograms(pixels):
+    """Histogrammes de 256 valeurs par canal d'un tableau uint8, forme (C, 256)"""
+    if pixels.ndim == 2:
+        return np.bincount(pixels.ravel(), minlength=256)[np.newaxis]
+    return np.stack([np.bincount(pixels[..., c].ravel(), minlength=256)
+                     for c in range(pixels.shape[2])])
+
+
+def histogram_percentile(hist, q):
+    """Percentile (rang le plus proche) d'histogrammes de 256 valeurs
+    
+    Args:
+        hist: Histogramme(s), forme (..., 256)
+        q: Pourcentage entre 0 (minimum) et 100 (maximum)
+    
+    Returns:
+        Plus petite valeur v telle qu'au moins q % des échantillons soient <= v
+    """
+    cdf = np.cumsum(hist, axis=-1)
+    rank = np.maximum(np.ceil(cdf[..., -1:] * (q / 100)), 1)
+    return np.argmax(cdf >= rank, axis=-1)
+
+
+def histogram_otsu(hist):
+    """Seuil d'Otsu d'histogrammes de 256 valeurs
+    
+    Returns:
+        Seuil t maximisant la variance inter-classes entre v <= t et v > t
+    """
+    hist = np.asarray(hist, dtype=np.float64)
+    weight = np.cumsum(hist, axis=-1)
+    moment = np.cumsum(hist * np.arange(256), axis=-1)
+    total, total_moment = weight[..., -1:], moment[..., -1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (total_moment * weight - total * moment) ** 2 / (weight * (total - weight))
+    return np.argmax(np.nan_to_num(between, nan=0.0, posinf=0.0), axis=-1)
+
+
+def level_table(low, high):
+    """Table étirant [low, high] sur [0, 255] (identité si high <= low)"""
+    values = np.arange(256, dtype=np.float64)
+    if high <= low:
+        return values.astype(np.uint8)
+    return np.clip((values - low) * (255 / (high - low)), 0, 255).astype(np.uint8)
+
+
+class HistogramStats:
+    """Statistiques d'une image dérivées de ses histogrammes, en O(256)
+    
+    Sans canal précisé, les statistiques portent sur tous les canaux confondus.
+    """
+    
+    def __init__(self, hist):
+        """Initialise l'index
+        
+        Args:
+            hist: Histogrammes (C, 256) des canaux
+        """
+        self.hist = np.asarray(hist, dtype=np.int64)
+    
+    def _select(self, channel):
+        return self.hist.sum(axis=0) if channel is None else self.hist[channel]
+    
+    def count(self, channel=None):
+        """Nombre d'échantillons"""
+        return int(self._select(channel).sum())
+    
+    def mean(self, channel=None):
+        """Moyenne (sommes entières : identique à np.mean sur les pixels)"""
+        hist = self._select(channel)
+        return float(hist @ np.arange(256)) / hist.sum()
+    
+    def minimum(self, channel=None):
+        return int(histogram_percentile(self._select(channel), 0))
+    
+    def maximum(self, channel=None):
+        return int(histogram_percentile(self._select(channel), 100))
+    
+    def percentile(self, q, channel=None):
+        """Percentile q (0 à 100), au rang le plus proche"""
+        return int(histogram_percentile(self._select(channel), q))
+    
+    def otsu(self, channel=None):
+        """Seuil d'Otsu"""
+        return int(histogram_otsu(self._select(channel)))
+
+
+def _per_color(method):
+    """Filtre ponctuel : pour une image indexée, il n'est appliqué qu'à la palette"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.palette is None:
+            return method(self, *args, **kwargs)
+        # La sortie est une image indexée : le tampon de sortie ne sert pas
+        kwargs.pop('out', None)
+        colors = np.asarray(method(self._palette_processor(), *args, **kwargs))
+        return self._palette_image(colors[0])
+    return wrapper
+
+
+def palette_colors(image):
+    """Couleurs (256, 3) de la palette d'une image "P", telles que normalize_mode les produirait"""
+    strip = Image.new('P', (256, 1))
+    strip.putdata(range(256))
+    strip.putpalette(image.getpalette())
+    return np.asarray(normalize_mode(strip))[0]
 
 
 class ImageProcessor:
-    """Classe pour appliquer différents filtres sur les images"""
+    """Classe pour appliquer différents filtres sur les images
     
-    def __init__(self, image_path):
+    Chaque filtre accepte un argument out : tableau préalloué recevant le
+    résultat (uint8, ou booléen pour un seuillage natif), dont l'image
+    retournée peut partager la mémoire ; il est ignoré pour une image
+    indexée. Les temporaires des noyaux sont tirés d'un espace de travail
+    (Workspace) réutilisé d'un appel à l'autre.
+    """
+    
+    def __init__(self, image_path, precision='float64', workers=1, workspace=None):
         """Initialise le processeur avec une image
         
         Args:
             image_path: Chemin vers l'image à traiter
+            precision: 'float64' (par défaut) ou 'native' ; en mode natif les pixels
+                restent en uint8, les calculs passent en entier ou en float32 et les
+                résultats en niveaux de gris ou binaires sont des images "L" ou "1"
+            workers: Nombre de threads ; au-delà de 1, les filtres traitent des
+                bandes horizontales en parallèle (NumPy libère le GIL)
+            workspace: Workspace des tampons de travail ; par défaut celui du
+                thread appelant, partagé par tous ses processeurs
+        
+        Un fichier .npy ou .raw (voir load_array) est projeté en mémoire : en
+        précision native, les filtres lisent directement le fichier.
+        """
+        if is_array_path(image_path):
+            self._load(load_array(image_path), precision, workers, workspace)
+            return
+        with tracer.span('open', path=image_path) as span:
+            image = Image.open(image_path)
+            span.set(format=image.format)
+        self._load(image, precision, workers, workspace)
+    
+    @classmethod
+    def from_image(cls, image, precision='float64', workers=1, workspace=None):
+        """Crée un processeur à partir d'une image PIL déjà ouverte
+        
+        Args:
+            image: Image PIL (recadrée, redimensionnée...)
+            precision: Voir __init__
+            workers: Voir __init__
+            workspace: Voir __init__
+        """
+        processor = cls.__new__(cls)
+        processor._load(image, precision, workers, workspace)
+        return processor
+    
+    @classmethod
+    def from_array(cls, pixels, precision='float64', workers=1, workspace=None):
+        """Crée un processeur à partir d'un tableau uint8 (H, W) ou (H, W, C)
+        
+        En précision native, le tableau est utilisé tel quel, sans copie.
+        
+        Args:
+            pixels: Tableau L, RGB ou RGBA (voir load_array)
+            precision: Voir __init__
+            workers: Voir __init__
+            workspace: Voir __init__
+        """
+        processor = cls.__new__(cls)
+        processor._load(pixels, precision, workers, workspace)
+        return processor
+    
+    def _load(self, image, precision, workers, workspace=None):
+        """Décode l'image (PIL ou tableau uint8) selon la précision demandée"""
+        if precision not in PRECISIONS:
+            raise ValueError(f"Précision inconnue : {precision}")
+        self.precision = precision
+        self.workers = max(1, int(workers))
+        self.workspace = workspace
+        self.image = image
+        # Couleurs de la palette d'une image indexée (mode natif, sans transparence)
+        self.palette = None
+        self._pixels = None
+        # Index statistique (histogrammes), construit à la demande
+        self._stats = None
+        self._gray_stats = None
+        self._eight_bit = False
+        if isinstance(image, np.ndarray):
+            self.image = None
+            with tracer.span('decode', precision=precision) as span:
+                if self.native:
+                    self.pixels = image
+                else:
+                    self.pixels = image.astype(np.float64)
+                    self._eight_bit = image.dtype == np.uint8
+                span.set(width=image.shape[1], height=image.shape[0], mode=array_mode(image),
+                         bytes=self.pixels.nbytes)
+            return
+        with tracer.span('decode', precision=precision) as span:
+            if (self.native and self.image.mode == 'P'
+                    and 'transparency' not in self.image.info):
+                # Les pixels ne sont développés qu'à la demande (filtres spatiaux)
+                self.image.load()
+                self.palette = palette_colors(self.image)
+                nbytes = self.image.width * self.image.height
+            else:
+                if self.native:
+                    self.pixels = np.asarray(normalize_mode(self.image))
+                else:
+                    self.pixels = np.array(self.image, dtype=np.float64)
+                    # Valeurs entières de 0 à 255 : histogrammes possibles
+                    self._eight_bit = is_eight_bit_mode(self.image.mode)
+                nbytes = self.pixels.nbytes
+            span.set(width=self.image.width, height=self.image.height, mode=self.image.mode,
+                     bytes=nbytes)
+    
+    @property
+    def pixels(self):
+        """Tableau des pixels ; développé à la première utilisation pour une image indexée"""
+        if self._pixels is None:
+            with tracer.span('expand', mode=self.image.mode):
+                self._pixels = np.asarray(normalize_mode(self.image))
+        return self._pixels
+    
+    @pixels.setter
+    def pixels(self, value):
+        # Les pixels ne correspondent plus à la palette ni aux histogrammes
+        self._pixels = value
+        self.palette = None
+        self._stats = None
+        self._gray_stats = None
+        self._eight_bit = value.dtype == np.uint8
+    
+    @property
+    def has_stats(self):
+        """Indique si l'index statistique est disponible (données sur 8 bits)"""
+        return self.palette is not None or self._eight_bit
+    
+    @property
+    def stats(self):
+        """Histogrammes par canal (HistogramStats), calculés une seule fois"""
+        if self._stats is None:
+            if not self.has_stats:
+                raise ValueError("Statistiques indisponibles : l'image n'est pas sur 8 bits")
+            with tracer.span('stats') as span:
+                if self.palette is not None and self._pixels is None:
+                    # Histogramme des indices pondéré par les couleurs : O(256)
+                    counts = np.bincount(np.asarray(self.image).ravel(), minlength=256)
+                    hist = np.stack([np.bincount(self.palette[:, c], weights=counts, minlength=256)
+                                     for c in range(self.palette.shape[1])])
+                else:
+                    hist = channel_histograms(self.pixels.astype(np.uint8, copy=False))
+                span.set(channels=len(hist))
+            self._stats = HistogramStats(hist)
+        return self._stats
+    
+    @property
+    def gray_stats(self):
+        """Histogramme de la luminance (HistogramStats à un canal), calculé une seule fois"""
+        if self._gray_stats is None:
+            if self.palette is not None and self._pixels is None:
+                gray = self._gray(self.palette[np.newaxis])[0]
+                counts = np.bincount(np.asarray(self.image).ravel(), minlength=256)
+                self._gray_stats = HistogramStats(
+                    np.bincount(gray, weights=counts, minlength=256)[np.newaxis])
+            elif self.pixels.ndim == 2:
+                self._gray_stats = self.stats
+            else:
+                with tracer.span('stats', kind='gray'):
+                    gray = np.clip(self._gray(self.pixels), 0, 255).astype(np.uint8)
+                    self._gray_stats = HistogramStats(channel_histograms(gray))
+        return self._gray_stats
+    
+    def _palette_processor(self):
+        """Processeur dont l'image est la rangée des 256 couleurs de la palette"""
+        clone = object.__new__(type(self))
+        clone.precision = self.precision
+        clone.workers = 1
+        clone.workspace = self.workspace
+        clone.image = None
+        clone.pixels = self.palette[np.newaxis]
+        return clone
+    
+    def _palette_image(self, colors):
+        """Image indexée partageant le plan d'indices, avec une nouvelle palette
+        
+        Args:
+            colors: Couleurs (256, 3) ou niveaux de gris (256,) de la nouvelle palette
         """
-        self.image = Image.open(image_path)
-        self.pixels = np.array(self.image, dtype=np.float64)
+        colors = np.asarray(colors, dtype=np.uint8)
+        if colors.ndim == 1:
+            colors = np.repeat(colors[:, np.newaxis], 3, axis=1)
+        result = self.image.copy()
+        result.putpalette(colors.tobytes())
+        return result
+    
+    @property
+    def native(self):
+        """Indique si le processeur travaille en précision native (uint8)"""
+        return self.precision == 'native'
+    
+    def _to_image(self, result):
+        """Convertit un tableau résultat en image PIL"""
+        if result.dtype == np.bool_:
+            return Image.fromarray(result)
+        return Image.fromarray(result.astype(np.uint8, copy=False))
+    
+    def _output(self, shape, out=None, dtype=np.uint8):
+        """Tableau de sortie d'un filtre : out s'il est fourni, sinon un tableau neuf
+        
+        Args:
+            shape: Forme du résultat
+            out: Tableau préalloué fourni par l'appelant, ou None
+            dtype: Type du résultat (uint8, ou bool pour un seuillage natif)
+        """
+        if out is None:
+            return np.empty(shape, dtype=dtype)
+        if out.shape != tuple(shape) or out.dtype != dtype:
+            raise ValueError(f"Tampon de sortie incompatible : {out.dtype} {out.shape} "
+                             f"au lieu de {np.dtype(dtype)} {tuple(shape)}")
+        return out
+    
+    def _bands(self, height):
+        """Découpe [0, height) en bandes horizontales"""
+        count = min(self.workers, max(1, height // MIN_BAND_ROWS))
+        bounds = np.linspace(0, height, count + 1, dtype=int)
+        return list(zip(bounds[:-1], bounds[1:]))
+    
+    def _run_bands(self, kernel, out, flip=False, scratch=()):
+        """Exécute un noyau bande par bande dans un tableau préalloué
+        
+        Args:
+            kernel: Fonction kernel(bande_source, bande_sortie, *tampons)
+            out: Tableau de sortie préalloué
+            flip: Si True, la bande de sortie [b0, b1) lit les lignes source
+                miroir, retournées (miroir vertical)
+            scratch: Tampons de travail du noyau, tuples (dtype, canaux) avec
+                canaux à None pour un plan (H, W) ; chaque bande est alors
+                traitée par paquets de lignes dont les tampons, tirés de
+                l'espace de travail, occupent au plus SCRATCH_BYTES
+        
+        Returns:
+            Le tableau de sortie
+        """
+        src = self.pixels
+        height, width = out.shape[:2]
+        workspace = self.workspace if self.workspace is not None else default_workspace()
+        shapes = [((width, channels) if channels else (width,), dtype)
+                  for dtype, channels in scratch]
+        rows = height
+        if shapes:
+            row_bytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize
+                            for shape, dtype in shapes)
+            rows = max(1, SCRATCH_BYTES // row_bytes)
+        
+        def run(index):
+            b0, b1 = bands[index]
+            band = src[height - b1:height - b0][::-1] if flip else src[b0:b1]
+            for s0 in range(0, b1 - b0, rows):
+                s1 = min(s0 + rows, b1 - b0)
+                buffers = [workspace.get((index, rank), (s1 - s0,) + shape, dtype)
+                           for rank, (shape, dtype) in enumerate(shapes)]
+                kernel(band[s0:s1], out[b0 + s0:b0 + s1], *buffers)
+        
+        bands = self._bands(height)
+        if len(bands) == 1:
+            run(0)
+        else:
+            # list() propage les exceptions levées dans les threads
+            list(_band_executor(self.workers).map(run, range(len(bands))))
+        return out
+    
+    def _mean(self):
+        """Moyenne de tous les pixels, tirée des histogrammes si possible, sinon
+        calculée par bandes en parallèle"""
+        if self.has_stats:
+            return self.stats.mean()
+        bands = self._bands(self.pixels.shape[0])
+        if len(bands) == 1:
+            return np.mean(self.pixels, dtype=np.float64)
+        sums = _band_executor(self.workers).map(
+            lambda b: np.sum(self.pixels[b[0]:b[1]], dtype=np.float64), bands)
+        return sum(sums) / self.pixels.size
+    
+    @property
+    def _channels(self):
+        """Nombre de canaux des pixels, None pour un plan (H, W)"""
+        return self.pixels.shape[2] if self.pixels.ndim == 3 else None
+    
+    @property
+    def _gray_dtype(self):
+        """Type du plan de luminance : uint16 (virgule fixe) en mode natif, sinon float64"""
+        return np.uint16 if self.native else np.float64
+    
+    def _gray_into(self, pixels, gray, tmp):
+        """Calcule le plan de luminance d'une image couleur dans des tampons
+        
+        Args:
+            pixels: Pixels couleur (H, W, C)
+            gray: Tampon (H, W) de type _gray_dtype, qui reçoit le résultat
+            tmp: Tampon de travail de même forme et de même type
+        """
+        if self.native:
+            # Virgule fixe sur 16 bits : (77 R + 150 G + 29 B + 128) >> 8
+            wr, wg, wb = GRAY_WEIGHTS_FIXED
+            np.multiply(pixels[:,:,0], np.uint16(wr), out=gray)
+            gray += np.multiply(pixels[:,:,1], np.uint16(wg), out=tmp)
+            gray += np.multiply(pixels[:,:,2], np.uint16(wb), out=tmp)
+            gray += np.uint16(128)
+            gray >>= 8
+        else:
+            np.multiply(pixels[:,:,0], 0.299, out=gray)
+            gray += np.multiply(pixels[:,:,1], 0.587, out=tmp)
+            gray += np.multiply(pixels[:,:,2], 0.114, out=tmp)
+        return gray
+    
+    def _gray(self, pixels):
+        """Calcule le plan de luminance d'une image couleur"""
+        gray = np.empty(pixels.shape[:2], dtype=self._gray_dtype)
+        self._gray_into(pixels, gray, np.empty_like(gray))
+        return gray.astype(np.uint8) if self.native else gray
+    
+    @property
+    def _integral(self):
+        """Indique si les pixels sont des entiers de 0 à 255 (tables applicables)"""
+        return self.native or self._eight_bit
+    
+    def _lookup(self, table, out=None):
+        """Applique une table de correspondance de 256 entrées (pixels entiers)"""
+        table = np.asarray(table).astype(np.uint8)
+        
+        def kernel(src, dst, indices):
+            # np.take convertirait sinon toute la bande en indices intp
+            np.copyto(indices, src, casting='unsafe')
+            np.take(table, indices, out=dst)
+        
+        out = self._output(self.pixels.shape, out)
+        return self._run_bands(kernel, out, scratch=((np.intp, self._channels),))
         
-    def negative(self):
+    @_traced
+    @_per_color
+    def negative(self, out=None):
         """Applique un filtre négatif à l'image"""
-        result = 255 - self.pixels
-        return Image.fromarray(result.astype(np.uint8))
+        def kernel(src, dst):
+            np.subtract(255, src, out=dst, casting='unsafe')
+        
+        result = self._run_bands(kernel, self._output(self.pixels.shape, out))
+        return self._to_image(result)
     
-    def black_and_white(self):
+    @_traced
+    @_per_color
+    def black_and_white(self, out=None):
         """Convertit l'image en noir et blanc (niveaux de gris)"""
+        height, width = self.pixels.shape[:2]
+        scratch = ()
         if len(self.pixels.shape) == 3:
             # Formule standard de conversion RGB vers grayscale
-            gray = 0.299 * self.pixels[:,:,0] + 0.587 * self.pixels[:,:,1] + 0.114 * self.pixels[:,:,2]
-            result = np.stack([gray, gray, gray], axis=2)
+            def kernel(src, dst, gray, tmp):
+                self._gray_into(src, gray, tmp)
+                if self.native:
+                    np.copyto(dst, gray, casting='unsafe')
+                else:
+                    dst[...] = gray[:,:,np.newaxis]
+            
+            shape = (height, width) if self.native else (height, width, 3)
+            scratch = ((self._gray_dtype, None),) * 2
         else:
-            result = self.pixels
-        return Image.fromarray(result.astype(np.uint8))
+            kernel = self._copy_kernel
+            shape = self.pixels.shape
+        result = self._run_bands(kernel, self._output(shape, out), scratch=scratch)
+        return self._to_image(result)
     
-    def sepia(self):
+    @_traced
+    @_per_color
+    def sepia(self, out=None):
         """Applique un filtre sépia à l'image"""
-        if len(self.pixels.shape) == 2:
-            pixels = np.stack([self.pixels, self.pixels, self.pixels], axis=2)
+        height, width = self.pixels.shape[:2]
+        channels = self.pixels.shape[2] if len(self.pixels.shape) == 3 else 3
+        
+        if self.native:
+            if len(self.pixels.shape) == 2:
+                matrix = SEPIA_MATRIX.sum(axis=1, keepdims=True).T.astype(np.float32)
+            else:
+                matrix = SEPIA_MATRIX.T.astype(np.float32)
+            
+            def kernel(src, dst, rgb, result):
+                np.copyto(rgb, src[:,:,np.newaxis] if src.ndim == 2 else src[:,:,:3])
+                np.matmul(rgb, matrix, out=result)
+                np.clip(result, 0, 255, out=result)
+                dst[:,:,:3] = result
+                if channels == 4:
+                    # Le canal alpha est conservé
+                    dst[:,:,3] = src[:,:,3]
+            
+            scratch = ((np.float32, len(matrix)), (np.float32, 3))
         else:
-            pixels = self.pixels.copy()
+            def kernel(src, dst, acc, tmp):
+                if src.ndim == 2:
+                    r = g = b = src
+                else:
+                    r, g, b = src[:,:,0], src[:,:,1], src[:,:,2]
+                # Une ligne de la matrice par canal de sortie (R, G, B)
+                for c, (wr, wg, wb) in enumerate(SEPIA_MATRIX):
+                    np.multiply(r, wr, out=acc)
+                    acc += np.multiply(g, wg, out=tmp)
+                    acc += np.multiply(b, wb, out=tmp)
+                    dst[:,:,c] = np.clip(acc, 0, 255, out=acc)
+                dst[:,:,3:] = 0
             
-        result = np.zeros_like(pixels)
-        result[:,:,0] = 0.393 * pixels[:,:,0] + 0.769 * pixels[:,:,1] + 0.189 * pixels[:,:,2]  # Red
-        result[:,:,1] = 0.349 * pixels[:,:,0] + 0.686 * pixels[:,:,1] + 0.168 * pixels[:,:,2]  # Green
-        result[:,:,2] = 0.272 * pixels[:,:,0] + 0.534 * pixels[:,:,1] + 0.131 * pixels[:,:,2]  # Blue
+            scratch = ((np.float64, None),) * 2
         
-        result = np.clip(result, 0, 255)
-        return Image.fromarray(result.astype(np.uint8))
+        out = self._output((height, width, channels), out)
+        result = self._run_bands(kernel, out, scratch=scratch)
+        return self._to_image(result)
     
-    def mirror_vertical(self):
+    def _copy_kernel(self, src, dst):
+        dst[...] = src
+    
+    @_traced
+    def mirror_vertical(self, out=None):
         """Applique un miroir vertical (retournement haut/bas)"""
-        result = np.flipud(self.pixels)
-        return Image.fromarray(result.astype(np.uint8))
+        if self.palette is not None:
+            # Seul le plan d'indices est retourné
+            return self.image.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+        out = self._output(self.pixels.shape, out)
+        result = self._run_bands(self._copy_kernel, out, flip=True)
+        return self._to_image(result)
     
-    def mirror_horizontal(self):
+    @_traced
+    def mirror_horizontal(self, out=None):
         """Applique un miroir horizontal (retournement gauche/droite)"""
-        result = np.fliplr(self.pixels)
-        return Image.fromarray(result.astype(np.uint8))
+        if self.palette is not None:
+            return self.image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+        def kernel(src, dst):
+            dst[...] = src[:, ::-1]
+        
+        result = self._run_bands(kernel, self._output(self.pixels.shape, out))
+        return self._to_image(result)
     
-    def selective_clipping(self, min_val=50, max_val=200):
+    @_traced
+    @_per_color
+    def selective_clipping(self, min_val=50, max_val=200, out=None):
         """Applique un clipping sélectif des valeurs de pixels
         
         Args:
             min_val: Valeur minimale (par défaut 50)
             max_val: Valeur maximale (par défaut 200)
         """
-        result = np.clip(self.pixels, min_val, max_val)
-        return Image.fromarray(result.astype(np.uint8))
+        def kernel(src, dst):
+            np.clip(src, min_val, max_val, out=dst, casting='unsafe')
+        
+        result = self._run_bands(kernel, self._output(self.pixels.shape, out))
+        return self._to_image(result)
     
-    def contrast(self, factor=1.5):
+    @_traced
+    def contrast(self, factor=1.5, out=None):
         """Ajuste le contraste de l'image
         
         Args:
             factor: Facteur de contraste (> 1 augmente, < 1 diminue)
         """
-        mean = np.mean(self.pixels)
-        result = mean + factor * (self.pixels - mean)
-        result = np.clip(result, 0, 255)
-        return Image.fromarray(result.astype(np.uint8))
+        # La moyenne globale est calculée avant le traitement par bandes
+        mean = self._mean()
+        if self._integral:
+            # Une fois la moyenne connue, le contraste est une simple table
+            values = np.arange(256, dtype=np.float64)
+            table = np.clip(mean + factor * (values - mean), 0, 255).astype(np.uint8)
+            if self.palette is not None:
+                return self._palette_image(table[self.palette])
+            return self._to_image(self._lookup(table, out))
+        
+        def kernel(src, dst, result):
+            np.subtract(src, mean, out=result)
+            result *= factor
+            result += mean
+            dst[...] = np.clip(result, 0, 255, out=result)
+        
+        out = self._output(self.pixels.shape, out)
+        result = self._run_bands(kernel, out, scratch=((np.float64, self._channels),))
+        return self._to_image(result)
     
-    def threshold(self, threshold_value=128):
+    @_traced
+    def threshold(self, threshold_value=128, out=None):
         """Applique un seuillage binaire à l'image
         
         Args:
             threshold_value: Valeur du seuil (par défaut 128)
         """
-        if len(self.pixels.shape) == 3:
-            gray = 0.299 * self.pixels[:,:,0] + 0.587 * self.pixels[:,:,1] + 0.114 * self.pixels[:,:,2]
+        height, width = self.pixels.shape[:2]
+        color = len(self.pixels.shape) == 3
+        
+        if self.native:
+            # Image binaire (mode "1")
+            if color:
+                def kernel(src, dst, gray, tmp):
+                    np.greater(self._gray_into(src, gray, tmp), threshold_value, out=dst)
+                
+                scratch = ((np.uint16, None),) * 2
+            else:
+                def kernel(src, dst):
+                    np.greater(src, threshold_value, out=dst)
+                
+                scratch = ()
+            out = self._output((height, width), out, np.bool_)
+            result = self._run_bands(kernel, out, scratch=scratch)
+            return self._to_image(result)
+        
+        if color:
+            def kernel(src, dst, gray, tmp, mask):
+                np.greater(self._gray_into(src, gray, tmp), threshold_value, out=mask)
+                np.multiply(mask[:,:,np.newaxis], np.uint8(255), out=dst)
+            
+            scratch = ((np.float64, None),) * 2 + ((np.bool_, None),)
         else:
-            gray = self.pixels
+            def kernel(src, dst, mask):
+                np.multiply(np.greater(src, threshold_value, out=mask), np.uint8(255), out=dst)
             
-        result = np.where(gray > threshold_value, 255, 0)
-        if len(self.pixels.shape) == 3:
-            result = np.stack([result, result, result], axis=2)
-        return Image.fromarray(result.astype(np.uint8))
+            scratch = ((np.bool_, None),)
+        shape = (height, width, 3) if color else (height, width)
+        result = self._run_bands(kernel, self._output(shape, out), scratch=scratch)
+        return self._to_image(result)
     
-    def desaturation(self, factor=0.5):
+    @_traced
+    @_per_color
+    def desaturation(self, factor=0.5, out=None):
         """Réduit la saturation de l'image
         
         Args:
             factor: Facteur de désaturation (0 = noir et blanc, 1 = couleurs originales)
         """
+        scratch = ()
         if len(self.pixels.shape) == 3:
-            gray = 0.299 * self.pixels[:,:,0] + 0.587 * self.pixels[:,:,1] + 0.114 * self.pixels[:,:,2]
-            gray_stack = np.stack([gray, gray, gray], axis=2)
-            result = factor * self.pixels + (1 - factor) * gray_stack
+            # Calcul en float32 en mode natif, en float64 sinon
+            dtype = np.float32 if self.native else np.float64
+            
+            def kernel(src, dst, gray, tmp, weighted, result):
+                self._gray_into(src, gray, tmp)
+                np.multiply(gray, dtype(1 - factor), out=weighted)
+                np.multiply(src[:,:,:3], dtype(factor), out=result)
+                result += weighted[:,:,np.newaxis]
+                dst[:,:,:3] = result
+                if src.shape[2] == 4:
+                    # Le canal alpha est conservé
+                    dst[:,:,3] = src[:,:,3]
+            
+            scratch = ((self._gray_dtype, None),) * 2 + ((dtype, None), (dtype, 3))
         else:
-            result = self.pixels
-        return Image.fromarray(result.astype(np.uint8))
+            kernel = self._copy_kernel
+        out = self._output(self.pixels.shape, out)
+        result = self._run_bands(kernel, out, scratch=scratch)
+        return self._to_image(result)
     
-    def posterization(self, levels=4):
+    @_traced
+    @_per_color
+    def posterization(self, levels=4, out=None):
         """Applique une postérisation à l'image (réduction du nombre de couleurs)
         
         Args:
             levels: Nombre de niveaux par canal de couleur (par défaut 4)
         """
         step = 256 // levels
-        result = (self.pixels // step) * step
-        return Image.fromarray(result.astype(np.uint8))
+        if self._integral:
+            return self._to_image(self._lookup((np.arange(256) // step) * step, out))
+        
+        def kernel(src, dst, result):
+            np.floor_divide(src, step, out=result)
+            result *= step
+            dst[...] = result
+        
+        out = self._output(self.pixels.shape, out)
+        result = self._run_bands(kernel, out, scratch=((np.float64, self._channels),))
+        return self._to_image(result)
+    
+    @_traced
+    def auto_threshold(self, out=None):
+        """Seuillage binaire au seuil d'Otsu de la luminance"""
+        return self.threshold(self.gray_stats.otsu(), out=out)
+    
+    @_traced
+    def auto_level(self, clip=1.0, out=None):
+        """Étire les niveaux sur toute la plage [0, 255]
+        
+        Args:
+            clip: Pourcentage de valeurs saturées à chaque extrémité (par défaut 1.0)
+        """
+        table = level_table(self.stats.percentile(clip), self.stats.percentile(100 - clip))
+        if self.palette is not None:
+            return self._palette_image(table[self.palette])
+        return self._to_image(self._lookup(table, out))
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Application de traitement d\'images')
-    parser.add_argument('input', help='Chemin de l\'image d\'entrée')
-    parser.add_argument('output', help='Chemin de l\'image de sortie')
-    parser.add_argument('--filter', required=True, 
-                       choices=['negative', 'bw', 'sepia', 'mirror-v', 'mirror-h', 
-                               'clipping', 'contrast', 'threshold', 'desaturation', 'posterization'],
-                       help='Filtre à appliquer')
-    parser.add_argument('--param', type=float, help='Paramètre du filtre (si applicable)')
+def apply_filter(processor, filter_name, param=None):
+    """Applique un filtre désigné par son nom CLI
     
-    args = parser.parse_args()
+    Args:
+        processor: Instance de ImageProcessor
+        filter_name: Nom du filtre (voir filter_registry.FILTERS)
+        param: Paramètre du filtre (None pour la valeur par défaut)
     
-    if not os.path.exists(args.input):
-        print(f"Erreur: Le fichier {args.input} n'existe pas")
-        return
-    
-    processor = ImageProcessor(args.input)
+    Returns:
+        L'image PIL résultante
+    """
+    spec = get_filter(filter_name)
+    method = getattr(processor, spec.method)
+    if spec.param is None:
+        return method()
+    # Comme historiquement, un paramètre nul prend la valeur par défaut
+    return method(spec.param.resolve(param))
+
+
+def encoder_options(output_path, compress_level=None, quality=None, optimize=False):
+    """Paramètres d'encodage PIL applicables au format du fichier de sortie
     
-    # Application du filtre sélectionné
-    filter_map = {
-        'negative': lambda: processor.negative(),
-        'bw': lambda: processor.black_and_white(),
-        'sepia': lambda: processor.sepia(),
-        'mirror-v': lambda: processor.mirror_vertical(),
-        'mirror-h': lambda: processor.mirror_horizontal(),
-        'clipping': lambda: processor.selective_clipping(),
-        'contrast': lambda: processor.contrast(args.param if args.param else 1.5),
-        'threshold': lambda: processor.threshold(int(args.param) if args.param else 128),
-        'desaturation': lambda: processor.desaturation(args.param if args.param else 0.5),
-        'posterization': lambda: processor.posterization(int(args.param) if args.param else 4)
-    }
+    Args:
+        output_path: Fichier de sortie (seule l'extension compte)
+        compress_level: Niveau de compression PNG (0 à 9)
+        quality: Qualité JPEG ou WebP (1 à 95)
+        optimize: Optimise l'encodage PNG ou JPEG (plus lent, fichier plus petit)
     
-    result_image = filter_map[args.filter]()
-    result_image.save(args.output)
-    print(f"Image traitée sauvegardée dans {args.output}")
+    Returns:
+        Dictionnaire d'arguments pour Image.save
+    """
+    ext = os.path.splitext(output_path)[1].lower()
+    options = {}
+    if ext == '.png' and compress_level is not None:
+        options['compress_level'] = compress_level
+    if ext in ('.jpg', '.jpeg', '.webp') and quality is not None:
+        options['quality'] = quality
+    if ext in ('.png', '.jpg', '.jpeg') and optimize:
+        options['optimize'] = True
+    return options
 
 
-if __name__ == '__main__':
-    main()
+# Formats de sortie acceptant les images indexées ("P")
+PALETTE_EXTENSIONS = ('.png', '.gif', '.bmp', '.tif', '.tiff')
+
+
+def output_image(image, output_path):
+    """Convertit une image indexée en RGB si le format de sortie ne gère pas les palettes"""
+    if image.mode == 'P' and os.path.splitext(output_path)[1].lower() not in PALETTE_EXTENSIONS:
+        return image.convert('RGB')
+    return image
+
+
+# Formats intermédiaires sans codec, lus par projection en mémoire
+ARRAY_EXTENSIONS = ('.npy', '.raw')
+
+# En-tête du format brut : signature, puis "hauteur largeur canaux"
+RAW_MAGIC = b'IPRAW 1\n'
+
+# Mode PIL correspondant au nombre de canaux
+_ARRAY_MODES = {1: 'L', 3: 'RGB', 4: 'RGBA'}
+
+
+def is_array_path(path):
+    """Indique si un fichier est un tableau intermédiaire (.npy ou .raw)"""
+    return os.path.splitext(path)[1].lower() in ARRAY_EXTENSIONS
+
+
+def array_mode(pixels):
+    """Mode PIL ('L', 'RGB' ou 'RGBA') d'un tableau uint8 (H, W) ou (H, W, C)"""
+    return _ARRAY_MODES[pixels.shape[2] if pixels.ndim == 3 else 1]
+
+
+def _raw_header(shape):
+    channels = shape[2] if len(shape) == 3 else 1
+    return RAW_MAGIC + f"{shape[0]} {shape[1]} {channels}\n".encode()
+
+
+def load_array(path):
+    """Projette en mémoire un tableau intermédiaire, sans le lire ni le décoder
+
+    Args:
+        path: Fichier .npy (numpy.save) ou .raw (en-tête IPRAW suivi des
+            octets uint8 ligne par ligne)
+
+    Returns:
+        Tableau uint8 (H, W) ou (H, W, C) en lecture seule, adossé au fichier
+    """
+    with tracer.span('open', path=path, format='array') as span:
+        if os.path.splitext(path)[1].lower() == '.npy':
+            pixels = np.load(path, mmap_mode='r')
+        else:
+            with open(path, 'rb') as f:
+                magic = f.read(len(RAW_MAGIC))
+                line = f.readline(64)
+            try:
+                if magic != RAW_MAGIC:
+                    raise ValueError
+                height, width, channels = (int(v) for v in line.split())
+            except ValueError:
+                raise ValueError(f"{path} n'est pas un fichier brut IPRAW")
+            shape = (height, width) if channels == 1 else (height, width, channels)
+            pixels = np.memmap(path, dtype=np.uint8, mode='r', shape=shape,
+                               offset=len(magic) + len(line))
+        if pixels.dtype != np.uint8 or not (
+                pixels.ndim == 2 or (pixels.ndim == 3 and pixels.shape[2] in (1, 3, 4))):
+            raise ValueError(f"{path} : tableau uint8 (H, W) ou (H, W, 1|3|4) attendu, "
+                             f"{pixels.dtype} {pixels.shape} trouvé")
+        if pixels.ndim == 3 and pixels.shape[2] == 1:
+            pixels = pixels[:, :, 0]
+        span.set(width=pixels.shape[1], height=pixels.shape[0], bytes=pixels.nbytes)
+    return pixels
+
+
+def image_size(path):
+    """Taille (largeur, hauteur) d'une image ou d'un tableau intermédiaire, sans décodage"""
+    if is_array_path(path):
+        height, width = load_array(path).shape[:2]
+        return width, height
+    with Image.open(path) as image:
+        return image.size
+
+
+def create_array(path, shape):
+    """Crée un tableau intermédiaire vide et le projette en mémoire en écriture
+
+    Args:
+        path: Fichier .npy ou .raw à créer
+        shape: Forme (H, W) ou (H, W, C) du tableau uint8
+
+    Returns:
+        numpy.memmap inscriptible ; flush() ou sa libération écrit le fichier
+    """
+    if os.path.splitext(path)[1].lower() == '.npy':
+        return np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=tuple(shape))
+    header = _raw_header(shape)
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.truncate(len(header) + int(np.prod(shape)))
+    return np.memmap(path, dtype=np.uint8, mode='r+', shape=tuple(shape), offset=len(header))
+
+
+def save_array(pixels, path):
+    """Enregistre un tableau uint8 (ou booléen) au format .npy ou .raw"""
+    if pixels.dtype == np.bool_:
+        pixels = pixels.view(np.uint8) * np.uint8(255)
+    if os.path.splitext(path)[1].lower() == '.npy':
+        np.save(path, np.asarray(pixels, dtype=np.uint8))
+        return
+    with open(path, 'wb') as f:
+        f.write(_raw_header(pixels.shape))
+        np.ascontiguousarray(pixels, dtype=np.uint8).tofile(f)
+
+
+def save_output(image, output_path, **save_options):
+    """Enregistre une image résultat selon l'extension du fichier de sortie
+
+    Un fichier .npy ou .raw reçoit les pixels en L, RGB ou RGBA sans
+    encodage ; les autres formats passent par PIL.
+
+    Args:
+        image: Image PIL résultante
+        output_path: Fichier de sortie
+        save_options: Paramètres d'encodage passés à Image.save
+    """
+    if is_array_path(output_path):
+        save_array(np.asarray(normalize_mode(image)), output_path)
+    else:
+        output_image(image, output_path).save(output_path, **save_options)
+
@@ -0,0 +1,135 @@
+"""
+Instrumentation légère des traitements
+Enregistre la durée de chaque étape (ouverture, décodage, filtres, encodage),
+la taille des données produites et les dimensions de l'image, puis exporte
+les traces en JSON lines ou au format Chrome trace (chrome://tracing, Perfetto).
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+# Nombre maximal d'événements conservés (les plus anciens sont écartés)
+DEFAULT_MAX_EVENTS = 100000
+
+TRACE_FORMATS = ('jsonl', 'chrome')
+
+
+class _NullSpan:
+    """Span inactif : aucun coût lorsque le traçage est désactivé"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Mesure d'une étape, enregistrée dans le traceur à la sortie du bloc"""
+
+    __slots__ = ('tracer', 'name', 'attrs', 'start')
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer.events.append({
+            'name': self.name,
+            'ts': self.start // 1000,
+            'dur': (end - self.start) // 1000,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': self.attrs,
+        })
+        return False
+
+    def set(self, **attrs):
+        """Ajoute des attributs (octets, dimensions...) à l'étape"""
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """Collecteur d'événements de trace
+
+    Désactivé par défaut ; une fois activé, chaque étape coûte deux lectures
+    d'horloge et l'ajout d'un dictionnaire dans une file bornée.
+    """
+
+    def __init__(self, max_events=DEFAULT_MAX_EVENTS):
+        self.enabled = False
+        self.events = deque(maxlen=max_events)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **attrs):
+        """Retourne un gestionnaire de contexte mesurant une étape
+
+        Exemple :
+            with tracer.span('decode', path=path) as span:
+                pixels = ...
+                span.set(bytes=pixels.nbytes)
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, attrs)
+
+    def drain(self):
+        """Retire et retourne les événements enregistrés"""
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        return events
+
+    def extend(self, events):
+        """Ajoute des événements venant d'un autre processus"""
+        self.events.extend(events)
+
+    def export(self, path, fmt='jsonl'):
+        """Écrit les événements dans un fichier
+
+        Args:
+            path: Fichier de sortie
+            fmt: 'jsonl' (un événement par ligne) ou 'chrome' (Chrome trace)
+        """
+        events = list(self.events)
+        with open(path, 'w') as f:
+            if fmt == 'chrome':
+                trace = [dict(event, ph='X', cat='image') for event in events]
+                json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+            else:
+                for event in events:
+                    f.write(json.dumps(event) + '\n')
+
+
+def image_attrs(image):
+    """Attributs de trace d'une image PIL (dimensions, mode, octets)"""
+    width, height = image.size
+    return {'width': width, 'height': height, 'mode': image.mode,
+            'bytes': width * height * len(image.getbands())}
+
+
+# Traceur global du processus
+tracer = Tracer()
@@ -0,0 +1,134 @@
+"""
+Exécution en pipeline par étapes reliées par des files bornées
+Chaque étape (décodage, traitement, encodage...) dispose de ses propres threads :
+pendant qu'une image est encodée, la suivante est filtrée et une autre décodée.
+La durée totale tend vers celle de l'étape la plus lente plutôt que vers la
+somme des étapes.
+"""
+
+import queue
+import threading
+import time
+
+
+# Marqueur de fin de flux
+_DONE = object()
+
+
+class Pipeline:
+    """Enchaînement d'étapes exécutées chacune par un groupe de threads
+
+    Les files entre étapes sont bornées : une étape rapide se bloque lorsque
+    la suivante prend du retard, ce qui borne la mémoire occupée par les
+    éléments en cours. Les résultats sont rendus dans l'ordre de fin de
+    traitement. Les décodeurs et encodeurs de PIL comme les calculs NumPy
+    libèrent le GIL, ce qui permet aux étapes de progresser en parallèle.
+    """
+
+    def __init__(self, stages, queue_size=4):
+        """Initialise le pipeline
+
+        Args:
+            stages: Liste de tuples (nom, fonction, threads) ; chaque fonction
+                reçoit l'élément produit par l'étape précédente et retourne
+                celui de l'étape suivante
+            queue_size: Nombre maximal d'éléments en attente entre deux étapes
+        """
+        if not stages:
+            raise ValueError("Le pipeline doit comporter au moins une étape")
+        self.stages = [(name, function, max(1, int(workers)))
+                       for name, function, workers in stages]
+        self.queue_size = max(1, int(queue_size))
+        # Temps cumulé passé dans chaque étape (secondes)
+        self.busy = {name: 0.0 for name, _, _ in self.stages}
+        self._lock = threading.Lock()
+
+    def run(self, items, on_result=None):
+        """Fait passer les éléments par toutes les étapes
+
+        Args:
+            items: Itérable d'éléments d'entrée, consommé au fil de l'eau
+            on_result: Fonction appelée (dans le thread appelant) avec chaque
+                élément sortant de la dernière étape
+
+        Raises:
+            La première exception levée par une étape ; les éléments restants
+            ne sont alors plus traités
+        """
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        remaining = [workers for _, _, workers in self.stages]
+        errors = []
+        stop = threading.Event()
+
+        def feed():
+            try:
+                for item in items:
+                    if stop.is_set():
+                        break
+                    queues[0].put(item)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            for _ in range(self.stages[0][2]):
+                queues[0].put(_DONE)
+
+        def work(index):
+            name, function, _ = self.stages[index]
+            source, sink = queues[index], queues[index + 1]
+            while True:
+                item = source.get()
+                if item is _DONE:
+                    break
+                if stop.is_set():
+                    # Vidange sans traitement après une erreur
+                    continue
+                start = time.perf_counter()
+                try:
+                    item = function(item)
+                except BaseException as e:
+                    errors.append(e)
+                    stop.set()
+                    continue
+                finally:
+                    with self._lock:
+                        self.busy[name] += time.perf_counter() - start
+                sink.put(item)
+            # Le dernier thread de l'étape propage la fin de flux
+            with self._lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last:
+                following = self.stages[index + 1][2] if index + 1 < len(self.stages) else 1
+                for _ in range(following):
+                    sink.put(_DONE)
+
+        threads = [threading.Thread(target=feed, name='pipeline-feed', daemon=True)]
+        for index, (name, _, workers) in enumerate(self.stages):
+            threads += [threading.Thread(target=work, args=(index,), daemon=True,
+                                         name=f'pipeline-{name}-{n}')
+                        for n in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        results = queues[-1]
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            if stop.is_set():
+                continue
+            try:
+                if on_result:
+                    on_result(item)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def bottleneck(self):
+        """Nom de l'étape la plus coûteuse par thread"""
+        return max(self.stages, key=lambda stage: self.busy[stage[0]] / stage[2])[0]
@@ -0,0 +1,308 @@
+"""
+Planification d'une chaîne de filtres avec recadrage et redimensionnement
+La chaîne demandée se lit « filtres, puis recadrage, puis redimensionnement ».
+Le planificateur simplifie la chaîne (miroirs annulés par paires et appliqués
+comme des vues, négatifs consécutifs supprimés) puis avance le recadrage et la
+réduction devant les filtres avec lesquels ils commutent : les filtres ne
+traitent plus que les pixels conservés.
+"""
+
+import numpy as np
+from PIL import Image
+
+from image_processing import (ImageProcessor, apply_filter, is_array_path, load_array,
+                              normalize_mode)
+from filter_chain import compile_chain, normalize_chain
+from filter_registry import COLOR_MATRIX, GEOMETRIC, POINTWISE, filters_of_kind
+from instrumentation import tracer
+# Types d'arguments définis sans import lourd, réexportés pour les outils
+from cli import RESAMPLE_CHOICES, parse_box, parse_size
+
+
+# Filtres de rééchantillonnage, par nom CLI
+RESAMPLE_FILTERS = {name: Image.Resampling[name.upper()] for name in RESAMPLE_CHOICES}
+
+# Filtres ponctuels sans statistique globale : ils commutent exactement avec
+# un recadrage et avec un redimensionnement au plus proche voisin
+LOCAL_FILTERS = filters_of_kind(POINTWISE, COLOR_MATRIX)
+
+MIRRORS = filters_of_kind(GEOMETRIC)
+
+# Filtres de rééchantillonnage à noyau positif (pas de dépassement à écrêter)
+_POSITIVE_KERNELS = ('box', 'bilinear')
+
+
+def target_size(size, width, height):
+    """Résout une taille partielle (voir parse_size) pour une image donnée"""
+    target_width, target_height = size
+    if target_width is None:
+        target_width = max(1, round(width * target_height / height))
+    elif target_height is None:
+        target_height = max(1, round(height * target_width / width))
+    return target_width, target_height
+
+
+def simplify_chain(steps):
+    """Simplifie une chaîne sans changer son résultat
+
+    Les miroirs commutent avec tous les filtres (les statistiques d'une image
+    ne dépendent pas de son orientation) : ils sont retirés de la chaîne et
+    cumulés. Deux négatifs consécutifs s'annulent, un écrêtage ou une
+    postérisation répétés à l'identique n'ont plus d'effet.
+
+    Args:
+        steps: Séquence de noms ou de tuples (nom, paramètre)
+
+    Returns:
+        Tuple (liste de tuples (nom, paramètre) sans miroir, miroir vertical,
+        miroir horizontal)
+    """
+    simplified = []
+    flip_v = flip_h = False
+    for name, param in normalize_chain(steps):
+        if name == 'mirror-v':
+            flip_v = not flip_v
+        elif name == 'mirror-h':
+            flip_h = not flip_h
+        elif name == 'negative' and simplified and simplified[-1][0] == 'negative':
+            simplified.pop()
+        elif (name in ('clipping', 'posterization') and simplified
+              and simplified[-1] == (name, param)):
+            continue
+        else:
+            simplified.append((name, param))
+    return simplified, flip_v, flip_h
+
+
+def _commutes_with_resize(step, resample, alpha):
+    """Indique si un filtre peut suivre la réduction plutôt que la précéder
+
+    Au plus proche voisin, tout filtre local commute exactement. Avec un
+    filtre lissant, seules les transformations affines sans écrêtage
+    commutent, à l'arrondi près : le négatif, et avec un noyau positif le noir
+    et blanc et la désaturation (combinaisons convexes des canaux). PIL
+    prémultipliant l'alpha avant de lisser, rien ne commute alors en présence
+    de transparence.
+    """
+    name, param = step
+    if resample == 'nearest':
+        return name in LOCAL_FILTERS
+    if alpha:
+        return False
+    if name == 'negative':
+        return True
+    if resample in _POSITIVE_KERNELS:
+        return name == 'bw' or (name == 'desaturation' and 0 <= param <= 1)
+    return False
+
+
+class Plan:
+    """Étapes d'exécution produites par plan_chain
+
+    Chaque étape est un tuple (type, valeur) :
+        ('filters', liste de tuples (nom, paramètre))
+        ('crop', (x, y, largeur, hauteur))
+        ('flip', (vertical, horizontal))
+        ('resize', ((largeur, hauteur), nom du filtre de rééchantillonnage))
+    """
+
+    def __init__(self, stages, legacy=False, draft=None):
+        self.stages = stages
+        # Filtre seul : appliqué par ImageProcessor, comme apply_chain
+        self.legacy = legacy
+        # Taille minimale demandée au décodeur JPEG (mode brouillon), ou None
+        self.draft = draft
+
+    def __repr__(self):
+        return f"Plan({self.stages!r}, legacy={self.legacy}, draft={self.draft})"
+
+
+def plan_chain(steps, image_size, crop=None, size=None, resample='bicubic', alpha=False,
+               normalized=True, fast_resize=False):
+    """Planifie une chaîne suivie d'un recadrage et d'un redimensionnement
+
+    Le recadrage passe devant tous les filtres locaux et les miroirs (sa zone
+    est alors retournée) ; il reste derrière les filtres dépendant des
+    statistiques de l'image entière (contraste, auto-level, auto-threshold).
+    Une réduction passe ensuite devant les filtres qui commutent avec elle
+    (voir _commutes_with_resize) ; un agrandissement reste en fin de chaîne.
+
+    Args:
+        steps: Séquence de noms ou de tuples (nom, paramètre)
+        image_size: Taille (largeur, hauteur) de l'image source
+        crop: Zone (x, y, largeur, hauteur) à conserver, ou None
+        size: Taille de sortie (voir parse_size), ou None
+        resample: Nom du filtre de rééchantillonnage (voir RESAMPLE_FILTERS)
+        alpha: L'image source comporte de la transparence
+        normalized: L'image source est en L, RGB ou RGBA ; sinon un filtre
+            seul, dont le mode de sortie dépend de celui de son entrée, reste
+            devant la réduction (qui convertit l'image)
+        fast_resize: Autorise le décodage JPEG en mode brouillon lorsque la
+            réduction arrive en tête de plan (résultat approché, voir apply_plan)
+
+    Returns:
+        Un objet Plan
+    """
+    if resample not in RESAMPLE_FILTERS:
+        raise ValueError(f"Rééchantillonnage inconnu : {resample}")
+    legacy = len(steps) == 1
+    if legacy:
+        # Un filtre seul n'est pas compilé : il n'y a rien à simplifier
+        filters, flip_v, flip_h = normalize_chain(steps), False, False
+    else:
+        filters, flip_v, flip_h = simplify_chain(steps)
+    width, height = image_size
+
+    stages = []
+    crop_at = 0
+    if crop is not None:
+        x, y, crop_width, crop_height = crop
+        if x + crop_width > width or y + crop_height > height:
+            raise ValueError(f"Zone de recadrage hors de l'image ({width}x{height}) : {crop}")
+        crop_at = len(filters)
+        while crop_at > 0 and filters[crop_at - 1][0] in LOCAL_FILTERS + MIRRORS:
+            crop_at -= 1
+        # Les miroirs appliqués après le recadrage retournent la zone à prélever
+        names = [name for name, _ in filters[crop_at:]]
+        if flip_v != (names.count('mirror-v') % 2 == 1):
+            y = height - y - crop_height
+        if flip_h != (names.count('mirror-h') % 2 == 1):
+            x = width - x - crop_width
+        width, height = crop_width, crop_height
+        stages += [('filters', filters[:crop_at]), ('crop', (x, y, crop_width, crop_height))]
+
+    resize_at = len(filters)
+    target = None
+    if size is not None:
+        target = target_size(size, width, height)
+        if target[0] * target[1] < width * height and (normalized or not legacy):
+            while (resize_at > crop_at
+                   and _commutes_with_resize(filters[resize_at - 1], resample, alpha)):
+                resize_at -= 1
+    # Les coupures tombent après un filtre statistique, une LUT ou une matrice
+    # écrêtée : les noyaux compilés de chaque segment sont ceux de la chaîne
+    stages.append(('filters', filters[crop_at:resize_at]))
+    if flip_v or flip_h:
+        stages.append(('flip', (flip_v, flip_h)))
+    draft = None
+    if target is not None:
+        stages += [('resize', (target, resample)), ('filters', filters[resize_at:])]
+        if fast_resize and crop is None and resize_at == 0 and resample != 'nearest':
+            draft = target
+    return Plan([stage for stage in stages if stage[0] != 'filters' or stage[1]],
+                legacy, draft)
+
+
+def _as_array(current):
+    if isinstance(current, np.ndarray):
+        return current
+    return np.asarray(normalize_mode(current))
+
+
+def _as_image(current):
+    if isinstance(current, np.ndarray):
+        return Image.fromarray(current)
+    return current
+
+
+def execute_plan(plan, image, precision='float64', workers=1):
+    """Exécute un plan sur une image PIL ouverte ou un tableau uint8
+
+    Les recadrages et miroirs sur tableaux sont des vues, sans copie.
+
+    Args:
+        plan: Objet Plan
+        image: Image PIL source, ou tableau L, RGB ou RGBA (voir load_array)
+        precision: Précision d'ImageProcessor pour un filtre seul
+        workers: Nombre de threads d'ImageProcessor pour un filtre seul
+
+    Returns:
+        L'image PIL résultante
+    """
+    current = image
+    for kind, value in plan.stages:
+        with tracer.span(f'plan.{kind}') as span:
+            if kind == 'filters' and plan.legacy:
+                name, param = value[0]
+                if isinstance(current, np.ndarray):
+                    processor = ImageProcessor.from_array(current, precision, workers)
+                else:
+                    processor = ImageProcessor.from_image(current, precision, workers)
+                current = apply_filter(processor, name, param)
+            elif kind == 'filters':
+                current = compile_chain(value).run(_as_array(current))
+            elif kind == 'crop':
+                x, y, width, height = value
+                if isinstance(current, np.ndarray):
+                    current = current[y:y + height, x:x + width]
+                else:
+                    current = current.crop((x, y, x + width, y + height))
+            elif kind == 'flip':
+                current = _as_array(current)
+                if value[0]:
+                    current = np.flipud(current)
+                if value[1]:
+                    current = np.fliplr(current)
+            else:
+                target, resample = value
+                current = normalize_mode(_as_image(current)).resize(
+                    target, RESAMPLE_FILTERS[resample])
+            span.set(shape=[current.height, current.width] if isinstance(current, Image.Image)
+                     else list(current.shape))
+    if plan.legacy:
+        return _as_image(current)
+    # Comme une chaîne compilée, le résultat est en L, RGB ou RGBA
+    return normalize_mode(_as_image(current))
+
+
+def apply_plan(image_path, steps, precision='float64', workers=1, crop=None, size=None,
+               resample='bicubic', fast_resize=False):
+    """Applique une chaîne de filtres, un recadrage et un redimensionnement
+
+    Le résultat est celui de apply_chain suivi du recadrage puis du
+    redimensionnement : identique au pixel près pour le recadrage et le plus
+    proche voisin, à l'arrondi près (une ou deux unités) pour un filtre
+    lissant. Avec fast_resize, une réduction placée en tête de plan décode
+    les JPEG en mode brouillon (réduction DCT par 2, 4 ou 8) à au moins deux
+    fois la taille cible : bien plus rapide, mais le résultat s'écarte alors
+    du décodage complet de quelques unités (jusqu'à cinq sur une photo bruitée). Un fichier
+    .npy ou .raw est projeté en mémoire, sans décodage.
+
+    Args:
+        image_path: Chemin vers l'image à traiter
+        steps: Liste de tuples (nom, paramètre)
+        precision: Précision d'ImageProcessor pour un filtre seul
+        workers: Nombre de threads d'ImageProcessor pour un filtre seul
+        crop: Zone (x, y, largeur, hauteur) à conserver, ou None
+        size: Taille de sortie (voir parse_size), ou None
+        resample: Nom du filtre de rééchantillonnage (voir RESAMPLE_FILTERS)
+        fast_resize: Décode les JPEG en mode brouillon avant une réduction
+
+    Returns:
+        L'image PIL résultante
+    """
+    if is_array_path(image_path):
+        pixels = load_array(image_path)
+        height, width = pixels.shape[:2]
+        plan = plan_chain(steps, (width, height), crop, size, resample,
+                          pixels.ndim == 3 and pixels.shape[2] == 4)
+        result = execute_plan(plan, pixels, precision, workers)
+        if all(kind in ('crop', 'flip') for kind, _ in plan.stages):
+            # Le résultat peut encore partager la projection du fichier
+            result = result.copy()
+        return result
+    with tracer.span('open', path=image_path) as span:
+        image = Image.open(image_path)
+        span.set(format=image.format)
+    with image:
+        alpha = 'A' in image.mode or 'transparency' in image.info
+        plan = plan_chain(steps, image.size, crop, size, resample, alpha,
+                          image.mode in ('L', 'RGB', 'RGBA'), fast_resize)
+        if plan.draft is not None and image.format == 'JPEG':
+            with tracer.span('draft') as span:
+                image.draft(None, (2 * plan.draft[0], 2 * plan.draft[1]))
+                span.set(width=image.width, height=image.height)
+        result = execute_plan(plan, image, precision, workers)
+        # Le résultat peut encore dépendre du fichier (recadrage paresseux)
+        result.load()
+    return result
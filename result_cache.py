@@ -0,0 +1,250 @@
+"""
+Cache de résultats sur disque, adressé par le contenu
+La clé est l'empreinte SHA-256 des octets de l'image source, de la chaîne de
+filtres normalisée et des options de sortie : un résultat déjà calculé est
+recopié (ou lié) sans décoder l'image.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from image_processing import save_output
+from filter_chain import normalize_chain
+from instrumentation import tracer, image_attrs
+
+
+# Budget disque par défaut du cache (octets)
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# À incrémenter lorsqu'un filtre change de résultat, pour invalider le cache
+CACHE_VERSION = 1
+
+# Taille des blocs lus pour l'empreinte du fichier source
+_HASH_BLOCK = 1024 * 1024
+
+# Après éviction, le cache est ramené à cette fraction de son budget ; un
+# processus relit la taille réelle dès qu'il a écrit le reste du budget
+EVICT_RATIO = 0.9
+
+# Taille des caches connue de ce processus, par répertoire : {'bytes': taille
+# estimée, 'written': octets écrits depuis le dernier parcours}. Tenue au
+# niveau du module, elle survit aux copies d'un ResultCache envoyées aux
+# processus de travail.
+_known_sizes = {}
+_known_sizes_lock = threading.Lock()
+
+
+class ResultCache:
+    """Cache de résultats partagé entre processus
+
+    Les écritures passent par un fichier temporaire renommé atomiquement, ce qui
+    permet à plusieurs processus d'utiliser le même répertoire. L'éviction
+    supprime les entrées les moins récemment utilisées au-delà du budget.
+
+    La taille du cache est lue une fois par processus puis tenue à jour en
+    mémoire : le répertoire n'est parcouru à nouveau que lorsque le budget est
+    dépassé, ou après l'écriture de (1 - EVICT_RATIO) du budget pour prendre
+    en compte les autres processus. Le dépassement du budget reste ainsi
+    borné à cette part par processus.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, link=False):
+        """Initialise le cache
+
+        Args:
+            directory: Répertoire du cache (créé si besoin)
+            max_bytes: Taille maximale du cache sur disque
+            link: Utilise des liens physiques plutôt que des copies ; la sortie
+                ne doit alors pas être modifiée sur place
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.link = link
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._known_size()
+
+    def key(self, input_path, steps, output_path, **options):
+        """Calcule la clé d'un résultat
+
+        Args:
+            input_path: Image source (son contenu est haché, pas son chemin)
+            steps: Chaîne de filtres
+            output_path: Fichier de sortie (seule l'extension compte)
+            options: Options influençant le résultat (précision, encodeur...)
+
+        Returns:
+            Empreinte hexadécimale
+        """
+        digest = hashlib.sha256()
+        with open(input_path, 'rb') as f:
+            for block in iter(lambda: f.read(_HASH_BLOCK), b''):
+                digest.update(block)
+        recipe = {
+            'version': CACHE_VERSION,
+            'chain': normalize_chain(steps),
+            'format': os.path.splitext(output_path)[1].lower(),
+            'options': options,
+        }
+        digest.update(json.dumps(recipe, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def fetch(self, key, output_path):
+        """Recopie un résultat mémorisé vers output_path
+
+        Returns:
+            True en cas de succès (hit), False sinon (miss)
+        """
+        entry = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+            if self.link:
+                if os.path.lexists(output_path):
+                    os.remove(output_path)
+                os.link(entry, output_path)
+            else:
+                shutil.copyfile(entry, output_path)
+            # Date de dernière utilisation, pour l'éviction LRU
+            os.utime(entry)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        except OSError:
+            # Lien impossible (autre système de fichiers...) : copie
+            try:
+                shutil.copyfile(entry, output_path)
+            except OSError:
+                self.misses += 1
+                return False
+        self.hits += 1
+        return True
+
+    def store(self, key, result_path):
+        """Mémorise un fichier résultat sous la clé donnée"""
+        entry = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry), suffix='.tmp')
+        os.close(handle)
+        try:
+            shutil.copyfile(result_path, temp_path)
+            size = os.path.getsize(temp_path)
+            try:
+                size -= os.path.getsize(entry)
+            except FileNotFoundError:
+                pass
+            os.replace(temp_path, entry)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        known = self._known_size()
+        with _known_sizes_lock:
+            known['bytes'] += size
+            known['written'] += max(size, 0)
+            full = (known['bytes'] > self.max_bytes
+                    or known['written'] > self.max_bytes * (1 - EVICT_RATIO))
+        if full:
+            self.evict()
+
+    def _known_size(self):
+        """Taille du cache connue de ce processus (un parcours au premier appel)"""
+        directory = os.path.abspath(self.directory)
+        with _known_sizes_lock:
+            known = _known_sizes.get(directory)
+        if known is None:
+            known = {'bytes': self.size(), 'written': 0}
+            with _known_sizes_lock:
+                known = _known_sizes.setdefault(directory, known)
+        return known
+
+    def _entries(self):
+        """Liste (date d'utilisation, taille, chemin) des entrées du cache"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Évincée entre-temps par un autre processus
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self):
+        """Taille totale du cache sur disque"""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Supprime les entrées les moins récemment utilisées au-delà du budget
+
+        Le cache dépassant son budget est ramené à EVICT_RATIO de celui-ci. La
+        taille réelle lue à cette occasion remplace la taille estimée.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            for _, size, path in entries:
+                if total <= self.max_bytes * EVICT_RATIO:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        known = self._known_size()
+        with _known_sizes_lock:
+            known['bytes'] = total
+            known['written'] = 0
+
+    def stats(self):
+        """Compteurs de succès et d'échecs"""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+def process_with_cache(cache, input_path, output_path, steps, render, save_options=None,
+                       **options):
+    """Produit output_path en passant par le cache si celui-ci est fourni
+
+    Args:
+        cache: ResultCache ou None
+        input_path: Image source
+        output_path: Fichier de sortie
+        steps: Chaîne de filtres
+        render: Fonction sans argument retournant l'image PIL résultante
+        save_options: Paramètres d'encodage passés à Image.save (voir
+            image_processing.encoder_options), inclus dans la clé
+        options: Options influençant le résultat (voir ResultCache.key)
+
+    Returns:
+        True si le résultat provient du cache
+    """
+    save_options = save_options or {}
+    if save_options:
+        options['encoder'] = save_options
+    if cache is not None:
+        with tracer.span('cache.fetch') as span:
+            key = cache.key(input_path, steps, output_path, **options)
+            hit = cache.fetch(key, output_path)
+            span.set(hit=hit)
+        if hit:
+            return True
+    result_image = render()
+    with tracer.span('encode', path=output_path, **image_attrs(result_image)):
+        save_output(result_image, output_path, **save_options)
+    if cache is not None:
+        with tracer.span('cache.store'):
+            cache.store(key, output_path)
+    return False
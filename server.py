@@ -0,0 +1,336 @@
+"""
+Service HTTP local de traitement d'images
+Expose les filtres sous forme de chaînes JSON, avec un pool de travail, une
+file d'attente bornée et un cache LRU des images décodées.
+
+Requête :
+    POST /process
+    {"input": "photo.jpg", "output": "sortie.png",
+     "chain": ["negative", "contrast=2.0", {"filter": "sepia"}]}
+
+Sans "output", l'image résultante est renvoyée dans la réponse (format
+"format", PNG par défaut). À la place de "input", "data" peut contenir
+l'image encodée en base64.
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image
+
+from image_processing import normalize_mode
+from filter_registry import check_param, parse_filter_spec
+from filter_chain import compile_chain
+from instrumentation import tracer
+
+
+# Budget mémoire par défaut du cache d'images décodées (octets)
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+# Nombre de requêtes conservées pour le calcul des percentiles de latence
+LATENCY_WINDOW = 1000
+
+# Extensions de sortie et formats PIL correspondants
+OUTPUT_FORMATS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG', '.bmp': 'BMP',
+                  '.tif': 'TIFF', '.tiff': 'TIFF', '.webp': 'WEBP', '.gif': 'GIF'}
+
+CONTENT_TYPES = {'PNG': 'image/png', 'JPEG': 'image/jpeg', 'BMP': 'image/bmp',
+                 'TIFF': 'image/tiff', 'WEBP': 'image/webp', 'GIF': 'image/gif'}
+
+
+class RequestError(Exception):
+    """Requête invalide (réponse 400)"""
+
+
+class DecodedCache:
+    """Cache LRU des images décodées, indexé par l'empreinte de leur contenu"""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, data):
+        """Retourne les pixels (uint8, lecture seule) de l'image encodée `data`"""
+        key = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            pixels = self._entries.get(key)
+            if pixels is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pixels
+            self.misses += 1
+
+        with tracer.span('decode') as span:
+            with Image.open(io.BytesIO(data)) as image:
+                pixels = np.asarray(normalize_mode(image))
+            span.set(bytes=pixels.nbytes, shape=list(pixels.shape))
+        pixels.flags.writeable = False
+
+        with self._lock:
+            if key not in self._entries and pixels.nbytes <= self.max_bytes:
+                self._entries[key] = pixels
+                self.bytes += pixels.nbytes
+                while self.bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.bytes -= evicted.nbytes
+        return pixels
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'bytes': self.bytes}
+
+
+def parse_chain(spec):
+    """Convertit une chaîne JSON en liste de tuples (nom, paramètre)
+
+    Les paramètres sont vérifiés contre les bornes du registre, comme en
+    ligne de commande : une valeur hors bornes donne une réponse 400.
+
+    Raises:
+        RequestError: si la chaîne ou l'une de ses étapes est invalide
+    """
+    if not isinstance(spec, list) or not spec:
+        raise RequestError("'chain' doit être une liste non vide")
+    steps = []
+    for item in spec:
+        try:
+            if isinstance(item, str):
+                steps.append(parse_filter_spec(item))
+            elif isinstance(item, dict) and 'filter' in item:
+                name, _ = parse_filter_spec(item['filter'])
+                param = item.get('param')
+                if param is not None:
+                    param = float(param)
+                    check_param(name, param)
+                steps.append((name, param))
+            else:
+                raise RequestError(f"Étape invalide : {item!r}")
+        except (argparse.ArgumentTypeError, TypeError, ValueError) as e:
+            raise RequestError(str(e))
+    return steps
+
+
+class ProcessingService:
+    """Pool de travail, file bornée et métriques du service"""
+
+    def __init__(self, workers=None, queue_size=None, cache_bytes=DEFAULT_CACHE_BYTES):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = self.workers * 4 if queue_size is None else queue_size
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='worker')
+        # Places disponibles : requêtes en cours + requêtes en attente
+        self.slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self.cache = DecodedCache(cache_bytes)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.errors = 0
+        self.rejected = 0
+
+    def submit(self, request):
+        """Traite une requête dans le pool
+
+        Returns:
+            Le résultat de process(), ou None si la file est pleine
+        """
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            return None
+        start = time.perf_counter()
+        with self.lock:
+            self.pending += 1
+        try:
+            return self.executor.submit(self._run, request).result()
+        except Exception:
+            with self.lock:
+                self.errors += 1
+            raise
+        finally:
+            with self.lock:
+                self.completed += 1
+                self.latencies.append(time.perf_counter() - start)
+            self.slots.release()
+
+    def _run(self, request):
+        with self.lock:
+            self.pending -= 1
+            self.running += 1
+        try:
+            return self.process(request)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def process(self, request):
+        """Applique la chaîne de filtres décrite par la requête
+
+        Returns:
+            Tuple (octets encodés ou None, type de contenu, métadonnées JSON)
+        """
+        steps = parse_chain(request.get('chain'))
+        if 'data' in request:
+            data = base64.b64decode(request['data'])
+        elif 'input' in request:
+            try:
+                with open(request['input'], 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                raise RequestError(f"Lecture impossible : {e}")
+        else:
+            raise RequestError("'input' ou 'data' est requis")
+
+        output = request.get('output')
+        if output:
+            fmt = OUTPUT_FORMATS.get(os.path.splitext(output)[1].lower())
+        else:
+            fmt = str(request.get('format', 'PNG')).upper()
+        if fmt not in CONTENT_TYPES:
+            raise RequestError(f"Format de sortie non géré : {fmt}")
+
+        try:
+            pixels = self.cache.get(data)
+        except OSError as e:
+            raise RequestError(f"Image illisible : {e}")
+        result = Image.fromarray(compile_chain(steps).run(pixels))
+        if fmt == 'JPEG' and result.mode == 'RGBA':
+            result = result.convert('RGB')
+
+        with tracer.span('encode', format=fmt):
+            if output:
+                result.save(output, format=fmt)
+                return None, None, {'output': output, 'width': result.width,
+                                    'height': result.height, 'mode': result.mode}
+            buffer = io.BytesIO()
+            result.save(buffer, format=fmt)
+            return buffer.getvalue(), CONTENT_TYPES[fmt], None
+
+    def metrics(self):
+        """Latences (percentiles), profondeur de file et état du cache"""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            metrics = {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'queue_depth': self.pending,
+                'in_flight': self.running,
+                'completed': self.completed,
+                'errors': self.errors,
+                'rejected': self.rejected,
+            }
+        if latencies:
+            last = len(latencies) - 1
+            metrics['latency_ms'] = {
+                f'p{q}': round(1000 * latencies[min(last, int(q / 100 * len(latencies)))], 3)
+                for q in (50, 90, 99)
+            }
+        metrics['decode_cache'] = self.cache.stats()
+        return metrics
+
+
+class ProcessingHandler(BaseHTTPRequestHandler):
+    """Routes HTTP du service"""
+
+    service = None
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._send(200, self.service.metrics())
+        elif self.path == '/health':
+            self._send(200, {'status': 'ok'})
+        else:
+            self._send(404, {'error': 'Route inconnue'})
+
+    def do_POST(self):
+        if self.path != '/process':
+            self._send(404, {'error': 'Route inconnue'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+            if not isinstance(request, dict):
+                raise RequestError("Le corps doit être un objet JSON")
+            outcome = self.service.submit(request)
+        except (RequestError, ValueError) as e:
+            self._send(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send(500, {'error': f"{type(e).__name__}: {e}"})
+            return
+
+        if outcome is None:
+            # File pleine : le client doit réessayer plus tard
+            self._send(503, {'error': 'Service saturé'}, headers={'Retry-After': '1'})
+            return
+        body, content_type, meta = outcome
+        if body is not None:
+            self._send(200, body, content_type)
+        else:
+            self._send(200, meta)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(host='127.0.0.1', port=8080, workers=None, queue_size=None,
+                  cache_bytes=DEFAULT_CACHE_BYTES):
+    """Crée le serveur HTTP et son service de traitement"""
+    handler = type('Handler', (ProcessingHandler,),
+                   {'service': ProcessingService(workers, queue_size, cache_bytes)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Service HTTP local de traitement d\'images')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Adresse d\'écoute (défaut: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='Port d\'écoute (défaut: 8080)')
+    parser.add_argument('--workers', type=int,
+                        help='Threads de traitement (défaut: nombre de cœurs)')
+    parser.add_argument('--queue-size', type=int,
+                        help='Requêtes en attente avant de répondre 503 (défaut: 4 par thread)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_BYTES // 2**20,
+                        help='Mémoire du cache d\'images décodées, en Mo (défaut: 512)')
+
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.workers, args.queue_size,
+                           args.cache_size * 2**20)
+    print(f"Service en écoute sur http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+"""
+Moteur de traitement par bandes pour les images plus grandes que la mémoire
+La source est lue bande par bande, la chaîne de filtres est appliquée à chaque
+bande et la sortie est écrite au fur et à mesure.
+"""
+
+import argparse
+import os
+import struct
+import tempfile
+import warnings
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from image_processing import create_array, is_array_path, load_array, normalize_mode
+from cli import add_chain_arguments
+from filter_registry import with_last_param
+from filter_chain import compile_chain
+
+
+# Budget mémoire par défaut pour une bande (octets)
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024
+
+# Octets de travail par valeur de pixel (entrée, sortie et temporaires float32)
+BYTES_PER_SAMPLE = 16
+
+# Modes bruts lisibles directement, avec l'ordre des canaux à appliquer
+_RAW_MODES = {
+    ('L', 'L'): None,
+    ('RGB', 'RGB'): None,
+    ('RGBA', 'RGBA'): None,
+    ('RGB', 'BGR'): slice(None, None, -1),
+}
+
+
+def _open_image(path):
+    """Ouvre une image sans la limite de PIL contre les « bombes de décompression »"""
+    limit = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        return Image.open(path)
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+
+
+def _raw_view(image, path):
+    """Projette en mémoire les pixels d'un fichier non compressé
+
+    Fonctionne pour les fichiers dont les données sont stockées brutes et
+    contiguës (PPM/PGM, BMP, TIFF non compressé) ; aucun décodage n'a lieu.
+
+    Returns:
+        Un tableau adossé à numpy.memmap, ou None si le format ne s'y prête pas
+    """
+    width, height = image.size
+    channels = len(image.mode)
+    if not image.tile or (image.mode, image.mode) not in _RAW_MODES:
+        return None
+
+    offset = None
+    next_row = 0
+    for tile in image.tile:
+        decoder, extents, tile_offset, args = tile
+        if not isinstance(args, tuple):
+            args = (args,)
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 and args[1] else width * channels
+        orientation = args[2] if len(args) > 2 else 1
+        x0, y0, x1, y1 = extents
+        if (decoder != 'raw' or (image.mode, rawmode) not in _RAW_MODES
+                or (x0, x1) != (0, width) or y0 != next_row):
+            return None
+        if len(image.tile) > 1 and (orientation != 1 or stride != width * channels):
+            return None
+        if offset is None:
+            offset = tile_offset
+        elif tile_offset != offset + y0 * stride:
+            return None
+        next_row = y1
+    if next_row != height:
+        return None
+
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    if offset + stride * height > buffer.size:
+        return None
+    shape = (height, width, channels) if channels > 1 else (height, width)
+    strides = (stride, channels, 1) if channels > 1 else (stride, 1)
+    view = np.ndarray(shape, dtype=np.uint8, buffer=buffer, offset=offset, strides=strides)
+    if orientation == -1:
+        # Lignes stockées de bas en haut (BMP)
+        view = view[::-1]
+    order = _RAW_MODES[(image.mode, rawmode)]
+    if order is not None:
+        view = view[..., order]
+    return view
+
+
+def open_source(path):
+    """Ouvre une image source sous forme de tableau lisible par bandes
+
+    Les formats non compressés et les tableaux .npy/.raw sont projetés en
+    mémoire sans décodage ; les autres (PNG, JPEG...) sont décodés une fois en
+    uint8 (et non en float64), avec un avertissement : la mémoire de pointe
+    est alors celle de l'image entière.
+
+    Returns:
+        Tableau (H, W) ou (H, W, C) de type uint8
+    """
+    if is_array_path(path):
+        return load_array(path)
+    with _open_image(path) as image:
+        view = _raw_view(image, path)
+        if view is not None:
+            return view
+        pixels = np.asarray(normalize_mode(image))
+        warnings.warn(f"{path} : format {image.format} non lisible par bandes, image décodée "
+                      f"entièrement en mémoire ({pixels.nbytes / 2**20:.1f} Mo)", stacklevel=2)
+        return pixels
+
+
+class _PngWriter:
+    """Encodeur PNG incrémental (filtre Sub, un flux zlib)"""
+
+    COLOR_TYPES = {1: 0, 3: 2, 4: 6}
+
+    def __init__(self, path, width, height, channels, compress_level=6):
+        self.file = open(path, 'wb')
+        self.channels = channels
+        self.compressor = zlib.compressobj(compress_level)
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        header = struct.pack('>IIBBBBB', width, height, 8, self.COLOR_TYPES[channels], 0, 0, 0)
+        self._chunk(b'IHDR', header)
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(kind)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, rows):
+        rows = rows.reshape(rows.shape[0], -1)
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 1  # Filtre Sub : différence avec le pixel de gauche
+        filtered[:, 1:self.channels + 1] = rows[:, :self.channels]
+        np.subtract(rows[:, self.channels:], rows[:, :-self.channels],
+                    out=filtered[:, self.channels + 1:])
+        data = self.compressor.compress(filtered)
+        if data:
+            self._chunk(b'IDAT', data)
+
+    def close(self):
+        self._chunk(b'IDAT', self.compressor.flush())
+        self._chunk(b'IEND', b'')
+        self.file.close()
+
+
+class _NetpbmWriter:
+    """Écriture incrémentale PPM/PGM binaire"""
+
+    def __init__(self, path, width, height, channels):
+        if channels not in (1, 3):
+            raise ValueError("Le format PPM/PGM ne gère pas le canal alpha")
+        self.file = open(path, 'wb')
+        self.file.write(f"{'P5' if channels == 1 else 'P6'}\n{width} {height}\n255\n".encode())
+
+    def write(self, rows):
+        self.file.write(np.ascontiguousarray(rows).tobytes())
+
+    def close(self):
+        self.file.close()
+
+
+class _ArrayWriter:
+    """Écriture directe dans un tableau .npy ou .raw projeté en mémoire"""
+
+    def __init__(self, path, shape):
+        self.array = create_array(path, shape)
+        self.row = 0
+
+    def write(self, rows):
+        self.array[self.row:self.row + rows.shape[0]] = rows
+        self.row += rows.shape[0]
+
+    def close(self):
+        self.array.flush()
+        del self.array
+
+
+class _ScratchWriter:
+    """Assemble la sortie dans un fichier temporaire puis l'encode avec PIL
+
+    Utilisé pour les formats sans encodeur incrémental : PIL copie l'image
+    entière en mémoire pour l'encoder, ce que signale un avertissement.
+    """
+
+    def __init__(self, path, shape, scratch_dir=None):
+        self.path = path
+        self.array = _scratch_array(shape, scratch_dir)
+        self.row = 0
+        warnings.warn(f"{path} : format de sortie sans écriture par bandes, image assemblée "
+                      f"en mémoire pour l'encodage ({self.array.nbytes / 2**20:.1f} Mo)",
+                      stacklevel=3)
+
+    def write(self, rows):
+        self.array[self.row:self.row + rows.shape[0]] = rows
+        self.row += rows.shape[0]
+
+    def close(self):
+        self.array.flush()
+        Image.fromarray(self.array).save(self.path)
+        del self.array
+
+
+def _scratch_array(shape, scratch_dir=None):
+    """Alloue un tableau uint8 adossé à un fichier temporaire (numpy.memmap)
+
+    Le fichier est supprimé immédiatement : il disparaît avec le tableau.
+    """
+    handle, path = tempfile.mkstemp(suffix='.scratch', dir=scratch_dir)
+    os.close(handle)
+    try:
+        return np.memmap(path, dtype=np.uint8, mode='w+', shape=shape)
+    finally:
+        os.remove(path)
+
+
+def _open_writer(path, shape, compress_level=6, scratch_dir=None):
+    height, width = shape[:2]
+    channels = shape[2] if len(shape) == 3 else 1
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.png':
+        return _PngWriter(path, width, height, channels, compress_level)
+    if ext in ('.ppm', '.pgm', '.pnm'):
+        return _NetpbmWriter(path, width, height, channels)
+    if is_array_path(path):
+        return _ArrayWriter(path, shape)
+    return _ScratchWriter(path, shape, scratch_dir)
+
+
+def strip_rows_for(shape, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """Hauteur de bande respectant un budget mémoire donné"""
+    row_samples = int(np.prod(shape[1:]))
+    return max(1, memory_limit // (row_samples * BYTES_PER_SAMPLE))
+
+
+def _plan_segments(kernels):
+    """Découpe les noyaux en segments commençant par un noyau à statistique globale
+
+    Chaque segment correspond à un passage : si son premier noyau a besoin de
+    statistiques (contraste), un passage préalable accumule les histogrammes.
+    """
+    segments = []
+    for kernel in kernels:
+        if not segments or kernel.needs_stats:
+            segments.append([])
+        segments[-1].append(kernel)
+    return segments
+
+
+def _accumulate_histograms(kernel, source, rows):
+    """Statistiques du noyau (histograms()) sur toute la source, bande par bande"""
+    total = None
+    for y0 in range(0, source.shape[0], rows):
+        hist = kernel.histograms(np.asarray(source[y0:y0 + rows]))
+        total = hist if total is None else total + hist
+    return total
+
+
+def _run_segment(segment, source, rows, sink, reverse=False):
+    """Applique un segment de noyaux à la source, bande par bande
+
+    Args:
+        segment: Liste de noyaux
+        source: Tableau source (éventuellement projeté en mémoire)
+        rows: Hauteur des bandes
+        sink: Fonction sink(bande, y0) recevant les bandes résultat
+        reverse: Parcourt les bandes de bas en haut
+    """
+    lut = None
+    first = segment[0] if segment else None
+    if first is not None and first.needs_stats:
+        channels = source.shape[2] if source.ndim == 3 else 1
+        lut = first.resolve_histograms(_accumulate_histograms(first, source, rows),
+                                     channels)
+
+    height = source.shape[0]
+    starts = list(range(0, height, rows))
+    if reverse:
+        starts.reverse()
+    for y0 in starts:
+        band = np.asarray(source[y0:y0 + rows])
+        for index, kernel in enumerate(segment):
+            band = kernel.run(band, lut) if index == 0 and lut is not None else kernel.run(band)
+        sink(band, y0)
+
+
+def stream_process(input_path, output_path, steps, memory_limit=DEFAULT_MEMORY_LIMIT,
+                   scratch_dir=None, compress_level=6):
+    """Applique une chaîne de filtres en streaming
+
+    La mémoire de pointe dépend de la hauteur des bandes, pas de la taille de
+    l'image. Les filtres à statistique globale (contraste) utilisent un plan en
+    deux passes : histogrammes d'abord, application ensuite. Les résultats
+    intermédiaires sont stockés dans des fichiers numpy.memmap temporaires.
+
+    Args:
+        input_path: Image source
+        output_path: Image de sortie (PNG et PPM/PGM écrits de façon incrémentale)
+        steps: Chaîne de filtres, liste de tuples (nom, paramètre)
+        memory_limit: Budget mémoire approximatif par bande, en octets
+        scratch_dir: Répertoire des fichiers temporaires
+        compress_level: Niveau de compression zlib pour le PNG
+
+    Returns:
+        Forme (H, W[, C]) de l'image produite
+    """
+    chain = compile_chain(steps)
+    source = open_source(input_path)
+    segments = _plan_segments(chain.kernels) or [[]]
+
+    # Segments intermédiaires : résultat stocké dans un memmap temporaire
+    for segment in segments[:-1]:
+        rows = strip_rows_for(source.shape, memory_limit)
+        scratch = {}
+
+        def store(band, y0):
+            if 'array' not in scratch:
+                scratch['array'] = _scratch_array((source.shape[0],) + band.shape[1:], scratch_dir)
+            scratch['array'][y0:y0 + band.shape[0]] = band
+
+        _run_segment(segment, source, rows, store)
+        source = scratch['array']
+
+    # Dernier segment : les miroirs sont appliqués en écrivant séquentiellement
+    rows = strip_rows_for(source.shape, memory_limit)
+    writer = {}
+
+    def write(band, y0):
+        if chain.flip_v:
+            band = band[::-1]
+        if chain.flip_h:
+            band = band[:, ::-1]
+        if 'writer' not in writer:
+            writer['shape'] = (source.shape[0],) + band.shape[1:]
+            writer['writer'] = _open_writer(output_path, writer['shape'],
+                                            compress_level, scratch_dir)
+        writer['writer'].write(band)
+
+    _run_segment(segments[-1], source, rows, write, reverse=chain.flip_v)
+    writer['writer'].close()
+    return writer['shape']
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Traitement en streaming des images plus grandes que la mémoire')
+    parser.add_argument('input', help='Chemin de l\'image d\'entrée')
+    parser.add_argument('output', help='Chemin de l\'image de sortie (PNG, PPM/PGM, .npy '
+                                       'ou .raw pour une écriture incrémentale)')
+    add_chain_arguments(parser, geometry=False)
+    parser.add_argument('--memory-limit', type=int, default=DEFAULT_MEMORY_LIMIT // 2**20,
+                        help='Budget mémoire par bande, en Mo (défaut: 64)')
+    parser.add_argument('--scratch-dir', help='Répertoire des fichiers temporaires')
+
+    args = parser.parse_args()
+    try:
+        steps = with_last_param(args.filter, args.param)
+    except ValueError as e:
+        parser.error(str(e))
+    # Les bandes sont écrites par un encodeur propre, réglé par zlib seul
+    if args.quality is not None or args.optimize:
+        parser.error("--quality et --optimize ne s'appliquent pas à l'écriture en streaming")
+    compress_level = 6 if args.compress_level is None else args.compress_level
+
+    if not os.path.exists(args.input):
+        print(f"Erreur: Le fichier {args.input} n'existe pas")
+        return
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        stream_process(args.input, args.output, steps, args.memory_limit * 2**20,
+                       args.scratch_dir, compress_level)
+    for warning in caught:
+        print(f"Attention: {warning.message}")
+    print(f"Image traitée sauvegardée dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
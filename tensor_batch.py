@@ -0,0 +1,108 @@
+"""
+Traitement vectorisé de nombreuses images de même taille
+Les images sont regroupées par forme (hauteur, largeur, canaux) en piles
+(N, H, W, C) ; chaque filtre est appliqué une seule fois à toute la pile, ce qui
+supprime le coût Python par image sur les vignettes et les sprites.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from image_processing import normalize_mode
+from filter_chain import compile_chain
+from instrumentation import tracer
+
+
+# Nombre maximal d'images par pile
+DEFAULT_BATCH_SIZE = 256
+
+
+def size_buckets(arrays):
+    """Regroupe des tableaux par forme
+
+    Returns:
+        Dictionnaire ordonné {forme: liste des indices des tableaux}
+    """
+    buckets = OrderedDict()
+    for index, pixels in enumerate(arrays):
+        buckets.setdefault(pixels.shape, []).append(index)
+    return buckets
+
+
+class TensorBatchProcessor:
+    """Applique une chaîne de filtres à des piles d'images
+
+    Les calculs se font en uint8 comme pour une chaîne compilée ; le contraste
+    utilise la moyenne propre à chaque image et le miroir vertical retourne
+    chaque image, les résultats sont donc identiques au traitement image par
+    image.
+    """
+
+    def __init__(self, steps, batch_size=DEFAULT_BATCH_SIZE):
+        """Initialise le processeur
+
+        Args:
+            steps: Chaîne de filtres, liste de noms ou de tuples (nom, paramètre)
+            batch_size: Nombre maximal d'images par pile
+        """
+        self.chain = compile_chain(steps)
+        self.batch_size = max(1, int(batch_size))
+
+    def process_stack(self, stack):
+        """Applique la chaîne à une pile (N, H, W[, C]) et retourne la pile résultante"""
+        with tracer.span('tensor.process', images=len(stack)) as span:
+            result = self.chain.run_stack(stack)
+            span.set(bytes=result.nbytes)
+        return result
+
+    def process_arrays(self, arrays):
+        """Applique la chaîne à des tableaux uint8 de tailles quelconques
+
+        Args:
+            arrays: Séquence de tableaux (H, W) ou (H, W, C)
+
+        Returns:
+            Liste des tableaux résultants, dans l'ordre d'entrée
+        """
+        results = [None] * len(arrays)
+        for indices in size_buckets(arrays).values():
+            for start in range(0, len(indices), self.batch_size):
+                chunk = indices[start:start + self.batch_size]
+                stack = self.process_stack(np.stack([arrays[i] for i in chunk]))
+                for i, pixels in zip(chunk, stack):
+                    results[i] = pixels
+        return results
+
+    def process_images(self, images):
+        """Applique la chaîne à des images PIL
+
+        Returns:
+            Liste des images PIL résultantes, dans l'ordre d'entrée
+        """
+        arrays = [np.asarray(normalize_mode(image)) for image in images]
+        return [Image.fromarray(pixels) for pixels in self.process_arrays(arrays)]
+
+    def process_stream(self, items):
+        """Traite un flux d'images en ne gardant en mémoire que les piles en cours
+
+        Chaque image rejoint la pile de sa forme ; une pile est traitée dès
+        qu'elle atteint batch_size, les piles incomplètes à la fin du flux.
+
+        Args:
+            items: Itérable de tuples (clé, tableau uint8)
+
+        Yields:
+            Tuples (clé, tableau résultant), dans l'ordre de traitement des piles
+        """
+        buckets = OrderedDict()
+        for key, pixels in items:
+            keys, arrays = buckets.setdefault(pixels.shape, ([], []))
+            keys.append(key)
+            arrays.append(pixels)
+            if len(arrays) >= self.batch_size:
+                del buckets[pixels.shape]
+                yield from zip(keys, self.process_stack(np.stack(arrays)))
+        for keys, arrays in buckets.values():
+            yield from zip(keys, self.process_stack(np.stack(arrays)))
@@ -0,0 +1,35 @@
+"""
+Configuration commune des tests
+Les modules de l'application sont au premier niveau du dépôt ; les images de
+test sont synthétiques (aléatoires et reproductibles).
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Tailles impaires : bandes et bandes de travail de hauteurs inégales
+SHAPES = {'L': (67, 45), 'RGB': (67, 45, 3), 'RGBA': (53, 71, 4)}
+
+
+def random_image(mode, seed=0):
+    """Image PIL aléatoire en mode L, RGB ou RGBA"""
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, SHAPES[mode], dtype=np.uint8), mode)
+
+
+@pytest.fixture(params=sorted(SHAPES))
+def image(request):
+    """Image aléatoire, dans chacun des modes pris en charge"""
+    return random_image(request.param)
+
+
+@pytest.fixture
+def rgb_image():
+    return random_image('RGB')
@@ -0,0 +1,109 @@
+"""
+Tests des animations et TIFF multipages (animation.py)
+Référence : la chaîne compilée appliquée à chaque image séparément.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from animation import iter_frames, main, process_animation
+from filter_chain import compile_chain
+
+DURATIONS = [40, 80, 120, 160]
+DISPOSALS = [0, 1, 2, 1]
+
+
+def make_frames():
+    """Quatre images unies de couleurs distinctes (sans perte en GIF)"""
+    rng = np.random.default_rng(0)
+    colors = rng.integers(0, 256, (4, 3), dtype=np.uint8)
+    return [Image.fromarray(np.full((10, 12, 3), color, np.uint8)) for color in colors]
+
+
+def save_animation(path, frames):
+    if path.endswith('.tif'):
+        frames[0].save(path, save_all=True, append_images=frames[1:])
+    else:
+        frames[0].save(path, save_all=True, append_images=frames[1:], duration=DURATIONS,
+                       disposal=DISPOSALS, loop=2)
+
+
+def read_animation(path):
+    """Images RGB, durées et modes de disposition de chaque image d'un fichier"""
+    pixels, durations, disposals = [], [], []
+    with Image.open(path) as image:
+        for index in range(image.n_frames):
+            image.seek(index)
+            image.load()
+            pixels.append(np.asarray(image.convert('RGB')))
+            durations.append(image.info.get('duration'))
+            disposal = getattr(image, 'disposal_method', None)
+            disposals.append(image.info.get('disposal') if disposal is None else disposal)
+        loop = image.info.get('loop')
+    return pixels, durations, disposals, loop
+
+
+STEPS = [('negative', None), ('contrast', 1.4), ('mirror-h', None)]
+
+
+@pytest.mark.parametrize('batch_size', [1, 3, 8])
+@pytest.mark.parametrize('ext', ['.gif', '.png', '.tif'])
+def test_round_trip_keeps_every_frame(tmp_path, ext, batch_size):
+    frames = make_frames()
+    source, output = str(tmp_path / f'in{ext}'), str(tmp_path / f'out{ext}')
+    save_animation(source, frames)
+    assert process_animation(source, output, STEPS, batch_size) == len(frames)
+
+    pixels, durations, disposals, loop = read_animation(output)
+    assert len(pixels) == len(frames)
+    chain = compile_chain(STEPS)
+    for frame, result in zip(frames, pixels):
+        assert np.array_equal(result, chain.run(np.asarray(frame)))
+    if ext != '.tif':
+        assert [int(d) for d in durations] == DURATIONS
+        assert disposals == DISPOSALS
+        assert loop == 2
+
+
+def test_webp_keeps_durations(tmp_path):
+    source, output = str(tmp_path / 'in.gif'), str(tmp_path / 'out.webp')
+    save_animation(source, make_frames())
+    assert process_animation(source, output, [('sepia', None)], lossless=True) == 4
+    pixels, durations, _, loop = read_animation(output)
+    assert len(pixels) == 4 and durations == DURATIONS and loop == 2
+
+
+def test_disposal_not_copied_across_formats(tmp_path):
+    """Les codes de disposition GIF et APNG diffèrent : ils ne sont pas recopiés"""
+    source, output = str(tmp_path / 'in.gif'), str(tmp_path / 'out.png')
+    save_animation(source, make_frames())
+    process_animation(source, output, [('negative', None)])
+    _, durations, disposals, _ = read_animation(output)
+    assert [int(d) for d in durations] == DURATIONS
+    assert set(disposals) == {0}
+
+
+def test_iter_frames_reports_metadata(tmp_path):
+    source = str(tmp_path / 'in.gif')
+    save_animation(source, make_frames())
+    infos = [info for _, info in iter_frames(source)]
+    assert [info['duration'] for info in infos] == DURATIONS
+    assert [info['disposal'] for info in infos] == DISPOSALS
+
+
+def test_main_applies_encoder_options(tmp_path, monkeypatch):
+    source = str(tmp_path / 'in.gif')
+    save_animation(source, make_frames())
+    sizes = []
+    for level in ('0', '9'):
+        output = str(tmp_path / f'out{level}.png')
+        monkeypatch.setattr(sys, 'argv', ['animation.py', source, output, '--filter', 'negative',
+                                          '--compress-level', level])
+        main()
+        assert len(read_animation(output)[0]) == 4
+        sizes.append(os.path.getsize(output))
+    assert sizes[0] > sizes[1]
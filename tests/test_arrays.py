@@ -0,0 +1,72 @@
+"""
+Tests des fichiers intermédiaires .npy et .raw
+"""
+
+import numpy as np
+import pytest
+
+from filter_chain import apply_chain
+from image_processing import (FILTER_CHOICES, ImageProcessor, apply_filter, image_size,
+                              load_array, save_array, save_output)
+
+
+@pytest.fixture(params=['.npy', '.raw'])
+def ext(request):
+    return request.param
+
+
+def test_round_trip_is_mapped(tmp_path, image, ext):
+    path = str(tmp_path / f'image{ext}')
+    save_output(image, path)
+    pixels = load_array(path)
+    assert isinstance(pixels, np.memmap) or isinstance(pixels.base, np.memmap)
+    assert not pixels.flags.writeable
+    assert np.array_equal(pixels, np.asarray(image))
+    assert image_size(path) == image.size
+
+
+def test_binary_image_saved_as_levels(tmp_path, ext):
+    path = str(tmp_path / f'mask{ext}')
+    save_array(np.array([[True, False], [False, True]]), path)
+    assert np.array_equal(load_array(path), [[255, 0], [0, 255]])
+
+
+def test_invalid_raw_file(tmp_path):
+    path = tmp_path / 'bad.raw'
+    path.write_bytes(b'not an array')
+    with pytest.raises(ValueError):
+        load_array(str(path))
+
+
+def test_invalid_npy_dtype(tmp_path):
+    path = str(tmp_path / 'bad.npy')
+    np.save(path, np.zeros((4, 4), dtype=np.float32))
+    with pytest.raises(ValueError):
+        load_array(path)
+
+
+@pytest.mark.parametrize('precision', ['float64', 'native'])
+@pytest.mark.parametrize('name', FILTER_CHOICES)
+def test_from_array_matches_decoded_image(tmp_path, image, ext, precision, name):
+    path = str(tmp_path / f'image{ext}')
+    save_output(image, path)
+    expected = apply_filter(ImageProcessor.from_image(image, precision, 1), name, None)
+    result = apply_filter(ImageProcessor(path, precision), name, None)
+    assert result.mode == expected.mode
+    assert np.array_equal(np.asarray(result), np.asarray(expected))
+
+
+@pytest.mark.parametrize('steps', [
+    [('negative', None), ('contrast', 1.8), ('mirror-h', None)],
+    [('bw', None), ('auto-level', 1.0)],
+])
+def test_chain_through_array_matches_png(tmp_path, image, ext, steps):
+    """Une étape intermédiaire en .npy/.raw donne le même résultat qu'en PNG"""
+    source = str(tmp_path / 'image.png')
+    image.save(source)
+    first = apply_chain(source, steps[:1])
+    paths = [str(tmp_path / 'step.png'), str(tmp_path / f'step{ext}')]
+    for path in paths:
+        save_output(first, path)
+    expected, result = (apply_chain(path, steps[1:]) for path in paths)
+    assert np.array_equal(np.asarray(result), np.asarray(expected))
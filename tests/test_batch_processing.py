@@ -0,0 +1,189 @@
+"""
+Tests du traitement par lots (batch_processing.py, pipeline.py)
+Référence : apply_filter par ImageProcessor en float64, fichier par fichier ;
+run_batch pour le pipeline, dont les fichiers produits doivent être identiques.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from batch_processing import collect_inputs, main, run_batch, run_pipeline_batch
+from conftest import random_image
+from image_processing import ImageProcessor, apply_filter
+from pipeline import Pipeline
+
+
+def make_tree(root, names):
+    for index, name in enumerate(names):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        random_image('RGB', seed=index).save(path)
+
+
+def test_recursive_glob_keeps_path_under_pattern_root(tmp_path):
+    make_tree(tmp_path, ['scans/a/photo.png', 'scans/b/photo.png', 'scans/top.png'])
+    out = tmp_path / 'out'
+    tasks = collect_inputs([str(tmp_path / 'scans' / '**' / '*.png')], str(out), recursive=True)
+    outputs = sorted(os.path.relpath(output, out) for _, output in tasks)
+    assert outputs == [os.path.join('a', 'photo.png'), os.path.join('b', 'photo.png'), 'top.png']
+
+
+def test_flat_glob_and_file_write_to_output_dir(tmp_path):
+    make_tree(tmp_path, ['scans/x.png', 'single/y.png'])
+    out = str(tmp_path / 'out')
+    tasks = collect_inputs([str(tmp_path / 'scans' / '*.png'),
+                            str(tmp_path / 'single' / 'y.png')], out)
+    assert [output for _, output in tasks] == [os.path.join(out, 'x.png'),
+                                               os.path.join(out, 'y.png')]
+
+
+def test_colliding_outputs_are_rejected(tmp_path):
+    make_tree(tmp_path, ['d1/photo.png', 'd2/photo.png'])
+    with pytest.raises(ValueError, match='même fichier de sortie'):
+        collect_inputs([str(tmp_path / 'd1'), str(tmp_path / 'd2')], str(tmp_path / 'out'))
+    with pytest.raises(ValueError):
+        collect_inputs([str(tmp_path / 'd1'), str(tmp_path / 'd2' / '*.png')],
+                       str(tmp_path / 'out'))
+    tasks = collect_inputs([str(tmp_path / 'd*' / 'photo.png')], str(tmp_path / 'out'))
+    assert len(set(output for _, output in tasks)) == 2
+
+
+def test_same_file_twice_is_kept_once(tmp_path):
+    make_tree(tmp_path, ['in/photo.png'])
+    source = str(tmp_path / 'in' / 'photo.png')
+    assert len(collect_inputs([source, str(tmp_path / 'in')], str(tmp_path / 'out'))) == 1
+
+
+@pytest.mark.parametrize('option', [['--stack', '4'], ['--filter', 'negative']])
+def test_precision_rejected_when_unused(tmp_path, monkeypatch, capsys, option):
+    make_tree(tmp_path, ['in/photo.png'])
+    out = tmp_path / 'out'
+    monkeypatch.setattr(sys, 'argv', ['batch_processing.py', str(tmp_path / 'in'), '-o', str(out),
+                                      '--filter', 'sepia', '--precision', 'native', *option])
+    with pytest.raises(SystemExit):
+        main()
+    assert "qu'à un filtre seul" in capsys.readouterr().err
+    assert not out.exists()
+
+
+@pytest.mark.parametrize('precision', ['float64', 'native'])
+def test_run_batch_matches_apply_filter(tmp_path, precision):
+    make_tree(tmp_path, ['in/a.png', 'in/sub/b.png'])
+    tasks = collect_inputs([str(tmp_path / 'in')], str(tmp_path / 'out'), recursive=True)
+    steps = [('negative', None), ('contrast', 1.5)]
+    results = []
+    run_batch(tasks, steps, workers=2, on_result=results.append, precision=precision)
+    assert len(results) == 2 and all(result['ok'] for result in results)
+    for input_path, output_path in tasks:
+        expected = Image.open(input_path)
+        for name, param in steps:
+            expected = apply_filter(ImageProcessor.from_image(expected, 'float64', 1), name, param)
+        assert np.array_equal(np.asarray(Image.open(output_path)), np.asarray(expected))
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('steps', [[('sepia', None)],
+                                   [('negative', None), ('contrast', 1.5), ('mirror-h', None)],
+                                   [('desaturation', 0.4), ('auto-threshold', None)]])
+def test_pipeline_outputs_match_run_batch(tmp_path, steps):
+    names = [f'in/{index}.png' for index in range(6)] + ['in/sub/photo.jpg']
+    make_tree(tmp_path, names)
+    tasks = collect_inputs([str(tmp_path / 'in')], str(tmp_path / 'batch'), recursive=True)
+    piped = collect_inputs([str(tmp_path / 'in')], str(tmp_path / 'piped'), recursive=True)
+    encoder = {'compress_level': 1, 'quality': 80, 'optimize': False}
+    run_batch(tasks, steps, workers=2, encoder=encoder)
+    summary = run_pipeline_batch(piped, steps, 2, 2, 2, 2, encoder=encoder)
+    assert summary.processed == len(tasks) and not summary.failures
+    assert set(summary.stage_seconds) == {'decode', 'process', 'encode'}
+    for (_, expected), (_, output) in zip(tasks, piped):
+        assert read_bytes(output) == read_bytes(expected)
+
+
+def test_pipeline_reports_each_task_once(tmp_path):
+    make_tree(tmp_path, [f'in/{index:02d}.png' for index in range(12)])
+    (tmp_path / 'in' / 'broken.png').write_bytes(b'pas une image')
+    tasks = collect_inputs([str(tmp_path / 'in')], str(tmp_path / 'out'))
+    outcomes = []
+    summary = run_pipeline_batch(tasks, [('negative', None)], 3, 3, 3, 1,
+                                 on_result=outcomes.append)
+    # Ordre de fin de traitement : chaque tâche est rendue une fois, avec sa sortie
+    assert sorted((o['input'], o['output']) for o in outcomes) == sorted(tasks)
+    failed = [o for o in outcomes if not o['ok']]
+    assert [o['input'] for o in failed] == [str(tmp_path / 'in' / 'broken.png')]
+    assert len(summary.failures) == 1 and summary.processed == len(tasks) - 1
+
+
+def test_pipeline_keeps_order_with_one_thread_per_stage():
+    results = []
+    Pipeline([('double', lambda x: 2 * x, 1), ('shift', lambda x: x + 1, 1)],
+             queue_size=1).run(range(50), results.append)
+    assert results == [2 * x + 1 for x in range(50)]
+
+
+def test_pipeline_results_are_complete_with_many_threads():
+    results = []
+    Pipeline([('slow', lambda x: time.sleep(0.001 * (x % 3)) or x, 4),
+              ('square', lambda x: x * x, 3)], queue_size=2).run(range(60), results.append)
+    assert sorted(results) == [x * x for x in range(60)]
+
+
+def run_with_timeout(pipeline, items, on_result=None):
+    """Exécute le pipeline dans un thread ; échoue s'il ne se termine pas"""
+    outcome = {}
+
+    def target():
+        try:
+            pipeline.run(items, on_result)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive(), "le pipeline est bloqué"
+    return outcome.get('error')
+
+
+def fail_on(value):
+    def stage(x):
+        if x == value:
+            raise RuntimeError(f"échec sur {x}")
+        return x
+    return stage
+
+
+@pytest.mark.parametrize('index', [0, 1, 2])
+def test_raising_stage_stops_pipeline(index):
+    stages = [('a', lambda x: x, 2), ('b', lambda x: x, 3), ('c', lambda x: x, 1)]
+    stages[index] = (stages[index][0], fail_on(5), stages[index][2])
+    seen = []
+    error = run_with_timeout(Pipeline(stages, queue_size=1), range(10000), seen.append)
+    assert isinstance(error, RuntimeError) and str(error) == 'échec sur 5'
+    # Les éléments suivants ne sont plus traités
+    assert len(seen) < 10000
+
+
+def test_raising_consumer_and_source_stop_pipeline():
+    def consumer(x):
+        if x == 3:
+            raise KeyError(x)
+
+    assert isinstance(run_with_timeout(Pipeline([('a', lambda x: x, 2)], queue_size=1),
+                                       range(10000), consumer), KeyError)
+
+    def source():
+        yield from range(20)
+        raise ValueError('source')
+
+    error = run_with_timeout(Pipeline([('a', lambda x: x, 2)], queue_size=1), source())
+    assert isinstance(error, ValueError)
@@ -0,0 +1,118 @@
+"""
+Tests du cache de préfixes de chaînes (chain_cache.py)
+Référence : chaque filtre compilé seul et appliqué à la suite, sans cache.
+"""
+
+import numpy as np
+import pytest
+
+from chain_cache import ChainCache
+from conftest import random_image
+from filter_chain import compile_chain
+from image_processing import ImageProcessor, apply_filter
+
+
+def fresh(pixels, steps):
+    """Évaluation sans cache, filtre par filtre comme ChainCache"""
+    for step in steps:
+        pixels = compile_chain([step]).run(pixels)
+    return pixels
+
+
+@pytest.fixture
+def base():
+    return np.asarray(random_image('RGB'))
+
+
+CHAIN = [('negative', None), ('contrast', 1.5), ('sepia', None)]
+
+
+def test_result_matches_uncached(base):
+    cache = ChainCache(base)
+    assert np.array_equal(cache.evaluate(CHAIN), fresh(base, CHAIN))
+
+
+def test_lut_chain_matches_float64(base):
+    steps = [('negative', None), ('contrast', 1.8), ('posterization', 5)]
+    expected = random_image('RGB')
+    for name, param in steps:
+        expected = apply_filter(ImageProcessor.from_image(expected, 'float64', 1), name, param)
+    assert np.array_equal(ChainCache(base).evaluate(steps), np.asarray(expected))
+
+
+def test_last_step_change_reuses_prefix(base):
+    cache = ChainCache(base)
+    cache.evaluate(CHAIN)
+    assert [seconds is None for _, seconds in cache.last_timings] == [False] * 3
+    steps = CHAIN[:2] + [('posterization', 3)]
+    result = cache.evaluate(steps)
+    assert [name for name, _ in cache.last_timings] == ['negative', 'contrast', 'posterization']
+    assert [seconds is None for _, seconds in cache.last_timings] == [True, True, False]
+    assert cache.last_timings[2][1] >= 0
+    assert np.array_equal(result, fresh(base, steps))
+
+
+def test_middle_change_recomputes_suffix(base):
+    cache = ChainCache(base)
+    first = cache.evaluate(CHAIN).copy()
+    steps = [CHAIN[0], ('contrast', 0.6), CHAIN[2]]
+    result = cache.evaluate(steps)
+    assert [seconds is None for _, seconds in cache.last_timings] == [True, False, False]
+    assert not np.array_equal(result, first)
+    assert np.array_equal(result, fresh(base, steps))
+    # La chaîne d'origine est toujours servie, intacte
+    assert np.array_equal(cache.evaluate(CHAIN), first)
+
+
+def test_full_hit_returns_stored_array(base):
+    cache = ChainCache(base)
+    result = cache.evaluate(CHAIN)
+    hits, misses = cache.hits, cache.misses
+    assert cache.evaluate(CHAIN) is result
+    assert all(seconds is None for _, seconds in cache.last_timings)
+    assert (cache.hits, cache.misses) == (hits + 1, misses)
+    assert not result.flags.writeable
+
+
+def test_statistics_of_a_prefix_per_kernel(base):
+    """Contraste et seuil d'Otsu sur le même préfixe : statistiques distinctes"""
+    cache = ChainCache(base)
+    for steps in ([('negative', None), ('contrast', 1.2)],
+                  [('negative', None), ('auto-threshold', None)],
+                  [('negative', None), ('contrast', 2.0)],
+                  [('negative', None), ('auto-level', 3.0)]):
+        assert np.array_equal(cache.evaluate(steps), fresh(base, steps))
+
+
+def test_lru_eviction_under_budget(base):
+    cache = ChainCache(base, max_bytes=int(2.5 * base.nbytes))
+    steps = [('negative', None), ('posterization', 4), ('mirror-h', None)]
+    cache.evaluate(steps)
+    # Trois préfixes calculés, deux conservés : le plus ancien est évincé
+    assert len(cache) == 2 and cache.bytes == 2 * base.nbytes <= cache.max_bytes
+    cache.evaluate(steps[:2])
+    assert cache.last_timings[1][1] is None
+    cache.evaluate(steps[:1])
+    assert cache.last_timings[0][1] is not None
+    # steps[:2] vient d'être relu : c'est steps[:3] qui a été évincé
+    cache.evaluate(steps[:2])
+    assert all(seconds is None for _, seconds in cache.last_timings)
+    cache.evaluate(steps)
+    assert [seconds is None for _, seconds in cache.last_timings] == [True, True, False]
+    assert cache.bytes <= cache.max_bytes
+
+
+def test_oversized_result_is_not_stored(base):
+    cache = ChainCache(base, max_bytes=base.nbytes // 2)
+    result = cache.evaluate(CHAIN)
+    assert len(cache) == 0 and cache.bytes == 0
+    assert np.array_equal(result, fresh(base, CHAIN))
+
+
+def test_clear(base):
+    cache = ChainCache(base)
+    cache.evaluate(CHAIN)
+    cache.clear()
+    assert len(cache) == 0 and cache.bytes == 0
+    cache.evaluate(CHAIN)
+    assert all(seconds is not None for _, seconds in cache.last_timings)
@@ -0,0 +1,213 @@
+"""
+Tests du registre des filtres et de la ligne de commande
+"""
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from cli import build_parser, main, parse_box, parse_size
+from filter_registry import (FILTER_CHOICES, FILTER_DEFAULTS, FILTERS, describe_filters,
+                             get_filter, normalize_chain, with_last_param)
+from image_processing import ImageProcessor, apply_filter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse(*args):
+    return build_parser().parse_args(['in.png', 'out.png', *args])
+
+
+@pytest.mark.parametrize('name', FILTER_CHOICES)
+def test_every_registered_filter_is_accepted(name):
+    args = parse('--filter', name)
+    assert args.filter == [(name, None)]
+    assert callable(getattr(ImageProcessor, get_filter(name).method))
+
+
+def test_unknown_filter_is_rejected(capsys):
+    with pytest.raises(SystemExit):
+        parse('--filter', 'blur')
+    assert 'filtre inconnu' in capsys.readouterr().err
+
+
+def test_chain_and_last_param():
+    args = parse('--filter', 'contrast=2', '--filter', 'threshold', '--param', '90')
+    assert with_last_param(args.filter, args.param) == [('contrast', 2.0), ('threshold', 90.0)]
+
+
+def test_gui_names_and_defaults():
+    assert get_filter('mirror_v') is FILTERS['mirror-v']
+    steps = normalize_chain(['auto_level', ('posterization', 6.0), 'threshold', 'bw'])
+    assert steps == [('auto-level', FILTER_DEFAULTS['auto-level']), ('posterization', 6),
+                     ('threshold', 128), ('bw', None)]
+    assert isinstance(steps[1][1], int)
+    with pytest.raises(ValueError):
+        get_filter('blur')
+
+
+@pytest.mark.parametrize('name', FILTER_CHOICES)
+def test_apply_filter_uses_registered_method(image, name):
+    """apply_filter = méthode déclarée, avec le paramètre par défaut du registre"""
+    spec = get_filter(name)
+    expected = getattr(ImageProcessor.from_image(image, 'float64', 1), spec.method)(
+        *([spec.param.default] if spec.param else []))
+    result = apply_filter(ImageProcessor.from_image(image, 'float64', 1), name, None)
+    assert np.array_equal(np.asarray(result), np.asarray(expected))
+
+
+def test_geometry_arguments():
+    assert parse_size('400x') == (400, None)
+    assert parse_box('1,2,30,40') == (1, 2, 30, 40)
+    args = parse('--filter', 'bw', '--resize', 'x50', '--crop', '0,0,10,10')
+    assert args.resize == (None, 50) and args.crop == (0, 0, 10, 10)
+
+
+def test_list_filters(capsys):
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(['--list-filters'])
+    listing = capsys.readouterr().out
+    assert listing.strip() == describe_filters()
+    for name, spec in FILTERS.items():
+        assert name in listing and spec.kind in listing
+
+
+def test_parsing_does_not_import_numpy():
+    code = ("import sys, cli; cli.build_parser().parse_args(['a', 'b', '--filter', 'sepia']); "
+            "assert 'numpy' not in sys.modules and 'PIL' not in sys.modules")
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+
+
+@pytest.mark.parametrize('option', ['--help', '--list-filters'])
+def test_script_help_does_not_import_numpy(option):
+    code = ("import runpy, sys\n"
+            f"sys.argv = ['image_processing.py', '{option}']\n"
+            "try:\n"
+            "    runpy.run_path('image_processing.py', run_name='__main__')\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "assert 'numpy' not in sys.modules and 'PIL' not in sys.modules")
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True)
+
+
+def test_main_matches_float64(tmp_path, monkeypatch, rgb_image):
+    source, output = str(tmp_path / 'in.png'), str(tmp_path / 'out.png')
+    rgb_image.save(source)
+    monkeypatch.setattr(sys, 'argv', ['cli.py', source, output, '--filter', 'contrast=2'])
+    main()
+    expected = apply_filter(ImageProcessor(source), 'contrast', 2.0)
+    assert np.array_equal(np.asarray(Image.open(output)), np.asarray(expected))
+
+
+def test_image_processing_script_entry_point(tmp_path, rgb_image):
+    source, output = str(tmp_path / 'in.png'), str(tmp_path / 'out.png')
+    rgb_image.save(source)
+    subprocess.run([sys.executable, os.path.join(ROOT, 'image_processing.py'), source, output,
+                    '--filter', 'negative', '--filter', 'mirror-h'], check=True,
+                   capture_output=True)
+    expected = np.fliplr(255 - np.asarray(rgb_image))
+    assert np.array_equal(np.asarray(Image.open(output)), expected)
+
+
+SHARED_OPTIONS = ['--filter', '--param', '--compress-level', '--quality', '--optimize']
+GEOMETRY_OPTIONS = ['--crop', '--resize', '--resample', '--fast-resize']
+
+
+@pytest.mark.parametrize('script, geometry', [('cli.py', True), ('batch_processing.py', True),
+                                              ('watch_folder.py', True), ('streaming.py', False),
+                                              ('animation.py', False)])
+def test_tools_share_chain_options(monkeypatch, script, geometry):
+    """Les options de chaîne viennent toutes de cli.add_chain_arguments"""
+    # Même largeur de l'aide dans les deux processus
+    monkeypatch.setenv('COLUMNS', '100')
+    help_text = subprocess.run([sys.executable, os.path.join(ROOT, script), '--help'],
+                               check=True, capture_output=True, text=True).stdout
+    reference = build_parser().format_help()
+    for option in SHARED_OPTIONS + GEOMETRY_OPTIONS:
+        line = next(line for line in reference.splitlines() if line.strip().startswith(option))
+        assert (line in help_text) == (geometry or option in SHARED_OPTIONS)
+
+
+def make_animation(path):
+    frames = [Image.fromarray(np.full((8, 8, 3), value, np.uint8)) for value in (40, 160)]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=50)
+
+
+@pytest.mark.parametrize('option', [['--precision', 'native'], ['--threads', '2'],
+                                    ['--cache-dir', 'cache'], ['--crop', '0,0,4,4']])
+def test_animation_rejects_still_image_options(tmp_path, monkeypatch, capsys, option):
+    source, output = str(tmp_path / 'in.gif'), str(tmp_path / 'out.gif')
+    make_animation(source)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, 'argv', ['cli.py', source, output, '--filter', 'negative', *option])
+    main()
+    assert capsys.readouterr().out.startswith('Erreur:')
+    assert not os.path.exists(output) and not os.path.exists(tmp_path / 'cache')
+
+
+def test_animation_processes_every_frame(tmp_path, monkeypatch, capsys):
+    source, output = str(tmp_path / 'in.gif'), str(tmp_path / 'out.gif')
+    make_animation(source)
+    monkeypatch.setattr(sys, 'argv', ['cli.py', source, output, '--filter', 'negative'])
+    main()
+    assert '2 images traitées' in capsys.readouterr().out
+    with Image.open(output) as result:
+        assert result.n_frames == 2
+
+
+@pytest.mark.parametrize('option', [['--precision', 'native'], ['--threads', '2']])
+def test_chain_rejects_single_filter_options(tmp_path, monkeypatch, capsys, option):
+    source, output = str(tmp_path / 'in.png'), str(tmp_path / 'out.png')
+    monkeypatch.setattr(sys, 'argv', ['cli.py', source, output, '--filter', 'negative',
+                                      '--filter', 'sepia', *option])
+    with pytest.raises(SystemExit):
+        main()
+    assert "qu'à un filtre seul" in capsys.readouterr().err
+    assert not os.path.exists(output)
+
+
+def test_single_filter_accepts_precision_and_threads(tmp_path, monkeypatch, rgb_image):
+    source, output = str(tmp_path / 'in.png'), str(tmp_path / 'out.png')
+    rgb_image.save(source)
+    monkeypatch.setattr(sys, 'argv', ['cli.py', source, output, '--filter', 'sepia',
+                                      '--precision', 'native', '--threads', '2'])
+    main()
+    expected = apply_filter(ImageProcessor(source, 'native', 2), 'sepia', None)
+    assert np.array_equal(np.asarray(Image.open(output)), np.asarray(expected))
+
+
+@pytest.mark.parametrize('text', ['posterization=1', 'contrast=7', 'threshold=-3',
+                                  'auto-level=nan', 'negative=2'])
+def test_out_of_bounds_param_is_rejected(capsys, text):
+    with pytest.raises(SystemExit):
+        parse('--filter', text)
+    assert 'paramètre' in capsys.readouterr().err
+
+
+def test_out_of_bounds_last_param_is_rejected(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['cli.py', 'in.png', 'out.png', '--filter', 'negative',
+                                      '--filter', 'contrast', '--param', '9'])
+    with pytest.raises(SystemExit):
+        main()
+    assert 'hors des bornes' in capsys.readouterr().err
+
+
+def test_zero_means_default_in_chains():
+    assert parse('--filter', 'posterization=0').filter == [('posterization', 0.0)]
+    steps = normalize_chain([('negative', None), ('posterization', 0), ('contrast', 0.0)])
+    assert steps == [('negative', None), ('posterization', 4), ('contrast', 1.5)]
+
+
+def test_chain_with_zero_param_matches_sequential(tmp_path, monkeypatch, rgb_image):
+    source, output = str(tmp_path / 'in.png'), str(tmp_path / 'out.png')
+    rgb_image.save(source)
+    monkeypatch.setattr(sys, 'argv', ['cli.py', source, output, '--filter', 'negative',
+                                      '--filter', 'posterization=0'])
+    main()
+    expected = apply_filter(ImageProcessor(source), 'negative')
+    expected = apply_filter(ImageProcessor.from_image(expected, 'float64', 1), 'posterization', 0)
+    assert np.array_equal(np.asarray(Image.open(output)), np.asarray(expected))
@@ -0,0 +1,128 @@
+"""
+Tests des chaînes compilées (filter_chain.py)
+Référence : application séquentielle d'apply_filter par ImageProcessor en float64.
+"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import random_image
+from filter_chain import MAX_FUSION_ERROR, apply_chain, compile_chain
+from image_processing import ImageProcessor, apply_filter
+
+
+def sequential(image, steps):
+    """Applique les filtres un par un, comme avant la compilation"""
+    for name, param in steps:
+        image = apply_filter(ImageProcessor.from_image(image, 'float64', 1), name, param)
+    return image
+
+
+def compiled(image, steps):
+    return compile_chain(steps).run(np.asarray(image))
+
+
+# Chaînes de tables et de miroirs : la LUT composée est exacte
+LUT_CHAINS = [
+    [('negative', None), ('contrast', 1.7)],
+    [('clipping', None), ('posterization', 5), ('mirror-h', None)],
+    [('contrast', 0.6), ('negative', None), ('mirror-v', None), ('mirror-h', None)],
+    [('auto-level', 2.0), ('posterization', 3)],
+    [('mirror-v', None), ('negative', None), ('negative', None)],
+]
+
+
+@pytest.mark.parametrize('steps', LUT_CHAINS)
+def test_lut_chain_matches_sequential(image, steps):
+    expected = np.asarray(sequential(image, steps))
+    assert np.array_equal(compiled(image, steps), expected)
+
+
+# Chaînes colorimétriques, dont une plus longue que ce qui peut être fusionné
+MATRIX_CHAINS = [
+    [('bw', None), ('desaturation', 0.3)],
+    [('desaturation', 0.3), ('desaturation', 0.8)],
+    [('bw', None), ('sepia', None)],
+    [('desaturation', 0.5)] * 3 + [('sepia', None)],
+    [('sepia', None), ('desaturation', 0.2)],
+]
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA'])
+@pytest.mark.parametrize('steps', MATRIX_CHAINS)
+def test_matrix_kernels_within_bound(mode, steps):
+    """Chaque matrice fusionnée reste à deux unités de ses filtres appliqués un par un"""
+    image = random_image(mode)
+    chain = compile_chain(steps)
+    start = 0
+    for kernel in chain.kernels:
+        assert kernel.error <= MAX_FUSION_ERROR
+        group = steps[start:start + kernel.count]
+        start += kernel.count
+        expected = np.asarray(sequential(image, group)).astype(int)[..., :3]
+        result = compiled(image, group).astype(int)[..., :3]
+        assert np.abs(result - expected).max() <= 2
+    assert start == len(steps)
+
+
+def test_sepia_is_not_fused_after_another_matrix():
+    chain = compile_chain([('bw', None), ('sepia', None)])
+    assert len(chain) == 2
+
+
+# Seuillages dans une chaîne : la luminance est comparée sans être arrondie
+GRAY_CHAINS = [
+    [('negative', None), ('threshold', 128)],
+    [('threshold', 100), ('negative', None)],
+    [('contrast', 1.5), ('threshold', None)],
+    [('sepia', None), ('threshold', None)],
+    [('negative', None), ('auto-threshold', None)],
+    [('bw', None), ('threshold', 90)],
+    [('desaturation', 0.3), ('auto-threshold', None), ('mirror-h', None)],
+]
+
+
+@pytest.mark.parametrize('steps', GRAY_CHAINS)
+def test_gray_chain_matches_sequential(image, steps):
+    expected = np.asarray(sequential(image, steps))
+    assert np.array_equal(compiled(image, steps), expected)
+
+
+@pytest.mark.parametrize('steps', GRAY_CHAINS)
+def test_gray_chain_stack_matches_sequential(steps):
+    """Un seuil d'Otsu par image de la pile"""
+    frames = [random_image('RGB', seed) for seed in range(3)]
+    result = compile_chain(steps).run_stack(np.stack([np.asarray(f) for f in frames]))
+    for frame, pixels in zip(frames, result):
+        assert np.array_equal(pixels, np.asarray(sequential(frame, steps)))
+
+
+def test_apply_chain_single_filter_is_exact(tmp_path, image):
+    """Un filtre seul passe par ImageProcessor, sans écart"""
+    path = tmp_path / 'in.png'
+    image.save(path)
+    for steps in ([('sepia', None)], [('threshold', 100)], [('desaturation', 0.3)]):
+        expected = sequential(image, steps)
+        result = apply_chain(str(path), steps)
+        assert result.mode == expected.mode
+        assert np.array_equal(np.asarray(result), np.asarray(expected))
+
+
+def test_resolved_luts_reused_on_other_image():
+    """Les tables résolues sur une référence s'appliquent telles quelles"""
+    image = random_image('RGB')
+    chain = compile_chain([('contrast', 2.0), ('negative', None)])
+    pixels = np.asarray(image)
+    luts = chain.resolve_luts(pixels)
+    assert np.array_equal(chain.run(pixels, luts=luts), chain.run(pixels))
+    tile = pixels[10:30, 5:25]
+    assert np.array_equal(chain.run(tile, luts=luts), chain.run(pixels, luts=luts)[10:30, 5:25])
+
+
+def test_apply_matches_run():
+    image = random_image('L')
+    steps = [('negative', None), ('mirror-h', None)]
+    result = compile_chain(steps).apply(image)
+    assert isinstance(result, Image.Image)
+    assert np.array_equal(np.asarray(result), compiled(image, steps))
@@ -0,0 +1,138 @@
+"""
+Tests d'ImageProcessor
+"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import image_processing
+from image_processing import FILTER_CHOICES, ImageProcessor, Workspace, apply_filter, get_filter
+
+
+@pytest.mark.parametrize('name', ['contrast', 'posterization', 'threshold', 'negative'])
+def test_sixteen_bit_image(tmp_path, name):
+    """Une image I;16 est traitée en float64, sans l'index statistique"""
+    path = tmp_path / 'i16.png'
+    Image.fromarray((np.arange(40 * 30).reshape(40, 30) * 50).astype(np.uint16)).save(path)
+    processor = ImageProcessor(str(path))
+    assert processor.image.mode == 'I;16'
+    assert not processor.has_stats
+    result = apply_filter(processor, name, None)
+    assert result.size == (30, 40)
+
+
+def test_sixteen_bit_auto_level_is_rejected(tmp_path):
+    path = tmp_path / 'i16.png'
+    Image.fromarray(np.full((8, 8), 4000, dtype=np.uint16)).save(path)
+    with pytest.raises(ValueError):
+        apply_filter(ImageProcessor(str(path)), 'auto-level', None)
+
+
+# Filtres seuillés sur la luminance : un écart d'une unité peut franchir le seuil
+THRESHOLDS = ('threshold', 'auto-threshold')
+
+
+def mode_of(array):
+    """Mode PIL d'un tableau (H, W) ou (H, W, C)"""
+    return {2: 'L', 3: 'RGB', 4: 'RGBA'}[array.shape[2] if array.ndim == 3 else 2]
+
+
+@pytest.mark.parametrize('name', FILTER_CHOICES)
+def test_native_matches_float64(image, name):
+    """La précision native reste à une unité du calcul float64"""
+    expected = apply_filter(ImageProcessor.from_image(image, 'float64', 1), name, None)
+    result = apply_filter(ImageProcessor.from_image(image, 'native', 1), name, None)
+    if name in ('bw',) + THRESHOLDS and image.mode != 'L':
+        # Résultat mono-canal ("L" ou "1") en précision native
+        assert result.mode in ('L', '1')
+    expected = np.asarray(expected).astype(int)
+    result = np.asarray(result.convert(mode_of(expected))).astype(int)
+    if name == 'sepia' and image.mode == 'RGBA':
+        # Le float64 historique met l'alpha à zéro, la précision native le conserve
+        assert np.array_equal(result[..., 3], np.asarray(image)[..., 3])
+        expected, result = expected[..., :3], result[..., :3]
+    difference = np.abs(result - expected)
+    if name in THRESHOLDS:
+        assert (difference > 0).mean() < 0.02
+    else:
+        assert difference.max() <= 1
+
+
+@pytest.mark.parametrize('precision', ['float64', 'native'])
+@pytest.mark.parametrize('name', FILTER_CHOICES)
+def test_bands_match_single_thread(monkeypatch, image, precision, name):
+    """Le découpage en bandes (et en bandes de travail) ne change aucun pixel"""
+    expected = apply_filter(ImageProcessor.from_image(image, precision, 1), name, None)
+    # Bandes de 8 lignes et tampons de quelques lignes : découpages inégaux
+    monkeypatch.setattr(image_processing, 'MIN_BAND_ROWS', 8)
+    monkeypatch.setattr(image_processing, 'SCRATCH_BYTES', 2000)
+    result = apply_filter(ImageProcessor.from_image(image, precision, 3), name, None)
+    assert result.mode == expected.mode
+    assert np.array_equal(np.asarray(result), np.asarray(expected))
+
+
+def filter_method(processor, name):
+    return getattr(processor, get_filter(name).method)
+
+
+def output_buffer(expected, fill=7):
+    """Tampon de la forme et du type du résultat, rempli d'une valeur parasite"""
+    pixels = np.asarray(expected)
+    if pixels.dtype == np.bool_:
+        return np.zeros(pixels.shape, np.bool_)
+    return np.full(pixels.shape, fill, np.uint8)
+
+
+@pytest.mark.parametrize('precision', ['float64', 'native'])
+@pytest.mark.parametrize('name', FILTER_CHOICES)
+def test_out_is_filled_in_place(image, precision, name):
+    """Avec out=, le résultat est écrit dans le tampon fourni, sans autre différence"""
+    expected = filter_method(ImageProcessor.from_image(image, precision, 1), name)()
+    out = output_buffer(expected)
+    result = filter_method(ImageProcessor.from_image(image, precision, 1), name)(out=out)
+    assert result.mode == expected.mode
+    assert np.array_equal(np.asarray(result), np.asarray(expected))
+    assert np.array_equal(out, np.asarray(expected))
+
+
+@pytest.mark.parametrize('name', ['negative', 'sepia', 'contrast', 'threshold', 'mirror-v'])
+def test_out_with_wrong_shape_or_dtype_is_rejected(rgb_image, name):
+    processor = ImageProcessor.from_image(rgb_image, 'float64', 1)
+    expected = np.asarray(filter_method(processor, name)())
+    for out in (np.empty(expected.shape[:2] + (4,), np.uint8),
+                np.empty(expected.shape[::-1], np.uint8),
+                np.empty(expected.shape, np.float32)):
+        with pytest.raises(ValueError, match='Tampon de sortie incompatible'):
+            filter_method(processor, name)(out=out)
+
+
+@pytest.mark.parametrize('precision', ['float64', 'native'])
+def test_workspace_allocates_once(monkeypatch, image, precision):
+    """Après un premier appel, les filtres réutilisent les tampons de l'espace de travail"""
+    monkeypatch.setattr(image_processing, 'MIN_BAND_ROWS', 8)
+    monkeypatch.setattr(image_processing, 'SCRATCH_BYTES', 2000)
+    workspace = Workspace()
+    processor = ImageProcessor.from_image(image, precision, 3, workspace)
+    for name in FILTER_CHOICES:
+        filter_method(processor, name)()
+    allocations, nbytes = workspace.allocations, workspace.nbytes
+    assert allocations > 0
+    for _ in range(3):
+        # Un nouveau processeur de même taille partage aussi les tampons
+        processor = ImageProcessor.from_image(image, precision, 3, workspace)
+        for name in FILTER_CHOICES:
+            filter_method(processor, name)()
+    assert workspace.allocations == allocations and workspace.nbytes == nbytes
+
+
+def test_workspace_get_reuses_bytes():
+    workspace = Workspace()
+    first = workspace.get('a', (4, 5), np.float64)
+    smaller = workspace.get('a', (3, 2), np.uint16)
+    assert workspace.allocations == 1 and np.shares_memory(first, smaller)
+    workspace.get('b', (4, 5), np.float64)
+    workspace.get('a', (10, 10), np.float64)
+    assert workspace.allocations == 3
+    workspace.clear()
+    assert workspace.nbytes == 0
@@ -0,0 +1,47 @@
+"""
+Tests du chemin palette (images indexées en précision native)
+"""
+
+import numpy as np
+import pytest
+
+from conftest import random_image
+from image_processing import FILTER_CHOICES, ImageProcessor, apply_filter
+
+THRESHOLDS = ('threshold', 'auto-threshold')
+
+
+@pytest.fixture
+def indexed():
+    return random_image('RGB').quantize(64)
+
+
+def rgb(image):
+    return np.asarray(image.convert('RGB')).astype(int)
+
+
+@pytest.mark.parametrize('name', FILTER_CHOICES)
+def test_palette_matches_expanded_pixels(indexed, name):
+    processor = ImageProcessor.from_image(indexed, 'native', 1)
+    assert processor.palette is not None
+    result = apply_filter(processor, name, None)
+    if name not in THRESHOLDS:
+        # Seule la palette est transformée : l'image reste indexée
+        assert result.mode == 'P'
+    expanded = apply_filter(ImageProcessor.from_image(indexed.convert('RGB'), 'native', 1),
+                            name, None)
+    assert np.array_equal(rgb(result), rgb(expanded))
+    expected = apply_filter(ImageProcessor.from_image(indexed.convert('RGB'), 'float64', 1),
+                            name, None)
+    difference = np.abs(rgb(result) - rgb(expected))
+    if name in THRESHOLDS:
+        assert (difference > 0).any(axis=-1).mean() < 0.02
+    else:
+        assert difference.max() <= 1
+
+
+def test_transparent_palette_is_expanded(indexed):
+    indexed.info['transparency'] = 0
+    processor = ImageProcessor.from_image(indexed, 'native', 1)
+    assert processor.palette is None
+    assert apply_filter(processor, 'negative', None).mode == 'RGBA'
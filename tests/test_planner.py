@@ -0,0 +1,106 @@
+"""
+Tests du planificateur (planner.py)
+Référence : la chaîne complète, puis le recadrage, puis le redimensionnement.
+"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from filter_chain import apply_chain
+from image_processing import normalize_mode
+from planner import RESAMPLE_FILTERS, apply_plan, plan_chain, simplify_chain
+
+
+def unplanned(path, steps, crop=None, size=None, resample='bicubic'):
+    """Exécution dans l'ordre demandé, sans réordonnancement"""
+    result = normalize_mode(apply_chain(path, steps))
+    if crop is not None:
+        x, y, width, height = crop
+        result = result.crop((x, y, x + width, y + height))
+    if size is not None:
+        result = result.resize(size, RESAMPLE_FILTERS[resample])
+    return np.asarray(result).astype(int)
+
+
+@pytest.fixture
+def source(tmp_path, image):
+    path = tmp_path / 'in.png'
+    image.save(path)
+    return str(path)
+
+
+CHAINS = [
+    [('negative', None), ('mirror-h', None), ('posterization', 5)],
+    [('contrast', 1.6), ('sepia', None), ('mirror-v', None)],
+    [('bw', None), ('desaturation', 0.4), ('auto-level', 1.0), ('negative', None)],
+    [('mirror-v', None), ('mirror-v', None), ('clipping', None), ('threshold', 90)],
+]
+
+
+@pytest.mark.parametrize('steps', CHAINS)
+def test_crop_and_nearest_are_exact(source, steps):
+    crop, size = (5, 7, 30, 24), (15, 12)
+    expected = unplanned(source, steps, crop, size, 'nearest')
+    result = np.asarray(apply_plan(source, steps, crop=crop, size=size, resample='nearest'))
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize('resample', ['bilinear', 'bicubic'])
+@pytest.mark.parametrize('steps', CHAINS)
+def test_smooth_resize_within_rounding(source, steps, resample):
+    expected = unplanned(source, steps, size=(20, 17), resample=resample)
+    result = np.asarray(apply_plan(source, steps, size=(20, 17), resample=resample)).astype(int)
+    assert np.abs(result - expected).max() <= 2
+
+
+@pytest.fixture
+def jpeg_source(tmp_path):
+    """Photo bruitée de 400x300 : le mode brouillon réduit son décodage"""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:300, 0:400]
+    pixels = np.stack([x * 255 / 400, y * 255 / 300, (x + y) * 255 / 700], axis=-1)
+    pixels = np.clip(pixels + rng.normal(0, 20, pixels.shape), 0, 255).astype(np.uint8)
+    path = tmp_path / 'in.jpg'
+    Image.fromarray(pixels).save(path, quality=90)
+    return str(path)
+
+
+@pytest.mark.parametrize('resample', ['bilinear', 'bicubic', 'lanczos'])
+@pytest.mark.parametrize('steps', [[('negative', None)], [('negative', None), ('bw', None)],
+                                   [('sepia', None), ('negative', None)]])
+def test_jpeg_resize_decodes_fully_by_default(jpeg_source, steps, resample):
+    expected = unplanned(jpeg_source, steps, size=(50, 37), resample=resample)
+    result = apply_plan(jpeg_source, steps, size=(50, 37), resample=resample)
+    assert np.abs(np.asarray(result).astype(int) - expected).max() <= 2
+
+
+def test_fast_resize_uses_jpeg_draft(jpeg_source):
+    steps = [('negative', None)]
+    assert plan_chain(steps, (400, 300), size=(50, 37)).draft is None
+    assert plan_chain(steps, (400, 300), size=(50, 37), fast_resize=True).draft == (50, 37)
+    expected = unplanned(jpeg_source, steps, size=(50, 37), resample='bilinear')
+    result = apply_plan(jpeg_source, steps, size=(50, 37), resample='bilinear',
+                        fast_resize=True)
+    assert result.size == (50, 37)
+    # Approché seulement : quelques unités d'écart au décodage complet
+    assert np.abs(np.asarray(result).astype(int) - expected).max() <= 8
+
+
+def test_crop_moves_ahead_of_local_filters():
+    steps = [('negative', None), ('mirror-h', None), ('sepia', None)]
+    plan = plan_chain(steps, (100, 80), crop=(10, 5, 20, 30))
+    # La zone est prélevée avant les filtres, retournée par le miroir
+    assert plan.stages[0] == ('crop', (70, 5, 20, 30))
+
+
+def test_crop_stays_after_statistics():
+    plan = plan_chain([('negative', None), ('contrast', 1.5)], (100, 80), crop=(0, 0, 10, 10))
+    assert plan.stages[0] == ('filters', [('negative', None), ('contrast', 1.5)])
+
+
+def test_simplify_chain():
+    steps = [('mirror-v', None), ('negative', None), ('negative', None), ('mirror-h', None),
+             ('mirror-v', None), ('clipping', None), ('clipping', None)]
+    assert simplify_chain(steps) == ([('clipping', None)], False, True)
+
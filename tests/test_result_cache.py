@@ -0,0 +1,99 @@
+"""
+Tests du cache de résultats (result_cache.py)
+"""
+
+import os
+import pickle
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import result_cache
+from conftest import random_image
+from image_processing import ImageProcessor, apply_filter
+from result_cache import ResultCache, process_with_cache
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'in.png'
+    random_image('RGB').save(path)
+    return str(path)
+
+
+def write_file(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    return str(path)
+
+
+def test_key_depends_on_content_chain_and_format(tmp_path, source):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    copy = tmp_path / 'copy.png'
+    copy.write_bytes(open(source, 'rb').read())
+    key = cache.key(source, [('contrast', None)], 'out.png')
+    # Même contenu, paramètre par défaut explicite, autre répertoire de sortie
+    assert cache.key(str(copy), [('contrast', 1.5)], 'sorties/out.PNG') == key
+    assert cache.key(source, [('contrast', 2.0)], 'out.png') != key
+    assert cache.key(source, [('contrast', None)], 'out.jpg') != key
+    assert cache.key(source, [('contrast', None)], 'out.png', precision='native') != key
+
+
+def test_hit_reproduces_float64_output(tmp_path, source):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    steps = [('sepia', None)]
+
+    def render():
+        return apply_filter(ImageProcessor(source), 'sepia', None)
+
+    first, second = str(tmp_path / 'a.png'), str(tmp_path / 'b.png')
+    assert process_with_cache(cache, source, first, steps, render) is False
+    assert process_with_cache(cache, source, second, steps, render) is True
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+    expected = np.asarray(render())
+    assert np.array_equal(np.asarray(Image.open(second)), expected)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=2500)
+    for index, key in enumerate(['aa1', 'bb2', 'cc3']):
+        cache.store(key, write_file(tmp_path / key, 1000))
+        os.utime(cache._entry_path(key), (index, index))
+        if index == 1:
+            # Une lecture rafraîchit l'entrée la plus ancienne
+            assert cache.fetch('aa1', str(tmp_path / 'out'))
+            os.utime(cache._entry_path('aa1'), (5, 5))
+    assert not cache.fetch('bb2', str(tmp_path / 'out'))
+    assert cache.fetch('aa1', str(tmp_path / 'out'))
+    assert cache.fetch('cc3', str(tmp_path / 'out'))
+    assert cache.size() <= 2500
+
+
+def test_store_does_not_walk_until_budget_is_crossed(tmp_path, monkeypatch):
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(result_cache.os, 'walk', lambda *a: walks.append(a) or walk(*a))
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=100_000)
+    payload = write_file(tmp_path / 'payload', 100)
+    for index in range(50):
+        cache.store(f'{index:04x}', payload)
+    # Un seul parcours, à l'initialisation
+    assert len(walks) == 1
+    for index in range(50, 150):
+        cache.store(f'{index:04x}', write_file(tmp_path / 'big', 1000))
+    assert cache.size() <= 100_000
+    # Parcours après chaque dixième du budget écrit, pas à chaque écriture
+    assert len(walks) < 20
+
+
+def test_pickled_copy_keeps_known_size(tmp_path, monkeypatch):
+    """Copie envoyée à un processus de travail : pas de nouveau parcours"""
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=100_000)
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(result_cache.os, 'walk', lambda *a: walks.append(a) or walk(*a))
+    payload = write_file(tmp_path / 'payload', 100)
+    for index in range(20):
+        pickle.loads(pickle.dumps(cache)).store(f'{index:04x}', payload)
+    assert not walks
@@ -0,0 +1,133 @@
+"""
+Tests du service HTTP (server.py)
+Référence : la chaîne compilée appliquée directement aux pixels.
+"""
+
+import base64
+import io
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from filter_chain import compile_chain
+from server import ProcessingService, RequestError, create_server, parse_chain
+
+
+@pytest.fixture
+def server():
+    server = create_server(port=0, workers=1, queue_size=0)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01},
+                              daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def call(server, path, body=None):
+    """Requête au serveur : (statut, en-têtes, corps)"""
+    url = f'http://127.0.0.1:{server.server_address[1]}{path}'
+    data = None if body is None else json.dumps(body).encode()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data)) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def encoded(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+@pytest.mark.parametrize('spec', [
+    [],
+    'negative',
+    ['blur'],
+    ['posterization=0.5'],
+    ['contrast=9'],
+    ['negative=2'],
+    [{'filter': 'posterization', 'param': 1}],
+    [{'filter': 'threshold', 'param': 'haut'}],
+    [{'filter': 'negative', 'param': 1}],
+    [{'param': 3}],
+])
+def test_parse_chain_rejects_invalid_steps(spec):
+    with pytest.raises(RequestError):
+        parse_chain(spec)
+
+
+def test_parse_chain_accepts_both_forms():
+    steps = parse_chain(['negative', 'contrast=2', {'filter': 'posterization', 'param': 0}])
+    assert steps == [('negative', None), ('contrast', 2.0), ('posterization', 0.0)]
+
+
+def test_process_matches_compiled_chain(server, rgb_image):
+    chain = ['negative', {'filter': 'posterization', 'param': 0}, 'sepia']
+    status, headers, body = call(server, '/process', {'data': encoded(rgb_image),
+                                                      'chain': chain})
+    assert status == 200 and headers['Content-Type'] == 'image/png'
+    expected = compile_chain([('negative', None), ('posterization', 0), ('sepia', None)]).run(
+        np.asarray(rgb_image))
+    assert np.array_equal(np.asarray(Image.open(io.BytesIO(body))), expected)
+
+
+@pytest.mark.parametrize('chain', [['posterization=1'],
+                                   [{'filter': 'posterization', 'param': 0.5}],
+                                   ['mirror-h', {'filter': 'contrast', 'param': -1}]])
+def test_invalid_param_is_bad_request(server, rgb_image, chain):
+    status, _, body = call(server, '/process', {'data': encoded(rgb_image), 'chain': chain})
+    assert status == 400
+    assert 'paramètre' in json.loads(body)['error']
+
+
+def test_full_queue_is_rejected(server, rgb_image):
+    service = server.RequestHandlerClass.service
+    started, release = threading.Event(), threading.Event()
+    process = service.process
+
+    def blocking(request):
+        started.set()
+        release.wait(5)
+        return process(request)
+
+    service.process = blocking
+    request = {'data': encoded(rgb_image), 'chain': ['negative']}
+    first = threading.Thread(target=call, args=(server, '/process', request))
+    first.start()
+    try:
+        assert started.wait(5)
+        status, headers, _ = call(server, '/process', request)
+        assert status == 503 and headers['Retry-After'] == '1'
+    finally:
+        release.set()
+        first.join()
+    assert service.metrics()['rejected'] == 1
+    assert call(server, '/process', request)[0] == 200
+
+
+def test_latency_percentiles():
+    service = ProcessingService(workers=1)
+    service.latencies.extend(i / 1000 for i in range(100, 0, -1))
+    latency = service.metrics()['latency_ms']
+    assert latency == {'p50': 51.0, 'p90': 91.0, 'p99': 100.0}
+    service.executor.shutdown()
+
+
+def test_metrics_endpoint(server, rgb_image):
+    request = {'data': encoded(rgb_image), 'chain': ['bw']}
+    for _ in range(3):
+        assert call(server, '/process', request)[0] == 200
+    status, _, body = call(server, '/metrics')
+    metrics = json.loads(body)
+    assert status == 200
+    assert metrics['completed'] == 3 and metrics['errors'] == 0
+    assert set(metrics['latency_ms']) == {'p50', 'p90', 'p99'}
+    assert metrics['latency_ms']['p50'] <= metrics['latency_ms']['p99']
+    assert metrics['decode_cache']['hits'] == 2
@@ -0,0 +1,101 @@
+"""
+Tests du traitement par bandes (streaming.py)
+Référence : la même chaîne appliquée à l'image entière en mémoire.
+"""
+
+import sys
+import warnings
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from filter_chain import compile_chain
+from image_processing import ImageProcessor, apply_filter, load_array
+from streaming import main, open_source, stream_process
+
+# Budget minuscule : bandes de quelques lignes
+MEMORY_LIMIT = 4096
+
+CHAINS = [
+    [('negative', None), ('mirror-h', None)],
+    [('contrast', 1.8), ('sepia', None), ('mirror-v', None)],
+    [('bw', None), ('auto-level', 2.0), ('contrast', 0.7)],
+    [('desaturation', 0.3), ('threshold', 120)],
+    [('negative', None), ('auto-threshold', None), ('mirror-v', None)],
+]
+
+
+def source_file(tmp_path, image, ext):
+    path = tmp_path / f'in{ext}'
+    image.save(path)
+    return str(path)
+
+
+def read_output(path):
+    if path.endswith('.npy'):
+        return np.array(load_array(path))
+    with Image.open(path) as image:
+        return np.asarray(image)
+
+
+@pytest.mark.parametrize('output', ['.png', '.npy', '.tif'])
+@pytest.mark.parametrize('steps', CHAINS)
+def test_strips_match_in_memory(tmp_path, image, steps, output):
+    path = source_file(tmp_path, image, '.png')
+    out = str(tmp_path / f'out{output}')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        shape = stream_process(path, out, steps, memory_limit=MEMORY_LIMIT)
+    expected = compile_chain(steps).run(np.asarray(image))
+    assert shape == expected.shape
+    assert np.array_equal(read_output(out), expected)
+
+
+@pytest.mark.parametrize('steps', [[('negative', None), ('contrast', 1.4)],
+                                   [('posterization', 3), ('mirror-v', None)]])
+def test_lut_chain_matches_float64(tmp_path, image, steps):
+    path = source_file(tmp_path, image, '.png')
+    out = str(tmp_path / 'out.png')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        stream_process(path, out, steps, memory_limit=MEMORY_LIMIT)
+    expected = image
+    for name, param in steps:
+        expected = apply_filter(ImageProcessor.from_image(expected, 'float64', 1), name, param)
+    assert np.array_equal(read_output(out), np.asarray(expected))
+
+
+def test_uncompressed_source_is_mapped(tmp_path, rgb_image):
+    path = source_file(tmp_path, rgb_image, '.ppm')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        pixels = open_source(path)
+    assert isinstance(pixels.base, np.memmap) or isinstance(pixels, np.memmap)
+    assert np.array_equal(pixels, np.asarray(rgb_image))
+
+
+def test_full_decode_warns(tmp_path, rgb_image):
+    path = source_file(tmp_path, rgb_image, '.png')
+    with pytest.warns(UserWarning, match='décodée entièrement'):
+        open_source(path)
+
+
+def test_full_encode_warns(tmp_path, rgb_image):
+    path = source_file(tmp_path, rgb_image, '.ppm')
+    with pytest.warns(UserWarning, match='assemblée en mémoire'):
+        stream_process(path, str(tmp_path / 'out.tif'), [('negative', None)])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        stream_process(path, str(tmp_path / 'out.png'), [('negative', None)])
+
+
+@pytest.mark.parametrize('option', [['--quality', '80'], ['--optimize']])
+def test_pil_encoder_options_are_rejected(tmp_path, monkeypatch, capsys, rgb_image, option):
+    source, output = str(tmp_path / 'in.png'), str(tmp_path / 'out.png')
+    rgb_image.save(source)
+    monkeypatch.setattr(sys, 'argv', ['streaming.py', source, output, '--filter', 'negative',
+                                      *option])
+    with pytest.raises(SystemExit):
+        main()
+    assert 'streaming' in capsys.readouterr().err
@@ -0,0 +1,55 @@
+"""
+Tests du traitement par piles (CompiledChain.run_stack, tensor_batch.py)
+"""
+
+import numpy as np
+import pytest
+
+from conftest import random_image
+from filter_chain import compile_chain
+from image_processing import ImageProcessor, apply_filter
+from tensor_batch import TensorBatchProcessor
+
+CHAINS = [
+    [('negative', None), ('contrast', 1.7)],
+    [('auto-level', 2.0), ('mirror-v', None)],
+    [('bw', None), ('auto-threshold', None), ('mirror-h', None)],
+    [('sepia', None), ('posterization', 5)],
+]
+
+
+def stack_of(mode, count=3):
+    return np.stack([np.asarray(random_image(mode, seed)) for seed in range(count)])
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('steps', CHAINS)
+def test_run_stack_matches_run(mode, steps):
+    """Statistiques et miroirs propres à chaque image de la pile"""
+    stack = stack_of(mode)
+    chain = compile_chain(steps)
+    result = chain.run_stack(stack)
+    for pixels, expected in zip(stack, result):
+        assert np.array_equal(chain.run(pixels), expected)
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+def test_run_stack_matches_sequential(mode):
+    steps = [('contrast', 0.6), ('negative', None), ('mirror-v', None)]
+    stack = stack_of(mode)
+    result = compile_chain(steps).run_stack(stack)
+    for seed, pixels in enumerate(result):
+        image = random_image(mode, seed)
+        for name, param in steps:
+            image = apply_filter(ImageProcessor.from_image(image, 'float64', 1), name, param)
+        assert np.array_equal(pixels, np.asarray(image))
+
+
+def test_processor_keeps_input_order():
+    images = [random_image('RGB', 0), random_image('L', 1), random_image('RGB', 2),
+              random_image('RGBA', 3)]
+    steps = [('negative', None), ('contrast', 1.3)]
+    results = TensorBatchProcessor(steps, batch_size=1).process_images(images)
+    chain = compile_chain(steps)
+    for image, result in zip(images, results):
+        assert np.array_equal(np.asarray(result), chain.run(np.asarray(image)))
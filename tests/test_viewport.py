@@ -0,0 +1,125 @@
+"""
+Tests de la fenêtre d'affichage zoomable (viewport.py)
+Référence : la chaîne compilée appliquée à l'image entière en pleine
+résolution, puis recadrée (et réduite) sur la zone affichée.
+"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from filter_chain import compile_chain
+from viewport import ImagePyramid, TileCache, Viewport
+
+TILE = 64
+
+CHAINS = [
+    [('mirror-h', None)],
+    [('mirror-v', None), ('mirror-h', None)],
+    [('contrast', 1.6)],
+    [('mirror-v', None), ('contrast', 1.6), ('mirror-h', None)],
+    [('negative', None), ('mirror-h', None), ('auto-level', None)],
+    [('mirror-h', None), ('posterization', 4), ('sepia', None)],
+]
+
+
+def gradient(width, height, noise=0):
+    """Dégradé RGB, bruité à ±noise"""
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // (width - 1), y * 255 // (height - 1),
+                       (x + y) * 255 // (width + height - 2)], axis=-1)
+    if noise:
+        pixels = pixels + np.random.default_rng(0).integers(-noise, noise + 1, pixels.shape)
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+def viewport(pixels, steps):
+    view = Viewport(ImagePyramid(pixels, tile_size=TILE))
+    view.set_chain(steps)
+    return view
+
+
+def crop(pixels, box):
+    x, y, width, height = box
+    return pixels[y:y + height, x:x + width]
+
+
+@pytest.mark.parametrize('steps', CHAINS)
+@pytest.mark.parametrize('box', [(0, 0, 301, 217), (38, 61, 300, 200), (37, 250, 260, 219)])
+def test_full_resolution_tile_matches_chain(steps, box):
+    # Dimensions qui ne sont pas des multiples de la taille des tuiles
+    pixels = gradient(339, 469, noise=30)
+    result = viewport(pixels, steps).render(box, box[2:])
+    assert result.size == box[2:]
+    assert np.array_equal(np.asarray(result), crop(compile_chain(steps).run(pixels), box))
+
+
+@pytest.mark.parametrize('steps', CHAINS[:5])
+def test_reduced_tile_matches_scaled_chain(steps):
+    """Au niveau réduit, le filtre est appliqué avant la réduction : écart d'au plus
+    un pour les filtres continus (la postérisation, en marches, est exclue)"""
+    pixels = gradient(640, 480)
+    box = (96, 60, 300, 200)
+    result = np.asarray(viewport(pixels, steps).render(box, (150, 100)))
+    expected = np.asarray(Image.fromarray(crop(compile_chain(steps).run(pixels), box)).reduce(2))
+    assert result.shape == expected.shape
+    assert np.abs(result.astype(int) - expected).max() <= 1
+
+
+def test_geometric_chain_is_exact_at_every_level():
+    pixels = gradient(640, 480, noise=30)
+    steps = [('mirror-v', None), ('mirror-h', None)]
+    box = (128, 64, 256, 192)
+    expected = Image.fromarray(crop(compile_chain(steps).run(pixels), box))
+    view = viewport(pixels, steps)
+    for factor in (1, 2, 4):
+        size = (box[2] // factor, box[3] // factor)
+        assert np.array_equal(np.asarray(view.render(box, size)), np.asarray(expected))
+        # Chaque niveau est la réduction 2x2 du précédent
+        expected = expected.reduce(2)
+
+
+def test_raw_render_ignores_chain():
+    pixels = gradient(339, 469, noise=30)
+    box = (20, 30, 150, 100)
+    result = viewport(pixels, CHAINS[3]).render(box, box[2:], raw=True)
+    assert np.array_equal(np.asarray(result), crop(pixels, box))
+
+
+def test_prefetch_fills_neighbour_tiles():
+    pixels = gradient(640, 480, noise=30)
+    steps = [('mirror-h', None), ('contrast', 1.6)]
+    view = viewport(pixels, steps)
+    box = (256, 192, 64, 64)
+    # Une tuile visible et sa couronne de huit voisines
+    assert view.prefetch(box, box[2:]) == 9
+    stats = view.cache.stats()
+    assert stats['entries'] == 9
+    # Les tuiles préchargées servent au rendu des zones voisines
+    wide = (192, 128, 192, 192)
+    result = view.render(wide, wide[2:])
+    assert view.cache.stats()['misses'] == stats['misses']
+    assert np.array_equal(np.asarray(result), crop(compile_chain(steps).run(pixels), wide))
+
+
+def test_prefetch_stops_when_cancelled():
+    view = viewport(gradient(640, 480), [('negative', None)])
+    assert view.prefetch((0, 0, 640, 480), (640, 480), cancelled=lambda: True) == 0
+    assert len(view.cache) == 0
+
+
+def test_prefetch_without_filter_computes_nothing():
+    view = viewport(gradient(640, 480), [('mirror-h', None)])
+    assert view.prefetch((0, 0, 128, 128), (128, 128)) == 0
+
+
+def test_tiles_are_cached_per_chain():
+    pixels = gradient(339, 469, noise=30)
+    view = Viewport(ImagePyramid(pixels, tile_size=TILE, cache=TileCache()))
+    box = (0, 0, 128, 128)
+    for steps in ([('negative', None)], [('contrast', 1.6)], [('negative', None)]):
+        view.set_chain(steps)
+        assert np.array_equal(np.asarray(view.render(box, box[2:])),
+                              crop(compile_chain(steps).run(pixels), box))
+    stats = view.cache.stats()
+    assert (stats['entries'], stats['hits'], stats['misses']) == (8, 4, 8)
@@ -0,0 +1,88 @@
+"""
+Tests de la surveillance de répertoire (watch_folder.py)
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import random_image
+from image_processing import ImageProcessor, apply_filter
+from watch_folder import MANIFEST_NAME, FolderWatcher, Manifest
+
+
+def test_manifest_reload_keeps_last_record(tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    manifest = Manifest(path)
+    manifest.record('a.png', size=1, ok=True)
+    manifest.record('b.png', size=2, ok=True)
+    manifest.record('a.png', size=3, ok=True)
+    manifest.forget('b.png')
+    manifest.close()
+    reloaded = Manifest(path)
+    assert len(reloaded) == 1 and reloaded.get('a.png')['size'] == 3
+    reloaded.close()
+    # Relu puis compacté : une ligne par fichier
+    with open(path, encoding='utf-8') as f:
+        assert [json.loads(line)['path'] for line in f] == ['a.png']
+
+
+def test_manifest_ignores_truncated_line(tmp_path):
+    path = tmp_path / 'manifest.jsonl'
+    path.write_text('{"path": "a.png", "size": 1}\n{"path": "b.pn', encoding='utf-8')
+    manifest = Manifest(str(path))
+    assert list(manifest.entries) == ['a.png']
+    manifest.record('c.png', size=2)
+    manifest.close()
+    assert set(Manifest(str(path)).entries) == {'a.png', 'c.png'}
+
+
+@pytest.fixture
+def folders(tmp_path):
+    source, output = tmp_path / 'depot', tmp_path / 'sorties'
+    (source / 'sub').mkdir(parents=True)
+    for index, relative in enumerate(['a.png', 'b.png', os.path.join('sub', 'c.png')]):
+        random_image('RGB', index).save(source / relative)
+    return str(source), str(output)
+
+
+def watch(source, output, steps=(('sepia', None),)):
+    watcher = FolderWatcher(source, output, list(steps), workers=1, settle=0,
+                            recursive=True)
+    return watcher.run(interval=0.01, once=True)
+
+
+def test_outputs_match_float64(folders):
+    source, output = folders
+    summary = watch(source, output)
+    assert summary.processed == 3
+    for relative in ['a.png', 'b.png', os.path.join('sub', 'c.png')]:
+        expected = apply_filter(ImageProcessor(os.path.join(source, relative)), 'sepia', None)
+        result = Image.open(os.path.join(output, relative))
+        assert np.array_equal(np.asarray(result), np.asarray(expected))
+
+
+def test_restart_resumes_from_manifest(folders):
+    source, output = folders
+    watch(source, output)
+    assert os.path.exists(os.path.join(output, MANIFEST_NAME))
+    # Redémarrage : rien à refaire
+    assert watch(source, output).processed == 0
+    # Un fichier modifié et une sortie supprimée sont repris
+    random_image('RGB', 7).save(os.path.join(source, 'a.png'))
+    os.remove(os.path.join(output, 'b.png'))
+    assert watch(source, output).processed == 2
+    # Une autre chaîne invalide tout le manifeste
+    assert watch(source, output, [('negative', None)]).processed == 3
+
+
+def test_deleted_source_is_forgotten(folders):
+    source, output = folders
+    watch(source, output)
+    os.remove(os.path.join(source, 'b.png'))
+    watch(source, output)
+    manifest = Manifest(os.path.join(output, MANIFEST_NAME))
+    assert 'b.png' not in manifest.entries and 'a.png' in manifest.entries
@@ -0,0 +1,327 @@
+"""
+Fenêtre d'affichage zoomable adossée à une pyramide de tuiles
+L'image est découpée en tuiles à plusieurs résolutions (chaque niveau divise
+la taille par deux). Seules les tuiles visibles au niveau correspondant au
+zoom sont filtrées, puis mémorisées par chaîne de filtres : l'inspection au
+pixel près d'images de plusieurs centaines de mégapixels reste interactive.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from image_processing import normalize_mode
+from filter_chain import compile_chain
+from planner import simplify_chain
+from instrumentation import tracer
+
+
+# Côté des tuiles, en pixels
+TILE_SIZE = 256
+
+# Budget mémoire par défaut des tuiles (sources réduites et résultats)
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+# Taille maximale du niveau sur lequel sont calculées les statistiques
+# (contraste, niveaux et seuillage automatiques) de la chaîne
+STATS_PIXELS = 1 << 20
+
+# Nombre de chaînes dont les tables résolues sont conservées
+MAX_CHAINS = 16
+
+
+class TileCache:
+    """Cache LRU de tuiles, borné en octets et partagé entre threads"""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            tile = self._entries.get(key)
+            if tile is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return tile
+
+    def put(self, key, tile):
+        if tile.nbytes > self.max_bytes:
+            return
+        tile.flags.writeable = False
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = tile
+            self.bytes += tile.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'bytes': self.bytes}
+
+
+class ImagePyramid:
+    """Pyramide de tuiles construite à la demande
+
+    Le niveau 0 est l'image décodée ; une tuile du niveau k est la réduction
+    par moyenne 2x2 des quatre tuiles correspondantes du niveau k - 1, ce qui
+    ne calcule que les zones consultées.
+    """
+
+    def __init__(self, pixels, tile_size=TILE_SIZE, cache=None):
+        """Initialise la pyramide
+
+        Args:
+            pixels: Tableau uint8 (H, W) ou (H, W, C) de l'image, conservé en mémoire
+            tile_size: Côté des tuiles
+            cache: TileCache des tuiles réduites (créé si absent)
+        """
+        self.pixels = pixels
+        self.tile_size = tile_size
+        self.cache = cache if cache is not None else TileCache()
+        self.height, self.width = pixels.shape[:2]
+        # Niveaux jusqu'à ce que l'image tienne dans une tuile
+        self.levels = 1 + max(0, math.ceil(math.log2(max(self.width, self.height) / tile_size)))
+
+    @classmethod
+    def open(cls, image_path, tile_size=TILE_SIZE, cache=None):
+        """Décode un fichier image et construit sa pyramide"""
+        with tracer.span('open', path=image_path):
+            image = Image.open(image_path)
+        with image:
+            with tracer.span('decode') as span:
+                pixels = np.asarray(normalize_mode(image))
+                span.set(width=image.width, height=image.height, bytes=pixels.nbytes)
+        return cls(pixels, tile_size, cache)
+
+    def level_size(self, level):
+        """Taille (largeur, hauteur) d'un niveau"""
+        return -(-self.width // 2**level), -(-self.height // 2**level)
+
+    def grid(self, level):
+        """Nombre de tuiles (colonnes, lignes) d'un niveau"""
+        width, height = self.level_size(level)
+        return -(-width // self.tile_size), -(-height // self.tile_size)
+
+    def level_for_scale(self, scale):
+        """Niveau le plus réduit dont la résolution suffit à une échelle d'affichage
+
+        Args:
+            scale: Pixels affichés par pixel de l'image
+        """
+        if scale >= 1:
+            return 0
+        return min(self.levels - 1, int(math.floor(math.log2(1 / scale))))
+
+    def tile(self, level, col, row):
+        """Tuile source (lecture seule) d'un niveau"""
+        size = self.tile_size
+        if level == 0:
+            return self.pixels[row * size:(row + 1) * size, col * size:(col + 1) * size]
+        key = ('source', level, col, row)
+        tile = self.cache.get(key)
+        if tile is None:
+            cols, rows = self.grid(level - 1)
+            children = [[self.tile(level - 1, c, r)
+                         for c in range(2 * col, min(2 * col + 2, cols))]
+                        for r in range(2 * row, min(2 * row + 2, rows))]
+            block = np.concatenate([np.concatenate(line, axis=1) for line in children], axis=0)
+            tile = np.asarray(Image.fromarray(block).reduce(2))
+            self.cache.put(key, tile)
+        return tile
+
+    def level_array(self, level):
+        """Niveau complet, assemblé à partir de ses tuiles"""
+        if level == 0:
+            return self.pixels
+        cols, rows = self.grid(level)
+        return np.concatenate([np.concatenate([self.tile(level, c, r) for c in range(cols)], axis=1)
+                               for r in range(rows)], axis=0)
+
+
+class Viewport:
+    """Rendu filtré d'une zone de l'image à une échelle donnée
+
+    Les tuiles filtrées sont mémorisées par chaîne normalisée (filtres et
+    paramètres) et par position : revenir à une chaîne ou à une zone déjà
+    affichée ne recalcule rien. Les miroirs ne filtrent aucune tuile, ils
+    retournent la zone lue. Les filtres à statistiques utilisent celles d'un
+    niveau réduit de l'image entière (au plus STATS_PIXELS pixels) : toutes
+    les tuiles partagent ainsi les mêmes tables, sans raccord visible.
+    """
+
+    def __init__(self, pyramid, cache=None):
+        """Initialise la fenêtre
+
+        Args:
+            pyramid: ImagePyramid de l'image
+            cache: TileCache des tuiles filtrées (par défaut celui de la pyramide)
+        """
+        self.pyramid = pyramid
+        self.cache = cache if cache is not None else pyramid.cache
+        self._luts = OrderedDict()
+        self._lock = threading.Lock()
+        self.set_chain([])
+
+    def set_chain(self, steps):
+        """Change la chaîne de filtres affichée"""
+        filters, flip_v, flip_h = simplify_chain(steps)
+        # Remplacé d'un bloc : un thread de préchargement garde sa chaîne
+        self._state = (tuple(filters), compile_chain(filters), flip_v, flip_h)
+
+    def _tables(self, key, chain):
+        """Tables des noyaux à statistiques de la chaîne, ou None"""
+        if not chain.needs_stats:
+            return None
+        with self._lock:
+            luts = self._luts.get(key)
+            if luts is not None:
+                self._luts.move_to_end(key)
+                return luts
+        level = 0
+        while level < self.pyramid.levels - 1:
+            width, height = self.pyramid.level_size(level)
+            if width * height <= STATS_PIXELS:
+                break
+            level += 1
+        with tracer.span('viewport.stats', level=level):
+            luts = chain.resolve_luts(self.pyramid.level_array(level))
+        with self._lock:
+            self._luts[key] = luts
+            if len(self._luts) > MAX_CHAINS:
+                self._luts.popitem(last=False)
+        return luts
+
+    def _tile(self, state, level, col, row):
+        """Tuile filtrée (avant miroirs)"""
+        key, chain = state[:2]
+        source = self.pyramid.tile(level, col, row)
+        if not key:
+            return source
+        cache_key = (key, level, col, row)
+        tile = self.cache.get(cache_key)
+        if tile is None:
+            tile = chain.run(source, luts=self._tables(key, chain))
+            self.cache.put(cache_key, tile)
+        return tile
+
+    def _source_box(self, state, box):
+        """Zone de l'image source correspondant à une zone affichée"""
+        x, y, width, height = box
+        if state[3]:
+            x = self.pyramid.width - x - width
+        if state[2]:
+            y = self.pyramid.height - y - height
+        return x, y, width, height
+
+    def visible_tiles(self, box, level):
+        """Tuiles (colonne, ligne) d'un niveau couvrant une zone affichée
+
+        Args:
+            box: Zone (x, y, largeur, hauteur) en pixels de l'image
+            level: Niveau de la pyramide
+        """
+        return self._visible_tiles(self._state, box, level)
+
+    def _visible_tiles(self, state, box, level):
+        x, y, width, height = self._source_box(state, box)
+        factor = 2**level * self.pyramid.tile_size
+        cols, rows = self.pyramid.grid(level)
+        row_range = range(max(0, int(y // factor)), min(rows, math.ceil((y + height) / factor)))
+        col_range = range(max(0, int(x // factor)), min(cols, math.ceil((x + width) / factor)))
+        return [(c, r) for r in row_range for c in col_range]
+
+    def render(self, box, size, raw=False):
+        """Rend une zone de l'image filtrée
+
+        Args:
+            box: Zone (x, y, largeur, hauteur) en pixels de l'image, bornes
+                fractionnaires acceptées
+            size: Taille (largeur, hauteur) de l'image rendue
+            raw: Rend l'image source, sans la chaîne de filtres
+
+        Returns:
+            Image PIL de taille size
+        """
+        state = ((), None, False, False) if raw else self._state
+        level = self.pyramid.level_for_scale(min(size[0] / box[2], size[1] / box[3]))
+        tiles = self._visible_tiles(state, box, level)
+        with tracer.span('viewport.render', level=level, tiles=len(tiles)) as span:
+            tile_size = self.pyramid.tile_size
+            cols = sorted({c for c, _ in tiles})
+            rows = sorted({r for _, r in tiles})
+            region = np.concatenate(
+                [np.concatenate([self._tile(state, level, c, r) for c in cols], axis=1)
+                 for r in rows], axis=0)
+            # Zone demandée dans le repère de la région assemblée
+            factor = 2**level
+            x, y, width, height = self._source_box(state, box)
+            left = x / factor - cols[0] * tile_size
+            top = y / factor - rows[0] * tile_size
+            right, bottom = left + width / factor, top + height / factor
+            if state[2]:
+                region = np.flipud(region)
+                top, bottom = region.shape[0] - bottom, region.shape[0] - top
+            if state[3]:
+                region = np.fliplr(region)
+                left, right = region.shape[1] - right, region.shape[1] - left
+            # Au-delà de 100 % : pixels agrandis sans lissage, pour l'inspection
+            resample = (Image.Resampling.NEAREST if size[0] >= width / factor
+                        else Image.Resampling.BILINEAR)
+            result = Image.fromarray(np.ascontiguousarray(region)).resize(
+                size, resample, box=(left, top, right, bottom))
+            span.set(width=size[0], height=size[1])
+        return result
+
+    def prefetch(self, box, size, margin=1, cancelled=None):
+        """Filtre à l'avance les tuiles voisines de la zone affichée
+
+        Args:
+            box: Zone affichée, comme pour render()
+            size: Taille de l'affichage
+            margin: Largeur de la couronne de tuiles, en tuiles
+            cancelled: Fonction sans argument ; le préchargement s'arrête dès
+                qu'elle retourne vrai (la vue a changé)
+
+        Returns:
+            Nombre de tuiles examinées
+        """
+        state = self._state
+        level = self.pyramid.level_for_scale(min(size[0] / box[2], size[1] / box[3]))
+        visible = self._visible_tiles(state, box, level)
+        if not visible or not state[0]:
+            return 0
+        cols, rows = self.pyramid.grid(level)
+        first_col = max(0, min(c for c, _ in visible) - margin)
+        last_col = min(cols - 1, max(c for c, _ in visible) + margin)
+        first_row = max(0, min(r for _, r in visible) - margin)
+        last_row = min(rows - 1, max(r for _, r in visible) + margin)
+        count = 0
+        for r in range(first_row, last_row + 1):
+            for c in range(first_col, last_col + 1):
+                if cancelled is not None and cancelled():
+                    return count
+                self._tile(state, level, c, r)
+                count += 1
+        return count
@@ -0,0 +1,400 @@
+"""
+Traitement incrémental d'un répertoire surveillé
+Les images déposées dans le répertoire sont filtrées au fil de leur arrivée
+par un pool de processus. Un manifeste persistant (chemin, taille, date de
+modification, empreinte de la chaîne) évite de retraiter un fichier inchangé,
+y compris après un redémarrage : le coût en régime établi dépend du rythme
+d'arrivée des images, pas de la taille du répertoire.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from cli import add_chain_arguments
+from filter_registry import PRECISIONS, normalize_chain, with_last_param
+from batch_processing import IMAGE_EXTENSIONS, BatchSummary, process_file
+from result_cache import CACHE_VERSION
+
+
+# Nom par défaut du manifeste, dans le répertoire de sortie
+MANIFEST_NAME = '.watch_manifest.jsonl'
+
+# Suffixes des fichiers en cours de copie ou de téléchargement
+PARTIAL_SUFFIXES = ('.tmp', '.part', '.partial', '.crdownload', '.download')
+
+
+def chain_digest(steps, **options):
+    """Empreinte d'une chaîne de filtres et des options influençant le résultat"""
+    recipe = {'version': CACHE_VERSION, 'chain': normalize_chain(steps), 'options': options}
+    return hashlib.sha256(json.dumps(recipe, sort_keys=True).encode()).hexdigest()
+
+
+class Manifest:
+    """Journal des fichiers traités, persistant entre deux exécutions
+
+    Chaque résultat est ajouté en fin de fichier (une ligne JSON) : enregistrer
+    un fichier ne coûte qu'une écriture, quelle que soit la taille du
+    répertoire. Au chargement, la dernière ligne d'un chemin l'emporte et une
+    ligne tronquée par un arrêt brutal est ignorée ; le journal est alors
+    compacté par réécriture dans un fichier temporaire renommé atomiquement.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        lines = 0
+        damaged = False
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        damaged = True
+                        continue
+                    lines += 1
+                    if record.get('deleted'):
+                        self.entries.pop(record['path'], None)
+                    else:
+                        self.entries[record['path']] = record
+        except FileNotFoundError:
+            pass
+        # Une ligne tronquée doit disparaître : sinon la prochaine écriture la
+        # prolongerait et serait perdue au chargement suivant
+        if damaged or lines != len(self.entries):
+            self.compact()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, path):
+        return self.entries.get(path)
+
+    def _append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def record(self, path, **fields):
+        """Enregistre l'état d'un fichier traité"""
+        record = dict(fields, path=path)
+        self.entries[path] = record
+        self._append(record)
+
+    def forget(self, path):
+        """Oublie un fichier supprimé du répertoire surveillé"""
+        if self.entries.pop(path, None) is not None:
+            self._append({'path': path, 'deleted': True})
+
+    def compact(self):
+        """Réécrit le journal avec une seule ligne par fichier"""
+        directory = os.path.dirname(self.path) or '.'
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8') as f:
+                for record in self.entries.values():
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        self._file.close()
+
+
+class FolderWatcher:
+    """Surveille un répertoire et traite les images nouvelles ou modifiées
+
+    Un répertoire n'est relu que si sa date de modification a changé (ajout,
+    suppression ou renommage d'un fichier) ; une relecture complète, toutes les
+    `rescan` secondes, détecte les fichiers réécrits sur place. Un fichier
+    n'est traité qu'une fois sa taille et sa date stables depuis `settle`
+    secondes, pour ne pas lire une copie en cours.
+    """
+
+    def __init__(self, source, output_dir, steps, workers=None, max_in_flight=None,
+                 settle=2.0, rescan=60.0, recursive=False, manifest_path=None,
+                 precision='float64', encoder=None, geometry=None, on_result=None):
+        """Initialise la surveillance
+
+        Args:
+            source: Répertoire surveillé
+            output_dir: Répertoire de sortie (chemins relatifs conservés)
+            steps: Chaîne de filtres, liste de tuples (nom, paramètre)
+            workers: Nombre de processus (par défaut le nombre de cœurs)
+            max_in_flight: Fichiers en cours au maximum (par défaut 2 par processus)
+            settle: Durée de stabilité exigée avant de lire un fichier (secondes)
+            rescan: Intervalle entre deux relectures complètes (secondes)
+            recursive: Surveille aussi les sous-répertoires
+            manifest_path: Manifeste (par défaut MANIFEST_NAME dans output_dir)
+            precision: Précision de calcul d'ImageProcessor
+            encoder: Paramètres d'encodage (voir image_processing.encoder_options)
+            geometry: Recadrage et redimensionnement (voir planner.apply_plan)
+            on_result: Fonction appelée avec le résultat de chaque fichier
+        """
+        self.source = os.path.abspath(source)
+        self.output_dir = output_dir
+        self._output_root = os.path.abspath(output_dir)
+        self.steps = steps
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self.settle = settle
+        self.rescan = rescan
+        self.recursive = recursive
+        self.precision = precision
+        self.encoder = encoder
+        self.geometry = geometry
+        self.on_result = on_result
+        self.digest = chain_digest(steps, precision=precision, encoder=encoder or {},
+                                   geometry=geometry or {})
+        self.manifest = Manifest(manifest_path or os.path.join(output_dir, MANIFEST_NAME))
+        self.summary = BatchSummary()
+        # Répertoires lus : chemin -> (date de modification, sous-répertoires)
+        self._directories = {}
+        # Fichiers du manifeste par répertoire relatif, pour repérer les suppressions
+        self._by_directory = {}
+        for relative in self.manifest.entries:
+            self._by_directory.setdefault(os.path.dirname(relative), set()).add(relative)
+        # Fichiers à traiter dès qu'ils sont stables : chemin -> (taille, date, depuis)
+        self._pending = {}
+        self._in_flight = {}
+        self._last_full_scan = None
+
+    def _is_candidate(self, name):
+        lower = name.lower()
+        return (not name.startswith('.') and lower.endswith(IMAGE_EXTENSIONS)
+                and not lower.endswith(PARTIAL_SUFFIXES))
+
+    def _needs_processing(self, entry, stat):
+        return (entry is None or entry['size'] != stat.st_size
+                or entry['mtime_ns'] != stat.st_mtime_ns or entry['chain'] != self.digest)
+
+    def _output_path(self, relative):
+        return os.path.join(self.output_dir, relative)
+
+    def scan(self, full=False):
+        """Relit les répertoires modifiés (tous si full) et met à jour la file d'attente
+
+        Seuls les noms inconnus du manifeste sont examinés (stat) lors d'une
+        lecture partielle ; une lecture complète examine tous les fichiers et
+        reprend ceux dont la sortie a disparu.
+
+        Returns:
+            Nombre de fichiers ajoutés à la file d'attente
+        """
+        added = 0
+        directories = [self.source]
+        while directories:
+            directory = directories.pop()
+            prefix = os.path.relpath(directory, self.source)
+            prefix = '' if prefix == '.' else prefix
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                self._directories.pop(directory, None)
+                for relative in self._by_directory.pop(prefix, ()):
+                    self.manifest.forget(relative)
+                continue
+            known_mtime, children = self._directories.get(directory, (None, []))
+            if not full and known_mtime == mtime:
+                directories += children
+                continue
+            present = set()
+            children = []
+            with os.scandir(directory) as entries:
+                for item in entries:
+                    if item.is_dir(follow_symlinks=False):
+                        # Le répertoire de sortie peut se trouver dans la source
+                        if self.recursive and os.path.abspath(item.path) != self._output_root:
+                            children.append(item.path)
+                        continue
+                    if not self._is_candidate(item.name) or not item.is_file():
+                        continue
+                    relative = os.path.join(prefix, item.name)
+                    present.add(relative)
+                    if relative in self._pending or relative in self._in_flight:
+                        continue
+                    entry = self.manifest.get(relative)
+                    if entry is not None and not full:
+                        # Inchangé jusqu'à preuve du contraire (relecture complète)
+                        continue
+                    stat = item.stat()
+                    if (self._needs_processing(entry, stat)
+                            or (entry['ok'] and not os.path.exists(self._output_path(relative)))):
+                        self._pending[relative] = (stat.st_size, stat.st_mtime_ns,
+                                                   time.monotonic())
+                        added += 1
+            self._directories[directory] = (mtime, children)
+            directories += children
+            # Fichiers supprimés depuis la dernière lecture de ce répertoire
+            known = self._by_directory.setdefault(prefix, set())
+            for relative in known - present:
+                self.manifest.forget(relative)
+            known &= present
+        return added
+
+    def _ready(self):
+        """Fichiers de la file d'attente stables depuis au moins `settle` secondes"""
+        now = time.monotonic()
+        ready = []
+        for relative, (size, mtime, since) in list(self._pending.items()):
+            try:
+                stat = os.stat(os.path.join(self.source, relative))
+            except FileNotFoundError:
+                del self._pending[relative]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                # Encore en cours d'écriture
+                self._pending[relative] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - since >= self.settle:
+                ready.append(relative)
+        return sorted(ready)
+
+    def _submit(self, executor, relative):
+        size, mtime, _ = self._pending.pop(relative)
+        future = executor.submit(process_file, os.path.join(self.source, relative),
+                                 self._output_path(relative), self.steps, self.precision,
+                                 None, False, self.encoder, self.geometry)
+        self._in_flight[relative] = (future, size, mtime)
+
+    def _collect(self, done):
+        for relative, (future, size, mtime) in list(self._in_flight.items()):
+            if future not in done:
+                continue
+            del self._in_flight[relative]
+            outcome = future.result()
+            # Taille et date lues avant le traitement : un fichier modifié
+            # entre-temps sera repris à la prochaine relecture complète
+            self._by_directory.setdefault(os.path.dirname(relative), set()).add(relative)
+            self.manifest.record(relative, size=size, mtime_ns=mtime, chain=self.digest,
+                                 output=outcome['output'], ok=outcome['ok'],
+                                 error=outcome['error'])
+            self.summary.add(outcome)
+            if self.on_result:
+                self.on_result(outcome)
+
+    def run(self, interval=1.0, once=False):
+        """Boucle de surveillance
+
+        Args:
+            interval: Délai entre deux examens du répertoire (secondes)
+            once: Traite les fichiers présents (une fois stables) puis s'arrête
+
+        Returns:
+            Un objet BatchSummary
+        """
+        start = time.perf_counter()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                while True:
+                    now = time.monotonic()
+                    full = (self._last_full_scan is None
+                            or now - self._last_full_scan >= self.rescan)
+                    if full:
+                        self._last_full_scan = now
+                    if not once or full:
+                        self.scan(full)
+                    for relative in self._ready():
+                        if len(self._in_flight) >= self.max_in_flight:
+                            break
+                        self._submit(executor, relative)
+                    if once and not self._pending and not self._in_flight:
+                        break
+                    if self._in_flight:
+                        done, _ = wait([future for future, _, _ in self._in_flight.values()],
+                                       timeout=interval,
+                                       return_when=FIRST_COMPLETED)
+                        self._collect(done)
+                    else:
+                        time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.manifest.close()
+            self.summary.elapsed = time.perf_counter() - start
+        return self.summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Surveille un répertoire et traite les images nouvelles ou modifiées')
+    parser.add_argument('source', help='Répertoire surveillé')
+    parser.add_argument('-o', '--output-dir', required=True, help='Répertoire de sortie')
+    add_chain_arguments(parser)
+    parser.add_argument('--precision', choices=PRECISIONS, default='float64',
+                        help='Précision de calcul (défaut: float64)')
+    parser.add_argument('--workers', type=int,
+                        help='Nombre de processus (défaut: nombre de cœurs)')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='Surveille aussi les sous-répertoires')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='Délai entre deux examens du répertoire, en secondes (défaut: 1)')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='Durée sans modification avant de traiter un fichier, '
+                             'en secondes (défaut: 2)')
+    parser.add_argument('--rescan', type=float, default=60.0,
+                        help='Intervalle entre deux relectures complètes, en secondes '
+                             '(détecte les fichiers réécrits sur place ; défaut: 60)')
+    parser.add_argument('--manifest',
+                        help=f'Fichier manifeste (défaut: {MANIFEST_NAME} dans le '
+                             'répertoire de sortie)')
+    parser.add_argument('--once', action='store_true',
+                        help='Traite les fichiers présents puis s\'arrête')
+
+    args = parser.parse_args()
+    try:
+        steps = with_last_param(args.filter, args.param)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not os.path.isdir(args.source):
+        print(f"Erreur: Le répertoire {args.source} n'existe pas")
+        sys.exit(1)
+
+    def show(outcome):
+        status = "✓" if outcome['ok'] else "✗"
+        print(f"{status} {outcome['input']}", flush=True)
+
+    encoder = {'compress_level': args.compress_level, 'quality': args.quality,
+               'optimize': args.optimize}
+    geometry = None
+    if args.crop or args.resize:
+        geometry = {'crop': args.crop, 'size': args.resize, 'resample': args.resample}
+        if args.fast_resize:
+            geometry['fast_resize'] = True
+    watcher = FolderWatcher(args.source, args.output_dir, steps, args.workers,
+                            settle=args.settle, rescan=args.rescan, recursive=args.recursive,
+                            manifest_path=args.manifest, precision=args.precision,
+                            encoder=encoder, geometry=geometry, on_result=show)
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # Arrêt propre sous un gestionnaire de services (les fichiers en cours,
+    # absents du manifeste, seront repris au redémarrage)
+    signal.signal(signal.SIGTERM, stop)
+    if not args.once:
+        print(f"Surveillance de {args.source} (Ctrl+C pour arrêter), "
+              f"{len(watcher.manifest)} fichiers déjà traités", flush=True)
+    summary = watcher.run(args.interval, args.once)
+    print(summary.report())
+    if args.once and summary.failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()